@@ -1,8 +1,10 @@
 from openmdao.main.api import Component, VariableTree
 from openmdao.lib.datatypes.api import Array, Bool, Float, VarTree
 import numpy as np
+from scipy import sparse
+from sparse_derivatives import applyDiagonalDeriv, applyDiagonalDerivT
+from rotor_components import calcYawCorrectedCoefficients
 from Parameters import FLORISParameters
-import time
 
 
 class floris_adjustCtCp(Component):
@@ -112,46 +114,23 @@ class floris_adjustCtCp(Component):
         CPcorrected = self.parameters.CPcorrected
         axialIndProvided = self.parameters.axialIndProvided
 
-        if not CTcorrected:
-            # print Ct.size, yaw.size
-            self.Ct_out = Ct*np.cos(yaw)*np.cos(yaw)
-            dCt_dCt = np.eye(nTurbines)*np.cos(yaw)*np.cos(yaw)
-            dCt_dyaw = np.eye(nTurbines)*(-2.*Ct*np.sin(yaw)*np.cos(yaw))*np.pi/180.
-            dCt_dCp = np.zeros((nTurbines, nTurbines))
-            dCt = np.hstack((dCt_dCt, dCt_dCp, dCt_dyaw))
+        # each block of the Jacobian is diagonal, keep the diagonals only
+        self.Ct_out, self.Cp_out, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw = \
+            calcYawCorrectedCoefficients(Ct, Cp, yaw, pP, CTcorrected, CPcorrected)
+        dCt_dyaw = dCt_dyaw*np.pi/180.
+        dCp_dyaw = dCp_dyaw*np.pi/180.
 
-        else:
-
-            self.Ct_out = Ct
-            dCt_dCt = np.eye(nTurbines, nTurbines)
-            dCt_dCp = np.zeros((nTurbines, nTurbines))
-            dCt_dyaw = np.zeros((nTurbines, nTurbines))
-            dCt = np.hstack((dCt_dCt, dCt_dCp, dCt_dyaw))
-
-        if not CPcorrected:
-
-            self.Cp_out = Cp*np.cos(yaw)**pP
-
-            dCp_dCp = np.eye(nTurbines, nTurbines)*np.cos(yaw)**pP
-            dCp_dyaw = np.eye(nTurbines, nTurbines)*(-Cp*pP*np.sin(yaw)*np.cos(yaw)**(pP-1.0))*np.pi/180.
-            dCp_dCt = np.zeros((nTurbines, nTurbines))
-            dCp = np.hstack((dCp_dCt, dCp_dCp, dCp_dyaw))
-
-        else:
-
-            self.Cp_out = Cp
-            dCp_dCp = np.eye(nTurbines, nTurbines)
-            dCp_dCt = np.zeros((nTurbines, nTurbines))
-            dCp_dyaw = np.zeros((nTurbines, nTurbines))
-            dCp = np.hstack((dCp_dCt, dCp_dCp, dCp_dyaw))
-
-        self.J = np.vstack((dCt, dCp))
+        self.J = {('Ct_out', 'Ct_in'): dCt_dCt, ('Ct_out', 'yaw'): dCt_dyaw,
+                  ('Cp_out', 'Cp_in'): dCp_dCp, ('Cp_out', 'yaw'): dCp_dyaw}
 
     def list_deriv_vars(self):
         return ('Ct_in', 'Cp_in', 'yaw'), ('Ct_out', 'Cp_out')
 
-    def provideJ(self):
-        return self.J
+    def apply_deriv(self, arg, result):
+        applyDiagonalDeriv(self.J, arg, result)
+
+    def apply_derivT(self, arg, result):
+        applyDiagonalDerivT(self.J, arg, result)
 
 
 class floris_windframe(Component):
@@ -327,30 +306,21 @@ class floris_windframe(Component):
 
         return('turbineX', 'turbineY'), ('turbineXw', 'turbineYw')
 
-    def provideJ(self):
-
-        #print 'entering windframe - provideJ'
+    def apply_deriv(self, arg, result):
+        applyDiagonalDeriv(self.diagonalJ(), arg, result)
 
-        n = np.size(self.turbineX)
+    def apply_derivT(self, arg, result):
+        applyDiagonalDerivT(self.diagonalJ(), arg, result)
 
-        windDirection = self.wind_direction*np.pi/180
+    def diagonalJ(self):
+        """each block of the Jacobian is the rotation coefficient times the identity"""
 
-        dturbineXw_dturbineX = np.zeros([n, n])
-        dturbineXw_dturbineY = np.zeros([n, n])
-        dturbineYw_dturbineX = np.zeros([n, n])
-        dturbineYw_dturbineY = np.zeros([n, n])
+        #print 'entering windframe - diagonalJ'
 
-        for i in range(0, n):
-            dturbineXw_dturbineX[i, i] = np.cos(-windDirection)
-            dturbineXw_dturbineY[i, i] = -np.sin(-windDirection)
-            dturbineYw_dturbineX[i, i] = np.sin(-windDirection)
-            dturbineYw_dturbineY[i, i] = np.cos(-windDirection)
+        windDirection = self.wind_direction*np.pi/180
 
-        JturbineXw = np.concatenate((dturbineXw_dturbineX, dturbineXw_dturbineY), 1)
-        JturbineYw = np.concatenate((dturbineYw_dturbineX, dturbineYw_dturbineY), 1)
-        J = np.concatenate((JturbineXw, JturbineYw), 0)
-
-        return J
+        return {('turbineXw', 'turbineX'): np.cos(-windDirection), ('turbineXw', 'turbineY'): -np.sin(-windDirection),
+                ('turbineYw', 'turbineX'): np.sin(-windDirection), ('turbineYw', 'turbineY'): np.cos(-windDirection)}
 
 
 class AEP(Component):
@@ -431,50 +401,93 @@ class dist_const(Component):
                                     desc='y coordinates of turbines in wind dir. ref. frame'))
 
         # Explicitly size output array
-        self.add('separation', Array(np.zeros((nTurbines-1.)*nTurbines/2.), iotype='out', dtype='float', \
+        self.add('separation', Array(np.zeros(nTurbines*(nTurbines-1)/2), iotype='out', dtype='float', \
                                         desc='spacing of all turbines in the wind farm'))
 
+        # the sparsity pattern of the Jacobian only depends on the number of turbines, it is built once and only its
+        # values are refreshed
+        self.J = None
+
     def execute(self):
 
         #print 'in dist const'
 
         turbineX = self.turbineX
         turbineY = self.turbineY
-        nTurbines = turbineX.size
-        separation = np.zeros((nTurbines-1.)*nTurbines/2.)
 
-        k = 0
-        for i in range(0, nTurbines):
-            for j in range(i+1, nTurbines):
-                separation[k] = np.sqrt((turbineX[j]-turbineX[i])**2+(turbineY[j]-turbineY[i])**2)
-                k += 1
-        self.separation = separation
+        # the Jacobian has four nonzeros per pair, keep it sparse for the matrix-free derivative products
+        self.J = dist_const_J(turbineX, turbineY, self.J)
+
+        # all pairs i < j, in the order of a double loop over i and j, as the rows of the Jacobian
+        i, j = dist_const_pairs(self.J)
+        self.separation = np.sqrt((turbineX[j]-turbineX[i])**2+(turbineY[j]-turbineY[i])**2)
 
     def list_deriv_vars(self):
         return ('turbineX', 'turbineY'), ('separation',)
 
-    def provideJ(self):
+    def apply_deriv(self, arg, result):
+
+        if 'separation' not in result:
+            return
+
+        nTurbines = self.turbineX.size
+        dturbine = np.zeros(2*nTurbines)
+        if 'turbineX' in arg:
+            dturbine[:nTurbines] = np.ravel(arg['turbineX'])
+        if 'turbineY' in arg:
+            dturbine[nTurbines:] = np.ravel(arg['turbineY'])
+
+        result['separation'] += self.J.dot(dturbine)
+
+    def apply_derivT(self, arg, result):
+
+        if 'separation' not in arg:
+            return
+
+        nTurbines = self.turbineX.size
+        dturbine = self.J.T.dot(np.ravel(arg['separation']))
+
+        if 'turbineX' in result:
+            result['turbineX'] += dturbine[:nTurbines]
+        if 'turbineY' in result:
+            result['turbineY'] += dturbine[nTurbines:]
+
+
+def dist_const_J(turbineX, turbineY, J=None):
+    """sparse Jacobian of the separation of all turbine pairs i < j with respect to (turbineX, turbineY), with four
+    nonzeros per pair. The values of J are refreshed in place if it has the sparsity pattern of the number of
+    turbines, see dist_const_pattern"""
+
+    nTurbines = turbineX.size
+    if J is None or J.shape[1] != 2*nTurbines:
+        J = dist_const_pattern(nTurbines)
+
+    i, j = dist_const_pairs(J)
+    dx = turbineX[j]-turbineX[i]
+    dy = turbineY[j]-turbineY[i]
+    separation = np.sqrt(dx**2+dy**2)
+
+    J.data[:] = (np.column_stack((-dx, dx, -dy, dy))/separation[:, np.newaxis]).flatten()
+
+    return J
+
+
+def dist_const_pattern(nTurbines):
+    """CSR matrix with the sparsity pattern of dist_const_J, one row per pair i < j with its nonzeros in the columns
+    i, j, nTurbines+i and nTurbines+j"""
+
+    i, j = np.triu_indices(nTurbines, 1)
+    indices = np.column_stack((i, j, i+nTurbines, j+nTurbines)).flatten()
+    indptr = np.arange(0, indices.size+1, 4)
+
+    return sparse.csr_matrix((np.zeros(indices.size), indices, indptr), shape=(i.size, 2*nTurbines))
+
+
+def dist_const_pairs(J):
+    """turbines i < j of each row of the Jacobian of dist_const_pattern"""
+
+    return J.indices[0::4], J.indices[1::4]
 
-        #print 'entering dist const - provideJ'
-	tictot = time.time()
-        turbineX = self.turbineX
-        turbineY = self.turbineY
-        nTurbines = turbineX.size
-        J = np.zeros(((nTurbines-1.)*nTurbines/2., 2*nTurbines))
-	
-        k = 0
-        for i in range(0, nTurbines):
-            for j in range(i+1, nTurbines):
-                J[k, j] = (turbineX[j]-turbineX[i])*((turbineX[j]-turbineX[i])**2+(turbineY[j]-turbineY[i])**2)**(-0.5)
-                J[k, i] = (turbineX[i]-turbineX[j])*((turbineX[j]-turbineX[i])**2+(turbineY[j]-turbineY[i])**2)**(-0.5)
-                J[k, j+nTurbines] = (turbineY[j]-turbineY[i])*((turbineX[j]-turbineX[i])**2 +
-                                                               (turbineY[j]-turbineY[i])**2)**(-0.5)
-                J[k, i+nTurbines] = (turbineY[i]-turbineY[j])*((turbineX[j]-turbineX[i])**2 +
-                                                               (turbineY[j]-turbineY[i])**2)**(-0.5)
-                k += 1
-	toctot = time.time()
-	#print 'done %s' % (toctot-tictot)
-        return J
 
 class hull_const(Component):
 
@@ -496,47 +509,75 @@ class hull_const(Component):
         # (vector with positive elements if turbines outside of hull)
         self.add('inout', Array(np.zeros(nVertices*nTurbines), iotype='out'))
 
+        # the Jacobian only depends on AX, AY and the number of turbines, it is built once and rebuilt when they change
+        self.J = None
+        self.J_AX = None
+        self.J_AY = None
 
     def execute(self):
 
         #print 'in hull const'
-        tictot = time.time()
 
         AX = self.AX
         AY = self.AY
         b = self.b
         turbineX = self.turbineX
         turbineY = self.turbineY
-        nTurbines = turbineX.size
-
-        J = hull_const_J(AX, AY, nTurbines)
 
-        self.inout = (np.dot(J, np.concatenate((turbineX,turbineY))) - np.tile(b, (1,nTurbines))).flatten()
-
-        toctot = time.time()
-        #print 'done %s' % (toctot-tictot)
+        # distance of each turbine (rows) beyond each half-plane (columns) bounding the hull
+        self.inout = (np.outer(turbineX, AX) + np.outer(turbineY, AY) - b).flatten()
 
     def list_deriv_vars(self):
         return ('turbineX', 'turbineY',), ('inout',)
 
-    def provideJ(self):
+    def cached_J(self):
+        """cached block-sparse Jacobian of inout with respect to (turbineX, turbineY)"""
 
-        #print 'in hull const - provide J'
-        tictot = time.time()
+        AX = np.asarray(self.AX, dtype=float)
+        AY = np.asarray(self.AY, dtype=float)
+        nTurbines = self.turbineX.size
+
+        if self.J is None or self.J.shape[1] != 2*nTurbines or not np.array_equal(AX, self.J_AX) or \
+                not np.array_equal(AY, self.J_AY):
+            self.J = hull_const_J(AX, AY, nTurbines)
+            self.J_AX = AX.copy()
+            self.J_AY = AY.copy()
+
+        return self.J
+
+    def apply_deriv(self, arg, result):
+
+        if 'inout' not in result:
+            return
 
-        AX = self.AX
-        AY = self.AY
-        b = self.b
         nTurbines = self.turbineX.size
+        dturbine = np.zeros(2*nTurbines)
+        if 'turbineX' in arg:
+            dturbine[:nTurbines] = np.ravel(arg['turbineX'])
+        if 'turbineY' in arg:
+            dturbine[nTurbines:] = np.ravel(arg['turbineY'])
 
-        J = hull_const_J(AX, AY, nTurbines)
+        result['inout'] += self.cached_J().dot(dturbine)
 
-        toctot = time.time()
-        #print 'done %s' % (toctot-tictot)
+    def apply_derivT(self, arg, result):
+
+        if 'inout' not in arg:
+            return
+
+        nTurbines = self.turbineX.size
+        dturbine = self.cached_J().T.dot(np.ravel(arg['inout']))
+
+        if 'turbineX' in result:
+            result['turbineX'] += dturbine[:nTurbines]
+        if 'turbineY' in result:
+            result['turbineY'] += dturbine[nTurbines:]
 
-        return J
 
 def hull_const_J(AX, AY, nTurbines):
-    J = np.concatenate((np.kron(np.eye(nTurbines),AX).transpose(),np.kron(np.eye(nTurbines),AY).transpose()),1)
-    return J
+    """Jacobian of the hull constraints with respect to (turbineX, turbineY), one block of nVertices rows per turbine
+    with nonzeros only in the columns of that turbine"""
 
+    blockX = sparse.kron(sparse.identity(nTurbines), np.reshape(AX, (-1, 1)))
+    blockY = sparse.kron(sparse.identity(nTurbines), np.reshape(AY, (-1, 1)))
+    J = sparse.hstack((blockX, blockY)).tocsr()
+    return J
@@ -14,6 +14,12 @@ from Circle_components import floris_windframe
 from Circle_components import floris_wcent_wdiam
 from Circle_components import floris_overlap
 from Circle_components import floris_power
+from Circle_components import floris_samples
+from Circle_components import floris_grid
+from Circle_components import floris_sweep
+from Circle_components import floris_directions
+from Circle_components import floris_windrose
+from Circle_components import threadSampleMemory
 
 # ###########    imports for rotor modeling    ########################################################################
 from rotor_components import *
@@ -31,21 +37,56 @@ class floris_assembly_opt_AEP(Assembly):
     # output
     AEP = Float(iotype='out', units='kW', desc='total windfarm AEP')
 
-    def __init__(self, nTurbines, nDirections, optimize_position=False, nSamples=0, optimize_yaw=False, datasize=0, nSpeeds=False, maxiter=100):
+    def __init__(self, nTurbines, nDirections, optimize_position=False, nSamples=0, optimize_yaw=False, datasize=0, nSpeeds=False, maxiter=100, sampleMemory=None, cullWakes=False, solver='fixed_point', nSpeedBins=0, sampleDtype='float', nProcesses=1, nThreads=1, cacheSize=0, sampleSets=(), sampleGrids=()):
 
         super(floris_assembly_opt_AEP, self).__init__()
 
         if nSpeeds == False:
             nSpeeds = nDirections
 
+        # sample sets as (suffix of their inputs and outputs, number of samples), the nSamples positions ws_positionX
+        # etc. and the named sets of sampleSets, given as (name, number of samples), with ws_positionX_<name> etc.
+        namedSets = [('_%s' % name, size) for name, size in sampleSets]
+        if nSamples > 0:
+            sampleSets = [('', nSamples)] + namedSets
+        else:
+            sampleSets = namedSets
+
+        if solver not in ('fixed_point', 'sweep', 'batch'):
+            raise ValueError("unknown solver '%s', use 'fixed_point', 'sweep' or 'batch'" % solver)
+
+        if cacheSize > 0 and solver == 'fixed_point' and nSpeedBins == 0 and nProcesses <= 1:
+            raise ValueError("the fixed_point solver keeps no cache of turbine states, use solver='sweep' or 'batch' "
+                             "with cacheSize > 0")
+
+        if nSpeedBins > 0 and len(sampleSets)+len(sampleGrids) > 0:
+            raise ValueError('flow field sampling is not available for a windrose with speed bins (nSpeedBins > 0)')
+
         self.nTurbines = nTurbines
         self.nSamples = nSamples
+        self.sampleSets = sampleSets  # all sample sets share the turbines solved for each direction
+        self.sampleGrids = sampleGrids  # structured grids as (name, shape), sampled like the sample sets
         self.nDirections = nDirections
         self.optimize_yaw = optimize_yaw
         self.optimize_position = optimize_position
         self.datasize = datasize
         self.nSpeeds = nSpeeds
         self.maxiter = maxiter
+        self.sampleMemory = sampleMemory  # bytes for per-sample wake arrays, 0 evaluates all samples at once, None
+                                          # is 0 or threadSampleMemory with nThreads > 1
+        self.cullWakes = cullWakes  # evaluate only turbine pairs where the rotor overlaps with an upstream wake, and
+                                    # only the flow samples near each wake
+        self.solver = solver  # 'fixed_point' iterates rotor and wake model, 'sweep' solves turbines upstream first,
+                              # 'batch' sweeps all directions at once in a single component
+        self.nSpeedBins = nSpeedBins  # > 0 evaluates all combinations of directions and speed bins in one batch
+        self.sampleDtype = sampleDtype  # 'float32' samples the flow field in single precision, turbines stay float64
+        self.nProcesses = nProcesses  # > 1 solves the directions in batch mode on a pool of worker processes
+        self.nThreads = nThreads  # > 1 evaluates the flow field samples in tiles on a pool of threads
+        if sampleMemory is None:
+            # tiles are needed to share the sampling between threads
+            self.sampleMemory = threadSampleMemory if nThreads > 1 else 0
+        self.cacheSize = cacheSize  # converged turbine states kept by the sweep and batch solvers for repeated runs,
+                                    # not available with the fixed_point solver
 
         # wt_layout input variables
         self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m',
@@ -79,6 +120,14 @@ class floris_assembly_opt_AEP(Assembly):
                                               desc='windrose directions in degrees ccw from east'))
         self.add('windrose_frequencies', Array(np.ones(nDirections), dtype='float', iotype='in',
 					desc='windrose frequencies corresponding to windrose_directions'))
+        if nSpeedBins > 0:
+            self.add('windrose_speed_bins', Array(np.zeros(nSpeedBins), dtype='float', iotype='in', units='m/s',
+                                                  desc='wind speed of each speed bin of the windrose'))
+            self.add('windrose_frequency_table', Array(np.zeros([nDirections, nSpeedBins]), dtype='float', iotype='in',
+                                                       desc='frequency of each combination of windrose direction and \
+                                                       speed bin'))
+            self.add('power_directions_speeds', Array(np.zeros([nDirections, nSpeedBins]), iotype='out', units='kW',
+                                                      desc='total windfarm power for each direction and speed bin'))
         if nSpeeds == 1:
             self.add('windrose_speeds', Float(iotype='in', units='m/s', 
                                           desc='wind speeds for each direction given in windrose_directions'))
@@ -111,16 +160,26 @@ class floris_assembly_opt_AEP(Assembly):
         self.add('power_directions', Array(np.zeros(nDirections), iotype='out', units='kW', desc='total windfarm power \
                                            in each direction ccw from east using direction to'))
 
-        if nSamples>0:
+        for suffix, size in sampleSets:
             # flow samples
-            self.add('ws_positionX', Array(np.zeros(nSamples), iotype='in', units='m',
+            self.add('ws_positionX%s' % suffix, Array(np.zeros(size), iotype='in', units='m',
                                         desc='X positions of sampling points'))
-            self.add('ws_positionY', Array(np.zeros(nSamples), iotype='in', units='m',
+            self.add('ws_positionY%s' % suffix, Array(np.zeros(size), iotype='in', units='m',
                                         desc='Y position of sampling points'))
-            self.add('ws_positionZ', Array(np.zeros(nSamples), iotype='in', units='m',
+            self.add('ws_positionZ%s' % suffix, Array(np.zeros(size), iotype='in', units='m',
                                         desc='Z position of sampling points'))
             for direction in range(0, nDirections):
-                self.add('ws_array_%d' % direction, Array(np.zeros(nSamples), iotype='out', units='m/s', desc='predicted wind speed at sampling points'))
+                self.add('ws_array%s_%d' % (suffix, direction), Array(np.zeros(size, dtype=sampleDtype), iotype='out', units='m/s', dtype=sampleDtype, desc='predicted wind speed at sampling points'))
+
+        for name, shape in sampleGrids:
+            # structured flow sample grids, with axes downwind, crosswind and (for 3D grids) vertical
+            self.add('gridOrigin_%s' % name, Array(np.zeros(2), iotype='in', units='m',
+                                                 desc='x and y position of the first grid point'))
+            self.add('gridSpacing_%s' % name, Array(np.zeros(3), iotype='in', units='m',
+                                                  desc='distance between grid points downwind, crosswind and vertically'))
+            self.add('gridHeight_%s' % name, Float(iotype='in', units='m', desc='height of the lowest grid layer'))
+            for direction in range(0, nDirections):
+                self.add('ws_grid_%s_%d' % (name, direction), Array(np.zeros(shape, dtype=sampleDtype), iotype='out', units='m/s', dtype=sampleDtype, desc='predicted wind speed at grid points'))
 
     def configure(self):
 
@@ -130,9 +189,19 @@ class floris_assembly_opt_AEP(Assembly):
         optimize_position = self.optimize_position
         optimize_yaw = self.optimize_yaw
         datasize = self.datasize
-        nSamples = self.nSamples
+        sampleSets = self.sampleSets
+        sampleGrids = self.sampleGrids
         nSpeeds = self.nSpeeds
         maxiter = self.maxiter
+        sampleMemory = self.sampleMemory
+        sampleDtype = self.sampleDtype
+        nThreads = self.nThreads
+        cacheSize = self.cacheSize
+        cullWakes = self.cullWakes
+        sweep = self.solver == 'sweep'
+        nSpeedBins = self.nSpeedBins
+        nProcesses = self.nProcesses
+        batch = self.solver == 'batch' or nSpeedBins > 0 or nProcesses > 1
 
         # add driver so the workflow is not overwritten later
         if optimize_position or optimize_yaw:
@@ -141,7 +210,8 @@ class floris_assembly_opt_AEP(Assembly):
         # add AEP component first so it can be connected to
         F6 = self.add('floris_AEP', AEP(nDirections=nDirections))
         F6.missing_deriv_policy = 'assume_zero'
-        self.connect('windrose_frequencies', 'floris_AEP.windrose_frequencies')
+        if nSpeedBins == 0:
+            self.connect('windrose_frequencies', 'floris_AEP.windrose_frequencies')
         self.connect('floris_AEP.AEP', 'AEP')
         self.connect('floris_AEP.power_directions_out', 'power_directions')
 
@@ -150,58 +220,132 @@ class floris_assembly_opt_AEP(Assembly):
         self.connect('turbineX', 'floris_dist_const.turbineX')
         self.connect('turbineY', 'floris_dist_const.turbineY')
 
-        if nSamples>0:
-            samplingNonSampling = ['','Sampling_']
+        # sampling chains of each sample set, Sampling_ for the nSamples positions and Sampling_<name>_ for named sets
+        samplingChains = ['Sampling%s_' % suffix for suffix, size in sampleSets]
+        samplingNonSampling = [''] + samplingChains
+
+        # chains that evaluate the wake model with separate wcent_wdiam, overlap and power components, and chains with
+        # a floris_windframe component per direction. The sampling chain takes the solved turbines from the model.
+        if sweep or batch:
+            modelChains = []
+        else:
+            modelChains = ['']
+        if batch:
+            frameChains = samplingNonSampling[1:]
         else:
-            samplingNonSampling = ['']
+            frameChains = samplingNonSampling
+
+        if batch:
+            # all directions (and speed bins) are solved together, turbine by turbine from upstream
+            if nSpeedBins > 0:
+                batchComp = 'floris_windrose'
+                self.add(batchComp, floris_windrose(nTurbines=nTurbines, nDirections=nDirections, nSpeeds=nSpeedBins,
+                                                    datasize=datasize, nProcesses=nProcesses, cacheSize=cacheSize))
+                self.connect('windrose_speed_bins', 'floris_windrose.wind_speeds')
+                self.connect('windrose_frequency_table', 'floris_windrose.windrose_frequencies')
+                self.connect('floris_windrose.frequencies_directions', 'floris_AEP.windrose_frequencies')
+                self.connect('floris_windrose.power_directions', 'floris_AEP.power_directions')
+                self.connect('floris_windrose.power', 'power_directions_speeds')
+            else:
+                batchComp = 'floris_directions'
+                self.add(batchComp, floris_directions(nTurbines=nTurbines, nDirections=nDirections, datasize=datasize,
+                                                      nProcesses=nProcesses, cacheSize=cacheSize))
+                self.connect('floris_directions.power', 'floris_AEP.power_directions')
+                self.connect('floris_directions.wt_power', 'wt_power_directions')
+                self.connect('floris_directions.velocitiesTurbines', 'velocitiesTurbines_directions')
+            self.connect('curve_CP', '%s.windSpeedToCPCT.CP' % batchComp)
+            self.connect('curve_CT', '%s.windSpeedToCPCT.CT' % batchComp)
+            self.connect('curve_wind_speed', '%s.windSpeedToCPCT.wind_speed' % batchComp)
+            self.connect('parameters.pP', '%s.pP' % batchComp)
+            self.connect('parameters', '%s.parameters' % batchComp)
+            self.connect('verbose', '%s.verbose' % batchComp)
+            self.connect('air_density', '%s.air_density' % batchComp)
+            self.connect('turbineX', '%s.turbineX' % batchComp)
+            self.connect('turbineY', '%s.turbineY' % batchComp)
+            self.connect('windrose_directions', '%s.wind_directions' % batchComp)
+            self.connect('rotorDiameter', '%s.rotorDiameter' % batchComp)
+            self.connect('axialInduction', '%s.axialInduction' % batchComp)
+            self.connect('generator_efficiency', '%s.generator_efficiency' % batchComp)
+            self.driver.workflow.add(batchComp)
 
         for i in range(0, nDirections):
 
-            # add fixed point iterator
-            self.add('FPIdriver_%d' % i, FixedPointIterator())
-            self.add('rotor_CPCT_%d' % i, CPCT_Interpolate(nTurbines=self.nTurbines, datasize=self.datasize))
-            CP = 'rotor_CPCT_%d.CP' % i
-            CT = 'rotor_CPCT_%d.CT' % i
-            CPCT = 'rotor_CPCT_%d' % i
+            if batch:
+                CP = '%s.CP[%d]' % (batchComp, i)
+                CT = '%s.CT[%d]' % (batchComp, i)
+                CPCT = batchComp
+            elif sweep:
+                # rotor and wake model are solved together, turbine by turbine from upstream
+                self.add('floris_sweep_%d' % i, floris_sweep(nTurbines=nTurbines, datasize=datasize, cacheSize=cacheSize))
+                CP = 'floris_sweep_%d.CP' % i
+                CT = 'floris_sweep_%d.CT' % i
+                CPCT = 'floris_sweep_%d' % i
+            else:
+                # add fixed point iterator
+                self.add('FPIdriver_%d' % i, FixedPointIterator())
+                self.add('rotor_CPCT_%d' % i, CPCT_Interpolate(nTurbines=self.nTurbines, datasize=self.datasize))
+                CP = 'rotor_CPCT_%d.CP' % i
+                CT = 'rotor_CPCT_%d.CT' % i
+                CPCT = 'rotor_CPCT_%d' % i
 
             # add components of floris to assembly
-            F2 = self.add('floris_windframe_%d' % i, floris_windframe(nTurbines=nTurbines))
-            F2.missing_deriv_policy = 'assume_zero'
-            self.add('floris_wcent_wdiam_%d' % i, floris_wcent_wdiam(nTurbines=nTurbines))
-            F4 = self.add('floris_overlap_%d' % i, floris_overlap(nTurbines=nTurbines))
-            F4.missing_deriv_policy = 'assume_zero'
-            self.add('floris_power_%d' % i, floris_power(nTurbines=nTurbines))
+            if not batch:
+                self.add('floris_windframe_%d' % i, floris_windframe(nTurbines=nTurbines))
+            if not (sweep or batch):
+                self.add('floris_wcent_wdiam_%d' % i, floris_wcent_wdiam(nTurbines=nTurbines, cullWakes=cullWakes))
+                self.add('floris_overlap_%d' % i, floris_overlap(nTurbines=nTurbines, cullWakes=cullWakes))
+                self.add('floris_power_%d' % i, floris_power(nTurbines=nTurbines, cullWakes=cullWakes))
 
             # add visualization components of floris to assembly
-            if nSamples>0:
-                self.add('Sampling_floris_windframe_%d' % i, floris_windframe(nTurbines=nTurbines, nSamples=nSamples))
-                self.add('Sampling_floris_wcent_wdiam_%d' % i, floris_wcent_wdiam(nTurbines=nTurbines, nSamples=nSamples))
-                self.add('Sampling_floris_overlap_%d' % i, floris_overlap(nTurbines=nTurbines))
-                self.add('Sampling_floris_power_%d' % i, floris_power(nTurbines=nTurbines, nSamples=nSamples))
+            for ssn, (suffix, size) in zip(samplingChains, sampleSets):
+                self.add('%sfloris_windframe_%d' % (ssn,i), floris_windframe(nTurbines=nTurbines, nSamples=size,
+                                                                             sampleDtype=sampleDtype))
+                self.add('%sfloris_samples_%d' % (ssn,i), floris_samples(nTurbines=nTurbines, nSamples=size,
+                                                                         sampleMemory=sampleMemory,
+                                                                         sampleDtype=sampleDtype, nThreads=nThreads,
+                                                                         cullWakes=cullWakes))
+            for name, shape in sampleGrids:
+                self.add('Grid_%s_floris_grid_%d' % (name, i), floris_grid(nTurbines=nTurbines, gridShape=shape,
+                                                                           sampleDtype=sampleDtype))
 
             # connect inputs to components
-            self.connect('curve_CP', 'rotor_CPCT_%d.windSpeedToCPCT.CP' % i)
-            self.connect('curve_CT', 'rotor_CPCT_%d.windSpeedToCPCT.CT' % i)
-            self.connect('curve_wind_speed', 'rotor_CPCT_%d.windSpeedToCPCT.wind_speed' % i)
-            self.connect('parameters.pP', 'rotor_CPCT_%d.pP' % i)
-
-            for ssn in samplingNonSampling:
-                self.connect('parameters', ['%sfloris_wcent_wdiam_%d.parameters' % (ssn,i), '%sfloris_power_%d.parameters' % (ssn,i)])
-                self.connect('verbose', ['%sfloris_windframe_%d.verbose' % (ssn,i), '%sfloris_wcent_wdiam_%d.verbose' % (ssn,i),
-                                     '%sfloris_power_%d.verbose' % (ssn,i)])
+            if not batch:
+                self.connect('curve_CP', '%s.windSpeedToCPCT.CP' % CPCT)
+                self.connect('curve_CT', '%s.windSpeedToCPCT.CT' % CPCT)
+                self.connect('curve_wind_speed', '%s.windSpeedToCPCT.wind_speed' % CPCT)
+                self.connect('parameters.pP', '%s.pP' % CPCT)
+
+            if sweep:
+                self.connect('parameters', 'floris_sweep_%d.parameters' % i)
+                self.connect('verbose', 'floris_sweep_%d.verbose' % i)
+                self.connect('rotorDiameter', 'floris_sweep_%d.rotorDiameter' % i)
+                self.connect('axialInduction', 'floris_sweep_%d.axialInduction' % i)
+                self.connect('generator_efficiency', 'floris_sweep_%d.generator_efficiency' % i)
+                self.connect('air_density', 'floris_sweep_%d.air_density' % i)
+                self.connect('floris_windframe_%d.turbineXw' % i, 'floris_sweep_%d.turbineXw' % i)
+                self.connect('floris_windframe_%d.turbineYw' % i, 'floris_sweep_%d.turbineYw' % i)
+
+            for ssn in frameChains:
+                self.connect('verbose', '%sfloris_windframe_%d.verbose' % (ssn,i))
                 self.connect('turbineX', '%sfloris_windframe_%d.turbineX' % (ssn,i))
                 self.connect('turbineY', '%sfloris_windframe_%d.turbineY' % (ssn,i))
+
+            for ssn in modelChains:
+                self.connect('parameters', ['%sfloris_wcent_wdiam_%d.parameters' % (ssn,i), '%sfloris_power_%d.parameters' % (ssn,i)])
+                self.connect('verbose', ['%sfloris_wcent_wdiam_%d.verbose' % (ssn,i), '%sfloris_power_%d.verbose' % (ssn,i)])
                 self.connect('rotorDiameter', ['%sfloris_wcent_wdiam_%d.rotorDiameter' % (ssn,i),
                                            '%sfloris_overlap_%d.rotorDiameter' % (ssn,i), '%sfloris_power_%d.rotorDiameter' % (ssn,i)])
                 self.connect('axialInduction', '%sfloris_power_%d.axialInduction' % (ssn,i))
                 self.connect('generator_efficiency', '%sfloris_power_%d.generator_efficiency' % (ssn,i))
 
-            if nSamples>0:
+            for ssn, (suffix, size) in zip(samplingChains, sampleSets):
                 # connections needed for visualization
-                self.connect('ws_positionX', 'Sampling_floris_windframe_%d.ws_positionX' % i)
-                self.connect('ws_positionY', 'Sampling_floris_windframe_%d.ws_positionY' % i)
-                self.connect('ws_positionZ', 'Sampling_floris_windframe_%d.ws_positionZ' % i)
-                self.connect('hubHeight', 'Sampling_floris_wcent_wdiam_%d.hubHeight' % i)
+                self.connect('ws_positionX%s' % suffix, '%sfloris_windframe_%d.ws_positionX' % (ssn,i))
+                self.connect('ws_positionY%s' % suffix, '%sfloris_windframe_%d.ws_positionY' % (ssn,i))
+                self.connect('ws_positionZ%s' % suffix, '%sfloris_windframe_%d.ws_positionZ' % (ssn,i))
+                self.connect('hubHeight', '%sfloris_samples_%d.hubHeight' % (ssn,i))
+                self.connect('parameters', '%sfloris_samples_%d.parameters' % (ssn,i))
+                self.connect('rotorDiameter', '%sfloris_samples_%d.rotorDiameter' % (ssn,i))
 
 
             if optimize_yaw:
@@ -209,24 +353,29 @@ class floris_assembly_opt_AEP(Assembly):
             else:
                 yawToConnect = 'yaw'
 
-            self.connect(yawToConnect, '%s.yaw' % CPCT)
-            for ssn in samplingNonSampling:
+            if batch:
+                self.connect(yawToConnect, '%s.yaw[%d]' % (batchComp, i))
+            else:
+                self.connect(yawToConnect, '%s.yaw' % CPCT)
+            for ssn in modelChains:
                 self.connect(yawToConnect, ['%sfloris_wcent_wdiam_%d.yaw' % (ssn,i), '%sfloris_power_%d.yaw' % (ssn,i)])
-
-            for ssn in samplingNonSampling:
                 self.connect('air_density', '%sfloris_power_%d.air_density' % (ssn,i))
+
+            for ssn in frameChains:
                 self.connect('windrose_directions[%d]' % i, '%sfloris_windframe_%d.wind_direction' % (ssn,i))
 
             # for satisfying the verbosity in windframe
-            for ssn in samplingNonSampling:
-                self.connect(CT, '%sfloris_windframe_%d.Ct' % (ssn,i))
-                self.connect(CP, '%sfloris_windframe_%d.Cp' % (ssn,i))
+            for ssn in frameChains:
+                if not (sweep and ssn == ''):
+                    # floris_sweep depends on floris_windframe, so its Ct and Cp cannot be fed back
+                    self.connect(CT, '%sfloris_windframe_%d.Ct' % (ssn,i))
+                    self.connect(CP, '%sfloris_windframe_%d.Cp' % (ssn,i))
                 self.connect(yawToConnect, '%sfloris_windframe_%d.yaw' % (ssn,i))
                 self.connect('axialInduction', '%sfloris_windframe_%d.axialInduction' % (ssn,i))
 
             # ############### Connections between components ##################
             # connections from CtCp calculation to other components
-            for ssn in samplingNonSampling:
+            for ssn in modelChains:
                 self.connect(CT, ['%sfloris_wcent_wdiam_%d.Ct' % (ssn,i), '%sfloris_power_%d.Ct' % (ssn,i)])
                 self.connect(CP, '%sfloris_power_%d.Cp' % (ssn,i))
 
@@ -248,39 +397,101 @@ class floris_assembly_opt_AEP(Assembly):
                 # connections from floris_overlap to floris_power
                 self.connect('%sfloris_overlap_%d.wakeOverlapTRel' % (ssn,i), '%sfloris_power_%d.wakeOverlapTRel' % (ssn,i))
 
-            # additional connections needed for visualization
-            if nSamples>0:
-                self.connect('Sampling_floris_windframe_%d.wsw_position' % i, ['Sampling_floris_wcent_wdiam_%d.wsw_position' % i, 'Sampling_floris_power_%d.wsw_position' % i])
-                self.connect('Sampling_floris_wcent_wdiam_%d.wakeCentersY' % i, 'Sampling_floris_power_%d.wakeCentersY' % i)
-                self.connect('Sampling_floris_wcent_wdiam_%d.wakeCentersZ' % i, 'Sampling_floris_power_%d.wakeCentersZ' % i)
-                self.connect('Sampling_floris_wcent_wdiam_%d.wakeDiameters' % i, 'Sampling_floris_power_%d.wakeDiameters' % i)
-                self.connect('Sampling_floris_power_%d.ws_array' % i, 'ws_array_%d' % i)
+                # interacting turbine pairs from floris_wcent_wdiam to floris_overlap and floris_power
+                if cullWakes:
+                    self.connect('%sfloris_wcent_wdiam_%d.wakePairs' % (ssn,i), ['%sfloris_overlap_%d.wakePairs' % (ssn,i),
+                                                                              '%sfloris_power_%d.wakePairs' % (ssn,i)])
+
+            # additional connections needed for visualization, the solved turbines of this direction are sampled
+            if batch:
+                turbineState = '%s.%%s[%d]' % (batchComp, i)
+            elif sweep:
+                turbineState = 'floris_sweep_%d.%%s' % i
+            else:
+                turbineState = 'floris_power_%d.%%s' % i
+            for ssn, (suffix, size) in zip(samplingChains, sampleSets):
+                self.connect(turbineState % 'axialInd', '%sfloris_samples_%d.axialInd' % (ssn,i))
+                self.connect(turbineState % 'keArray', '%sfloris_samples_%d.keArray' % (ssn,i))
+                self.connect(CT, '%sfloris_samples_%d.Ct' % (ssn,i))
+                self.connect(yawToConnect, '%sfloris_samples_%d.yaw' % (ssn,i))
+                self.connect('%sfloris_windframe_%d.turbineXw' % (ssn,i), '%sfloris_samples_%d.turbineXw' % (ssn,i))
+                self.connect('%sfloris_windframe_%d.turbineYw' % (ssn,i), '%sfloris_samples_%d.turbineYw' % (ssn,i))
+                self.connect('%sfloris_windframe_%d.wsw_position' % (ssn,i), '%sfloris_samples_%d.wsw_position' % (ssn,i))
+                self.connect('%sfloris_samples_%d.ws_array' % (ssn,i), 'ws_array%s_%d' % (suffix, i))
+            if batch:
+                turbineFrame = '%s.%%s[%d]' % (batchComp, i)
+            else:
+                turbineFrame = 'floris_windframe_%d.%%s' % i
+            for name, shape in sampleGrids:
+                gridComp = 'Grid_%s_floris_grid_%d' % (name, i)
+                self.connect('gridOrigin_%s' % name, '%s.gridOrigin' % gridComp)
+                self.connect('gridSpacing_%s' % name, '%s.gridSpacing' % gridComp)
+                self.connect('gridHeight_%s' % name, '%s.gridHeight' % gridComp)
+                self.connect('windrose_directions[%d]' % i, '%s.wind_direction' % gridComp)
+                self.connect('hubHeight', '%s.hubHeight' % gridComp)
+                self.connect('parameters', '%s.parameters' % gridComp)
+                self.connect('rotorDiameter', '%s.rotorDiameter' % gridComp)
+                self.connect(turbineState % 'axialInd', '%s.axialInd' % gridComp)
+                self.connect(turbineState % 'keArray', '%s.keArray' % gridComp)
+                self.connect(CT, '%s.Ct' % gridComp)
+                self.connect(yawToConnect, '%s.yaw' % gridComp)
+                self.connect(turbineFrame % 'turbineXw', '%s.turbineXw' % gridComp)
+                self.connect(turbineFrame % 'turbineYw', '%s.turbineYw' % gridComp)
+                self.connect('%s.ws_grid' % gridComp, 'ws_grid_%s_%d' % (name, i))
 
             # connections from floris_power to floris_AEP
-            self.connect('floris_power_%d.power' % i, 'floris_AEP.power_directions[%d]' % i)
+            if sweep:
+                self.connect('floris_sweep_%d.power' % i, 'floris_AEP.power_directions[%d]' % i)
+            elif not batch:
+                self.connect('floris_power_%d.power' % i, 'floris_AEP.power_directions[%d]' % i)
             # #################################################################
 
             # add to workflow
-            exec("self.FPIdriver_%d.workflow.add(['rotor_CPCT_%d', 'floris_windframe_%d', \
-                 'floris_wcent_wdiam_%d', 'floris_overlap_%d', 'floris_power_%d'])" % (i, i, i, i, i, i))
-            exec("self.FPIdriver_%d.add_parameter('rotor_CPCT_%d.wind_speed_hub', low=0., high=100.)" % (i, i))
-            exec("self.FPIdriver_%d.add_constraint('rotor_CPCT_%d.wind_speed_hub = \
-                  floris_power_%d.velocitiesTurbines')" % (i, i, i))
-            self.driver.workflow.add('FPIdriver_%d' % i)
-            if nSamples>0:
-                self.driver.workflow.add(['Sampling_floris_windframe_%d' % i,
-                                          'Sampling_floris_wcent_wdiam_%d' % i, 'Sampling_floris_overlap_%d' % i, 'Sampling_floris_power_%d' % i])
+            if sweep:
+                self.driver.workflow.add(['floris_windframe_%d' % i, 'floris_sweep_%d' % i])
+            elif not batch:
+                exec("self.FPIdriver_%d.workflow.add(['rotor_CPCT_%d', 'floris_windframe_%d', \
+                     'floris_wcent_wdiam_%d', 'floris_overlap_%d', 'floris_power_%d'])" % (i, i, i, i, i, i))
+                exec("self.FPIdriver_%d.add_parameter('rotor_CPCT_%d.wind_speed_hub', low=0., high=100.)" % (i, i))
+                exec("self.FPIdriver_%d.add_constraint('rotor_CPCT_%d.wind_speed_hub = \
+                      floris_power_%d.velocitiesTurbines')" % (i, i, i))
+                self.driver.workflow.add('FPIdriver_%d' % i)
+            for ssn in samplingChains:
+                self.driver.workflow.add(['%sfloris_windframe_%d' % (ssn,i), '%sfloris_samples_%d' % (ssn,i)])
+            for name, shape in sampleGrids:
+                self.driver.workflow.add('Grid_%s_floris_grid_%d' % (name, i))
+
+        if batch and nSpeedBins == 0:
+            if nSpeeds>1:
+                self.connect('windrose_speeds', 'floris_directions.wind_speeds')
+            else:
+                for i in range(0, nDirections):
+                    self.connect('windrose_speeds', 'floris_directions.wind_speeds[%d]' % i)
 
         if nSpeeds>1:
             for i in range(0, nSpeeds):
-                for ssn in samplingNonSampling:
+                if sweep:
+                    self.connect('windrose_speeds[%d]' % i, 'floris_sweep_%d.wind_speed' % i)
+                for ssn in modelChains:
                     self.connect('windrose_speeds[%d]' % i, '%sfloris_power_%d.wind_speed' % (ssn,i))
+                for ssn in frameChains:
                     self.connect('windrose_speeds[%d]' % i, '%sfloris_windframe_%d.wind_speed' % (ssn,i))
+                for ssn in samplingChains:
+                    self.connect('windrose_speeds[%d]' % i, '%sfloris_samples_%d.wind_speed' % (ssn,i))
+                for name, shape in sampleGrids:
+                    self.connect('windrose_speeds[%d]' % i, 'Grid_%s_floris_grid_%d.wind_speed' % (name, i))
         else:
             for i in range(0, nDirections):
-                for ssn in samplingNonSampling:
+                if sweep:
+                    self.connect('windrose_speeds', 'floris_sweep_%d.wind_speed' % i)
+                for ssn in modelChains:
                     self.connect('windrose_speeds', '%sfloris_power_%d.wind_speed' % (ssn,i))
+                for ssn in frameChains:
                     self.connect('windrose_speeds', '%sfloris_windframe_%d.wind_speed' % (ssn,i))
+                for ssn in samplingChains:
+                    self.connect('windrose_speeds', '%sfloris_samples_%d.wind_speed' % (ssn,i))
+                for name, shape in sampleGrids:
+                    self.connect('windrose_speeds', 'Grid_%s_floris_grid_%d.wind_speed' % (name, i))
 
         # add AEP calculations to workflow
         self.driver.workflow.add(['floris_AEP', 'floris_dist_const'])
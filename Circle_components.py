@@ -1,8 +1,19 @@
 from openmdao.main.api import Component, VariableTree
 from openmdao.lib.datatypes.api import Array, Bool, Float, VarTree
 from Parameters import FLORISParameters
+from rotor_components import windSpeedToCPCT, CPCTCurve, calcYawCorrection, calcRotorCoefficients
+from sparse_derivatives import applyDiagonalDeriv, applyDiagonalDerivT
+import numba_kernels
+import multiprocessing
+import atexit
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+import hashlib
 import numpy as np
 
+# implementation of the overlap, sample and turbine velocity kernels, see setKernelBackend
+kernelBackend = 'numba' if numba_kernels.available else 'numpy'
+
 
 class floris_windframe(Component):
     """ Calculates the locations of each turbine in the wind direction reference frame """
@@ -15,23 +26,26 @@ class floris_windframe(Component):
     wind_speed = Float(iotype='in', units='m/s', desc='free stream wind velocity')
     wind_direction = Float(iotype='in', units='deg', desc='overall wind direction for wind farm')
 
-    def __init__(self, nTurbines, nSamples=0):
+    def __init__(self, nTurbines, nSamples=0, sampleDtype='float'):
 
         super(floris_windframe, self).__init__()
 
+        # floating point type of the sample positions, 'float32' halves the memory of the flow field sampling
+        self.sampleDtype = sampleDtype
+
         # Explicitly size input arrays
         self.add('turbineX', Array(np.zeros(nTurbines), iotype='in', \
                                    desc='x positions of turbines in original ref. frame'))
         self.add('turbineY', Array(np.zeros(nTurbines), iotype='in', \
                                    desc='y positions of turbines in original ref. frame'))
 
-        # variables for verbosity
-        self.add('Ct', Array(np.zeros(nTurbines), iotype='in'))
-        self.add('Cp', Array(np.zeros(nTurbines), iotype='in', \
+        # variables for verbosity, they do not change the outputs
+        self.add('Ct', Array(np.zeros(nTurbines), iotype='in', ignore_deriv=True))
+        self.add('Cp', Array(np.zeros(nTurbines), iotype='in', ignore_deriv=True, \
                              desc='power coefficient for all turbines'))
-        self.add('axialInduction', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+        self.add('axialInduction', Array(np.zeros(nTurbines), iotype='in', dtype='float', ignore_deriv=True, \
                                          desc='axial induction of all turbines'))
-        self.add('yaw', Array(np.zeros(nTurbines), iotype='in', \
+        self.add('yaw', Array(np.zeros(nTurbines), iotype='in', ignore_deriv=True, \
                               desc='yaw of each turbine'))
 
         # for testing purposes only
@@ -46,7 +60,7 @@ class floris_windframe(Component):
         self.add('ws_positionZ', Array(np.zeros([nSamples]), iotype='in', units='m', desc='Z position of desired measurements in original ref. frame'))
 
         # Explicitly size output arrays
-        self.add('wsw_position', Array(np.zeros([3, nSamples]), iotype='out', units='m', desc='position of desired measurements in wind ref. frame'))
+        self.add('wsw_position', Array(np.zeros([3, nSamples], dtype=sampleDtype), iotype='out', units='m', dtype=sampleDtype, desc='position of desired measurements in wind ref. frame'))
 
     def execute(self):
 
@@ -84,9 +98,9 @@ class floris_windframe(Component):
             velY = self.ws_positionY
             velZ = self.ws_positionZ
         else:
-            velX = np.zeros([0, 0])
-            velY = np.zeros([0, 0])
-            velZ = np.zeros([0, 0])
+            velX = np.zeros(0)
+            velY = np.zeros(0)
+            velZ = np.zeros(0)
 
         # convert to downwind-crosswind coordinates
         rotationMatrix = np.array([(np.cos(-windDirection), -np.sin(-windDirection)),
@@ -103,7 +117,26 @@ class floris_windframe(Component):
             velX = locations[0]
             velY = locations[1]
 
-        self.wsw_position = np.array([velX, velY, velZ])
+        self.wsw_position = np.array([velX, velY, velZ], dtype=self.sampleDtype)
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineX', 'turbineY'), ('turbineXw', 'turbineYw')
+
+    def apply_deriv(self, arg, result):
+        applyDiagonalDeriv(self.diagonalJ(), arg, result)
+
+    def apply_derivT(self, arg, result):
+        applyDiagonalDerivT(self.diagonalJ(), arg, result)
+
+    def diagonalJ(self):
+        """each block of the Jacobian is the rotation coefficient times the identity"""
+
+        windDirection = self.wind_direction*np.pi/180.0
+
+        return {('turbineXw', 'turbineX'): np.cos(-windDirection), ('turbineXw', 'turbineY'): -np.sin(-windDirection),
+                ('turbineYw', 'turbineX'): np.sin(-windDirection), ('turbineYw', 'turbineY'): np.cos(-windDirection)}
 
 
 class floris_wcent_wdiam(Component):
@@ -112,9 +145,13 @@ class floris_wcent_wdiam(Component):
     parameters = VarTree(FLORISParameters(), iotype='in')
     verbose = Bool(False, iotype='in', desc='verbosity of FLORIS, False is no output')
 
-    def __init__(self, nTurbines, nSamples=0):
+    def __init__(self, nTurbines, nSamples=0, cullWakes=False, sampleDtype='float'):
         super(floris_wcent_wdiam, self).__init__()
 
+        # if True, only pairs of turbines where the rotor overlaps with an upstream wake are evaluated, and the
+        # turbine outputs are given per pair in wakePairs instead of for all turbine pairs
+        self.cullWakes = cullWakes
+
         # Explicitly size input arrays
         self.add('turbineXw', Array(np.zeros(nTurbines), iotype='in', \
                                     desc='x coordinates of turbines in wind dir. ref. frame'))
@@ -128,126 +165,173 @@ class floris_wcent_wdiam(Component):
         self.add('Ct', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
                              desc='thrust coefficient of each turbine'))
 
-        self.add('wsw_position', Array(np.zeros([3, nSamples]), iotype='in', units='m', desc='positions where measurements are desired in the windframe'))
+        self.add('wsw_position', Array(np.zeros([3, nSamples], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='positions where measurements are desired in the windframe'))
 
 
         # Explicitly size output arrays
-        self.add('wakeCentersYT', Array(np.zeros(nTurbines*nTurbines), iotype='out', dtype='float', \
-                                        desc='wake center y position at each turbine'))
-        self.add('wakeDiametersT', Array(np.zeros(nTurbines*nTurbines*3), iotype='out', dtype='float', \
-                                         desc='wake diameter of each zone of each wake at each turbine'))
-        self.add('wakeDiameters', Array(np.zeros([nSamples, nTurbines, 3]), iotype='out', dtype='float', desc='wake diameter of each zone of each wake at each turbine'))
-        self.add('wakeCentersY', Array(np.zeros([nSamples, nTurbines]), iotype='out', units='m', desc='Y positions of wakes at measurement points'))
-        self.add('wakeCentersZ', Array(np.zeros([nSamples, nTurbines]), iotype='out', units='m', desc='Z positions of wakes at measurement points'))
+        if cullWakes:
+            self.add('wakePairs', Array(np.zeros([2, 0], dtype=int), iotype='out', dtype='int', ignore_deriv=True, \
+                                        desc='indices of downstream and upstream turbine of each interacting pair'))
+            self.add('wakeCentersYT', Array(np.zeros(0), iotype='out', dtype='float', \
+                                            desc='wake center y position at the downstream turbine of each pair'))
+            self.add('wakeDiametersT', Array(np.zeros([0, 3]), iotype='out', dtype='float', \
+                                             desc='wake diameter of each zone at the downstream turbine of each pair'))
+        else:
+            self.add('wakeCentersYT', Array(np.zeros(nTurbines*nTurbines), iotype='out', dtype='float', \
+                                            desc='wake center y position at each turbine'))
+            self.add('wakeDiametersT', Array(np.zeros(nTurbines*nTurbines*3), iotype='out', dtype='float', \
+                                             desc='wake diameter of each zone of each wake at each turbine'))
+        # per-sample wake arrays in the precision of the sample positions
+        self.add('wakeDiameters', Array(np.zeros([nSamples, nTurbines, 3], dtype=sampleDtype), iotype='out', dtype=sampleDtype, desc='wake diameter of each zone of each wake at each turbine'))
+        self.add('wakeCentersY', Array(np.zeros([nSamples, nTurbines], dtype=sampleDtype), iotype='out', units='m', dtype=sampleDtype, desc='Y positions of wakes at measurement points'))
+        self.add('wakeCentersZ', Array(np.zeros([nSamples, nTurbines], dtype=sampleDtype), iotype='out', units='m', dtype=sampleDtype, desc='Z positions of wakes at measurement points'))
 
     def execute(self):
 
          # rename inputs and outputs
-        # pP = self.parameters.pP
         kd = self.parameters.kd
-        ke = self.parameters.ke
         initialWakeDisplacement = self.parameters.initialWakeDisplacement
-        initialWakeAngle = self.parameters.initialWakeAngle
         rotorDiameter = self.rotorDiameter
         hubHeight = self.hubHeight
-        Ct = self.Ct
-        CTcorrected = self.parameters.CTcorrected
-        keCorrCT = self.parameters.keCorrCT
-        baselineCT = self.parameters.baselineCT
-        me = self.parameters.me
-
-        adjustInitialWakeDiamToYaw = self.parameters.adjustInitialWakeDiamToYaw
-        useWakeAngle = self.parameters.useWakeAngle
-
-        bd = self.parameters.bd
 
         turbineXw = self.turbineXw
         turbineYw = self.turbineYw
         yaw = self.yaw*np.pi/180.0
-        nTurbines = turbineXw.size
 
         velX = self.wsw_position[0][:]
-        nSamples = np.size(velX)
 
-        if CTcorrected == False:
-            Ct = Ct * (np.cos(yaw*np.pi/180.)**2)
-
-        # calculate y-location of wake centers
-        wakeCentersY = np.zeros((nSamples, nTurbines))
-        wakeCentersZ = np.zeros((nSamples, nTurbines))
-        wakeCentersYT_mat = np.zeros((nTurbines, nTurbines))
-        for turb in range(0, nTurbines):
-            wakeAngleInit = 0.5 * np.sin(yaw[turb]) * Ct[turb]
-            if useWakeAngle:
-                wakeAngleInit += initialWakeAngle*np.pi/180.0
-            for loc in range(0, nSamples):  # at velX-locations
-                deltax = np.maximum(velX[loc]-turbineXw[turb], 0)
-                factor = (2.0*kd*deltax/rotorDiameter[turb])+1.0
-                wakeCentersY[loc, turb] = turbineYw[turb]+initialWakeDisplacement # initial displacement for no yaw (positive to the left looking downstream)
-                displacement = (wakeAngleInit*(15.0*(factor**4.0)+(wakeAngleInit**2.0))/((30.0*kd*(factor**5.0))/rotorDiameter[turb]))-(wakeAngleInit*rotorDiameter[turb]*(15.0+(wakeAngleInit**2.0))/(30.0*kd)) # yaw-induced deflection
-                if not useWakeAngle:
-                    displacement += bd*deltax
-                wakeCentersY[loc, turb] = wakeCentersY[loc, turb] + displacement
-                wakeCentersZ[loc, turb] = hubHeight[turb]
-
-            for turbI in range(0, nTurbines):  # at turbineX-locations
-                deltax = np.maximum(turbineXw[turbI]-turbineXw[turb], 0.0)
-                factor = (2.0*kd*deltax/rotorDiameter[turb])+1.0
-                wakeCentersYT_mat[turbI, turb] = turbineYw[turb]
-                wakeCentersYT_mat[turbI, turb] = wakeCentersYT_mat[turbI, turb]+initialWakeDisplacement # initial displacement for no yaw (positive to the left looking downstream)
-                                
-                displacement = (wakeAngleInit*(15.0*(factor**4.0)+(wakeAngleInit**2.0))/
-                ((30.0*kd*(factor**5.0))/rotorDiameter[turb]))- \
-                (wakeAngleInit*rotorDiameter[turb]*(15.0+(wakeAngleInit**2.0))/(30.0*kd)) # yaw-induced wake center displacement
-                
-                wakeCentersYT_mat[turbI, turb] = wakeCentersYT_mat[turbI, turb] + displacement
-                
-        # adjust k_e to C_T, adjusted to yaw
-        ke = ke + keCorrCT*(Ct-baselineCT) # FT = Ct*0.5*rho*A*(U*cos(yaw))^2, hence, thrust decreases with cos^2
-                                                           #   Should ke increase directly with thrust? ==>No - Turbulence characteristics in wind-turbine wakes, A. Crespo"'*, J. Hern'andez b
+        # initial wake angle, initial wake diameter and zone expansion rates of each turbine
+        wakeAngleInit, wakeDiameter0, zoneExpansion = calcWakeParameters(yaw, self.Ct, rotorDiameter, self.parameters)
 
-        # calculate wake zone diameters at velX-locations
-        wakeDiameters = np.zeros((nSamples,nTurbines, 3))
-        wakeDiametersT_mat = np.zeros((nTurbines, nTurbines, 3))
-        for turb in range(0, nTurbines):
-            if adjustInitialWakeDiamToYaw:
-                wakeDiameter0 = rotorDiameter[turb] * np.cos(yaw[turb]) # CHANGE: initial wake diameter at rotor adjusted to yaw
-            else:
-                wakeDiameter0 = rotorDiameter[turb]
-            for loc in range(0, nSamples):  # at velX-locations
-                deltax = velX[loc]-turbineXw[turb]
-                for zone in range(0,3):
-                    wakeDiameters[loc, turb, zone] = wakeDiameter0 + 2*ke[turb]*me[zone]*np.maximum(deltax, 0)
-            for turbI in range(0, nTurbines):  # at turbineX-locations
-                deltax = turbineXw[turbI]-turbineXw[turb]
-                for zone in range(0, 3):
-                    wakeDiametersT_mat[turbI, turb, zone] = np.maximum(wakeDiameter0 + 2*ke[turb]*me[zone]*deltax, 0)
+        # calculate wake centers and wake zone diameters at velX-locations
+        wakeCentersY, wakeCentersZ, wakeDiameters = calcWakeGeometrySamples(velX, turbineXw, turbineYw, hubHeight,
+                                                                            rotorDiameter, wakeAngleInit, wakeDiameter0,
+                                                                            zoneExpansion, self.parameters)
+        self.wakeDiameters = wakeDiameters
+        self.wakeCentersY = wakeCentersY
+        self.wakeCentersZ = wakeCentersZ
 
+        if self.cullWakes:
+            # calculate wake centers and wake zone diameters for interacting turbine pairs only
+            self.wakePairs, self.wakeCentersYT, self.wakeDiametersT = \
+                calcWakePairs(turbineXw, turbineYw, rotorDiameter, wakeAngleInit, wakeDiameter0, zoneExpansion,
+                              self.parameters)
+            return
 
-        wakeDiametersT_vec = np.zeros(3*nTurbines*nTurbines)
-        for i in range(0, nTurbines):
-            wakeDiametersT_vec[(3*nTurbines*i):(3*nTurbines*i+nTurbines)] = wakeDiametersT_mat[i, :, 0]
-            wakeDiametersT_vec[3*nTurbines*i+nTurbines:3*nTurbines*i+2*nTurbines] = wakeDiametersT_mat[i, :, 1]
-            wakeDiametersT_vec[3*nTurbines*i+2*nTurbines:3*nTurbines*i+3*nTurbines] = wakeDiametersT_mat[i, :, 2]
+        # calculate y-location of wake centers at turbineX-locations, wakeCentersYT_mat(TURBI,TURB)
+        deltax = np.maximum(turbineXw[:, np.newaxis]-turbineXw, 0.0)
+        # initial displacement for no yaw (positive to the left looking downstream) and yaw-induced displacement
+        wakeCentersYT_mat = (turbineYw+initialWakeDisplacement) + calcWakeDisplacement(deltax, wakeAngleInit, rotorDiameter, kd)
 
-        wakeCentersYT_vec = np.zeros(nTurbines*nTurbines)
-        for i in range(0, nTurbines):
-            wakeCentersYT_vec[(nTurbines*i):(nTurbines*i+nTurbines)] = wakeCentersYT_mat[i, :]
+        # calculate wake zone diameters at turbineX-locations, wakeDiametersT_mat(TURBI,TURB,ZONEI)
+        deltax = turbineXw[:, np.newaxis]-turbineXw
+        wakeDiametersT_mat = np.maximum(wakeDiameter0[:, np.newaxis] + zoneExpansion*deltax[:, :, np.newaxis], 0)
 
+        # convert matrix format to vector format, ordered by TURBI, then ZONEI, then TURB
+        wakeDiametersT_vec = wakeDiametersT_mat.transpose(0, 2, 1).flatten()
+        wakeCentersYT_vec = wakeCentersYT_mat.flatten()
 
         self.wakeCentersYT = wakeCentersYT_vec
         self.wakeDiametersT = wakeDiametersT_vec
-        self.wakeDiameters = wakeDiameters
-        self.wakeCentersY = wakeCentersY
-        self.wakeCentersZ = wakeCentersZ
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineXw', 'turbineYw', 'yaw', 'Ct'), ('wakeCentersYT', 'wakeDiametersT')
+
+    def linearize_pairs(self):
+        """partial derivatives of the wake center and wake zone diameters of each turbine pair (see
+        calcWakePairsDerivatives), with the pairs in the order of the outputs"""
+
+        nTurbines = self.turbineXw.size
+
+        if self.cullWakes:
+            turbI, turb = np.asarray(self.wakePairs, dtype=int)
+        else:
+            # all (TURBI,TURB) pairs, ordered by TURBI then TURB
+            turbI = np.repeat(np.arange(nTurbines), nTurbines)
+            turb = np.tile(np.arange(nTurbines), nTurbines)
+
+        return (turbI, turb) + calcWakePairsDerivatives(turbI, turb, self.turbineXw, self.yaw*np.pi/180.0, self.Ct,
+                                                        self.rotorDiameter, self.parameters)
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        nTurbines = self.turbineXw.size
+        turbI, turb, dCenter_dX, dCenter_dyaw, dCenter_dCt, dDiameter_dX, dDiameter_dyaw, dDiameter_dCt = \
+            self.linearize_pairs()
+
+        dCenter = np.zeros(turbI.size)
+        dDiameter = np.zeros((turbI.size, 3))
+        if 'turbineXw' in arg:
+            dX = np.ravel(arg['turbineXw'])
+            dX = dX[turbI]-dX[turb]
+            dCenter += dCenter_dX*dX
+            dDiameter += dDiameter_dX*dX[:, np.newaxis]
+        if 'turbineYw' in arg:
+            dCenter += np.ravel(arg['turbineYw'])[turb]
+        if 'yaw' in arg:
+            dyaw = np.ravel(arg['yaw'])[turb]*np.pi/180.0
+            dCenter += dCenter_dyaw*dyaw
+            dDiameter += dDiameter_dyaw*dyaw[:, np.newaxis]
+        if 'Ct' in arg:
+            dCt = np.ravel(arg['Ct'])[turb]
+            dCenter += dCenter_dCt*dCt
+            dDiameter += dDiameter_dCt*dCt[:, np.newaxis]
+
+        if not self.cullWakes:
+            # pair format to vector format, ordered by TURBI, then ZONEI, then TURB
+            dDiameter = dDiameter.reshape(nTurbines, nTurbines, 3).transpose(0, 2, 1)
+
+        if 'wakeCentersYT' in result:
+            result['wakeCentersYT'] += dCenter.reshape(np.shape(result['wakeCentersYT']))
+        if 'wakeDiametersT' in result:
+            result['wakeDiametersT'] += dDiameter.reshape(np.shape(result['wakeDiametersT']))
+
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
+
+        nTurbines = self.turbineXw.size
+        turbI, turb, dCenter_dX, dCenter_dyaw, dCenter_dCt, dDiameter_dX, dDiameter_dyaw, dDiameter_dCt = \
+            self.linearize_pairs()
+
+        sCenter = np.zeros(turbI.size)
+        sDiameter = np.zeros((turbI.size, 3))
+        if 'wakeCentersYT' in arg:
+            sCenter += np.ravel(arg['wakeCentersYT'])
+        if 'wakeDiametersT' in arg:
+            if self.cullWakes:
+                sDiameter += np.reshape(arg['wakeDiametersT'], (-1, 3))
+            else:
+                # vector format to pair format
+                sDiameter += np.reshape(arg['wakeDiametersT'], (nTurbines, 3, nTurbines)).transpose(0, 2, 1).reshape(-1, 3)
+
+        if 'turbineXw' in result:
+            sX = dCenter_dX*sCenter + np.sum(dDiameter_dX*sDiameter, 1)
+            dX = np.bincount(turbI, weights=sX, minlength=nTurbines) - np.bincount(turb, weights=sX, minlength=nTurbines)
+            result['turbineXw'] += dX.reshape(np.shape(result['turbineXw']))
+        if 'turbineYw' in result:
+            result['turbineYw'] += np.bincount(turb, weights=sCenter,
+                                               minlength=nTurbines).reshape(np.shape(result['turbineYw']))
+        if 'yaw' in result:
+            syaw = dCenter_dyaw*sCenter + np.sum(dDiameter_dyaw*sDiameter, 1)
+            dyaw = np.bincount(turb, weights=syaw, minlength=nTurbines)*np.pi/180.0
+            result['yaw'] += dyaw.reshape(np.shape(result['yaw']))
+        if 'Ct' in result:
+            sCt = dCenter_dCt*sCenter + np.sum(dDiameter_dCt*sDiameter, 1)
+            result['Ct'] += np.bincount(turb, weights=sCt, minlength=nTurbines).reshape(np.shape(result['Ct']))
 
 
 class floris_overlap(Component):
     """ Calculates the overlap between each turbine rotor and the existing turbine wakes """
 
-    def __init__(self, nTurbines):
+    def __init__(self, nTurbines, cullWakes=False):
         super(floris_overlap, self).__init__()
 
+        # if True, the wake inputs and the overlap output are given per pair in wakePairs (see floris_wcent_wdiam)
+        self.cullWakes = cullWakes
+
         # Explicitly size input arrays
         self.add('turbineXw', Array(np.zeros(nTurbines), iotype='in', units='m', ignore_deriv=True, \
                                     desc='X positions of turbines wrt the wind direction'))
@@ -255,14 +339,26 @@ class floris_overlap(Component):
                                           desc='Y positions of turbines wrt the wind direction'))
         self.add('rotorDiameter', Array(np.zeros(nTurbines), iotype='in', units='m', \
                                               desc='diameters of all turbine rotors'))
-        self.add('wakeCentersYT', Array(np.zeros(nTurbines*nTurbines), iotype='in', units='m', \
-                                              desc='Y positions of all wakes at each turbine'))
-        self.add('wakeDiametersT', Array(np.zeros(nTurbines*nTurbines*3), iotype='in', units='m',\
-                                               desc='diameters of all turbines wake zones'))
+        if cullWakes:
+            self.add('wakePairs', Array(np.zeros([2, 0], dtype=int), iotype='in', dtype='int', ignore_deriv=True, \
+                                        desc='indices of downstream and upstream turbine of each interacting pair'))
+            self.add('wakeCentersYT', Array(np.zeros(0), iotype='in', units='m', \
+                                            desc='Y position of the wake at the downstream turbine of each pair'))
+            self.add('wakeDiametersT', Array(np.zeros([0, 3]), iotype='in', units='m', \
+                                             desc='diameters of the wake zones at the downstream turbine of each pair'))
+        else:
+            self.add('wakeCentersYT', Array(np.zeros(nTurbines*nTurbines), iotype='in', units='m', \
+                                                  desc='Y positions of all wakes at each turbine'))
+            self.add('wakeDiametersT', Array(np.zeros(nTurbines*nTurbines*3), iotype='in', units='m',\
+                                                   desc='diameters of all turbines wake zones'))
 
         # Explicitly size output arrays
-        self.add('wakeOverlapTRel', Array(np.zeros(nTurbines*nTurbines*3), iotype='out', \
-                                                desc='relative wake zone overlap to rotor area'))
+        if cullWakes:
+            self.add('wakeOverlapTRel', Array(np.zeros([0, 3]), iotype='out', \
+                                              desc='relative wake zone overlap to rotor area of each pair'))
+        else:
+            self.add('wakeOverlapTRel', Array(np.zeros(nTurbines*nTurbines*3), iotype='out', \
+                                                    desc='relative wake zone overlap to rotor area'))
         self.add('rotorArea', Array(np.zeros(nTurbines), iotype='in', units='m*m', desc='Area of each turbine rotor'))
 
 
@@ -270,19 +366,18 @@ class floris_overlap(Component):
 
         nTurbines = self.turbineYw.size
 
-        wakeDiametersT_mat = np.zeros((nTurbines, nTurbines, 3))
-        wakeCentersYT_mat = np.zeros((nTurbines, nTurbines))
-
-        # convert the input vector to the array used for calculations
-        for i in range(0, nTurbines):
-                wakeDiametersT_mat[i, :, 0] = self.wakeDiametersT[3*nTurbines*i:3*nTurbines*i+nTurbines]
-                wakeDiametersT_mat[i, :, 1] = self.wakeDiametersT[3*nTurbines*i+nTurbines:3*nTurbines*i+2*nTurbines]
-                wakeDiametersT_mat[i, :, 2] = self.wakeDiametersT[3*nTurbines*i+2*nTurbines:3*nTurbines*i+3*nTurbines]
-
-        # convert the input vector to the array used for calculations
-        for i in range(0, nTurbines):
-                wakeCentersYT_mat[i, :] = self.wakeCentersYT[nTurbines*i:nTurbines*i+nTurbines]
+        if self.cullWakes:
+            wakePairs = np.asarray(self.wakePairs, dtype=int)
+            rotorArea = np.pi*self.rotorDiameter**2/4.
+            wakeOverlapT = calcOverlapAreasPairs(self.turbineYw, self.rotorDiameter, wakePairs, self.wakeDiametersT,
+                                                 self.wakeCentersYT)
+            # make overlap relative to rotor area (maximum value should be 1)
+            self.wakeOverlapTRel = wakeOverlapT/rotorArea[wakePairs[0]][:, np.newaxis]
+            return
 
+        # convert the input vectors, ordered by TURBI, then ZONEI, then TURB, to the arrays used for calculations
+        wakeDiametersT_mat = np.reshape(self.wakeDiametersT, (nTurbines, 3, nTurbines)).transpose(0, 2, 1)
+        wakeCentersYT_mat = np.reshape(self.wakeCentersYT, (nTurbines, nTurbines))
 
         # calculate overlap areas at rotors
         # wakeOverlapT(TURBI,TURB,ZONEI) = overlap area of zone ZONEI of wake
@@ -293,23 +388,112 @@ class floris_overlap(Component):
         wakeOverlapT = calcOverlapAreas(self.turbineXw, self.turbineYw, self.rotorDiameter, wakeDiametersT_mat, wakeCentersYT_mat)
 
         # make overlap relative to rotor area (maximum value should be 1)
-        # wakeOverlapTRel = wakeOverlapT
-        wakeOverlapTRel_mat = wakeOverlapT
-        for turb in range(0, nTurbines):
-            # wakeOverlapTRel[turb] = wakeOverlapTRel[turb]/self.rotorArea[turb]
-            wakeOverlapTRel_mat[turb] = wakeOverlapTRel_mat[turb]/rotorArea[turb]
+        wakeOverlapTRel_mat = wakeOverlapT/rotorArea[:, np.newaxis, np.newaxis]
+
+        # convert matrix format to vector format, ordered by TURBI, then ZONEI, then TURB
+        self.wakeOverlapTRel = wakeOverlapTRel_mat.transpose(0, 2, 1).flatten()
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineYw', 'wakeCentersYT', 'wakeDiametersT'), ('wakeOverlapTRel',)
+
+    def linearize_pairs(self):
+        """partial derivatives of the relative overlap of each zone disk (before converting disks to rings) of each
+        turbine pair with respect to the distance between wake center and rotor center and to the zone diameter, with
+        the pairs in the order of the outputs"""
+
+        nTurbines = self.turbineYw.size
+        rotorArea = np.pi*self.rotorDiameter**2/4.
+
+        if self.cullWakes:
+            turbI, turb = np.asarray(self.wakePairs, dtype=int)
+            wakeCentersYT = self.wakeCentersYT
+            wakeDiametersT = np.reshape(self.wakeDiametersT, (-1, 3))
+            downstream = np.ones(turbI.size)
+        else:
+            # all (TURBI,TURB) pairs, ordered by TURBI then TURB
+            turbI = np.repeat(np.arange(nTurbines), nTurbines)
+            turb = np.tile(np.arange(nTurbines), nTurbines)
+            wakeCentersYT = self.wakeCentersYT
+            wakeDiametersT = np.reshape(self.wakeDiametersT, (nTurbines, 3, nTurbines)).transpose(0, 2, 1).reshape(-1, 3)
+            downstream = self.turbineXw[turbI] > self.turbineXw[turb]
+
+        OVdY = wakeCentersYT-self.turbineYw[turbI]
+        dOverlap_dOVdYd, dOverlap_dOVR = calcZoneOverlapDerivatives(np.abs(OVdY)[:, np.newaxis],
+                                                                    (self.rotorDiameter/2)[turbI][:, np.newaxis],
+                                                                    wakeDiametersT/2)
+        scale = (downstream/rotorArea[turbI])[:, np.newaxis]
+
+        # distance derivative with respect to the wake center, diameter derivative with respect to the zone diameter
+        dOverlapRel_dCenter = dOverlap_dOVdYd*np.sign(OVdY)[:, np.newaxis]*scale
+        dOverlapRel_dDiameter = dOverlap_dOVR*0.5*scale
+
+        return turbI, dOverlapRel_dCenter, dOverlapRel_dDiameter
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        if 'wakeOverlapTRel' not in result:
+            return
+
+        nTurbines = self.turbineYw.size
+        turbI, dOverlapRel_dCenter, dOverlapRel_dDiameter = self.linearize_pairs()
+
+        dCenter = np.zeros(turbI.size)
+        dDisk = np.zeros((turbI.size, 3))
+        if 'wakeCentersYT' in arg:
+            dCenter += np.ravel(arg['wakeCentersYT'])
+        if 'turbineYw' in arg:
+            dCenter -= np.ravel(arg['turbineYw'])[turbI]
+        if 'wakeDiametersT' in arg:
+            if self.cullWakes:
+                dDisk += dOverlapRel_dDiameter*np.reshape(arg['wakeDiametersT'], (-1, 3))
+            else:
+                dDisk += dOverlapRel_dDiameter*np.reshape(arg['wakeDiametersT'],
+                                                          (nTurbines, 3, nTurbines)).transpose(0, 2, 1).reshape(-1, 3)
+        dDisk += dOverlapRel_dCenter*dCenter[:, np.newaxis]
+
+        # convert overlap of full zone disks to overlap of the zone rings
+        dRing = dDisk.copy()
+        dRing[:, 1:] -= dDisk[:, :-1]
+
+        if not self.cullWakes:
+            # pair format to vector format, ordered by TURBI, then ZONEI, then TURB
+            dRing = dRing.reshape(nTurbines, nTurbines, 3).transpose(0, 2, 1)
+
+        result['wakeOverlapTRel'] += dRing.reshape(np.shape(result['wakeOverlapTRel']))
 
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
 
-        # convert matrix format to vector format (all are of type ndarray)
-        wakeOverlapTRel_vec = np.zeros(3*nTurbines**2)
-        # print 'shape of woTRel is %s' %wakeOverlapTRel_vec.shape
-        for i in range(0, nTurbines):
-            wakeOverlapTRel_vec[(3*nTurbines*i):(3*nTurbines*i+nTurbines)] = wakeOverlapTRel_mat[i, :, 0]
-            wakeOverlapTRel_vec[3*nTurbines*i+nTurbines:3*nTurbines*i+2*nTurbines] = wakeOverlapTRel_mat[i, :, 1]
-            wakeOverlapTRel_vec[3*nTurbines*i+2*nTurbines:3*nTurbines*i+3*nTurbines] = wakeOverlapTRel_mat[i, :, 2]
+        if 'wakeOverlapTRel' not in arg:
+            return
 
-        # self.wakeOverlapTRel = wakeOverlapTRel
-        self.wakeOverlapTRel = wakeOverlapTRel_vec
+        nTurbines = self.turbineYw.size
+        turbI, dOverlapRel_dCenter, dOverlapRel_dDiameter = self.linearize_pairs()
+
+        if self.cullWakes:
+            sRing = np.reshape(arg['wakeOverlapTRel'], (-1, 3))
+        else:
+            # vector format to pair format
+            sRing = np.reshape(arg['wakeOverlapTRel'], (nTurbines, 3, nTurbines)).transpose(0, 2, 1).reshape(-1, 3)
+
+        # each zone disk enters its own ring positively and the next ring negatively
+        sDisk = sRing.copy()
+        sDisk[:, :-1] -= sRing[:, 1:]
+
+        sCenter = np.sum(dOverlapRel_dCenter*sDisk, 1)
+        if 'wakeCentersYT' in result:
+            result['wakeCentersYT'] += sCenter.reshape(np.shape(result['wakeCentersYT']))
+        if 'turbineYw' in result:
+            result['turbineYw'] -= np.bincount(turbI, weights=sCenter,
+                                               minlength=nTurbines).reshape(np.shape(result['turbineYw']))
+        if 'wakeDiametersT' in result:
+            sDiameter = dOverlapRel_dDiameter*sDisk
+            if not self.cullWakes:
+                sDiameter = sDiameter.reshape(nTurbines, nTurbines, 3).transpose(0, 2, 1)
+            result['wakeDiametersT'] += sDiameter.reshape(np.shape(result['wakeDiametersT']))
 
 
 class floris_power(Component):
@@ -327,9 +511,19 @@ class floris_power(Component):
     power = Float(iotype='out', units='kW', desc='total power output of the wind farm')
 
 
-    def __init__(self, nTurbines, nSamples=0):
+    def __init__(self, nTurbines, nSamples=0, sampleMemory=0, cullWakes=False, sampleDtype='float', nThreads=1):
         super(floris_power, self).__init__()
 
+        # memory budget (bytes) for the per-sample wake arrays, if positive the wake geometry at the samples is
+        # evaluated in tiles inside this component instead of being provided by floris_wcent_wdiam
+        self.sampleMemory = sampleMemory
+
+        # number of threads evaluating the tiles, they share the memory budget
+        self.nThreads = nThreads
+
+        # if True, the overlap input is given per pair in wakePairs (see floris_wcent_wdiam)
+        self.cullWakes = cullWakes
+
         # Explicitly size input arrays
         # input variables added so I don't have to use WISDEM while developing gradients
         self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
@@ -349,21 +543,35 @@ class floris_power(Component):
         self.add('wakeDiametersT', Array(np.zeros([nTurbines, nTurbines, 3]), iotype='in', units='m', \
                                          desc='diameters of each of the wake zones for each of the wakes \
                                          at each turbine'))
-        self.add('wakeOverlapTRel', Array(np.zeros([nTurbines, nTurbines, 3]), iotype='in', units='m', \
-                                          desc='ratios of wake overlap area per zone to rotor area'))
+        if cullWakes:
+            self.add('wakePairs', Array(np.zeros([2, 0], dtype=int), iotype='in', dtype='int', ignore_deriv=True, \
+                                        desc='indices of downstream and upstream turbine of each interacting pair'))
+            self.add('wakeOverlapTRel', Array(np.zeros([0, 3]), iotype='in', \
+                                              desc='ratios of wake overlap area per zone to rotor area of each pair'))
+        else:
+            self.add('wakeOverlapTRel', Array(np.zeros([nTurbines, nTurbines, 3]), iotype='in', units='m', \
+                                              desc='ratios of wake overlap area per zone to rotor area'))
         self.add('yaw', Array(np.zeros([nTurbines]), iotype='in'))
         # input variables added so I don't have to use WISDEM while developing gradients
         self.add('rotorArea', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m*m', desc='rotor area of all turbines'))
-        self.add('wsw_position', Array(np.zeros([3, nSamples]), iotype='in', units='m', desc='positions where measurements are desired in the windframe'))
-        self.add('wakeDiameters', Array(np.zeros([nSamples, nTurbines, 3]), iotype='in', units='m', desc='diameter of wake zones at measurement points'))
-        self.add('wakeCentersY', Array(np.zeros([nSamples, nTurbines]), iotype='in', units='m', desc='Y positions of wakes at measurement points'))
-        self.add('wakeCentersZ', Array(np.zeros([nSamples, nTurbines]), iotype='in', units='m', desc='Z positions of wakes at measurement points'))
+        self.add('wsw_position', Array(np.zeros([3, nSamples], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='positions where measurements are desired in the windframe'))
+        if sampleMemory > 0:
+            self.add('turbineYw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                        desc='Y positions of turbines in the wind direction reference frame'))
+            self.add('hubHeight', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='hub heights of all turbines'))
+        else:
+            self.add('wakeDiameters', Array(np.zeros([nSamples, nTurbines, 3], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='diameter of wake zones at measurement points'))
+            self.add('wakeCentersY', Array(np.zeros([nSamples, nTurbines], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='Y positions of wakes at measurement points'))
+            self.add('wakeCentersZ', Array(np.zeros([nSamples, nTurbines], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='Z positions of wakes at measurement points'))
 
         # Explicitly size output arrays
         self.add('velocitiesTurbines', Array(np.zeros(nTurbines), iotype='out', units='m/s'))
         self.add('wt_power', Array(np.zeros(nTurbines), iotype='out', units='kW'))
+        self.add('axialInd', Array(np.zeros(nTurbines), iotype='out', desc='axial induction of each turbine'))
+        self.add('keArray', Array(np.zeros(nTurbines), iotype='out', desc='wake expansion coefficient of each turbine'))
 
-        self.add('ws_array', Array(np.zeros(nSamples), iotype='out', units='m/s', desc='wind speed at measurement locations'))
+        self.add('ws_array', Array(np.zeros(nSamples, dtype=sampleDtype), iotype='out', units='m/s', dtype=sampleDtype, desc='wind speed at measurement locations'))
 
 
     def execute(self):
@@ -371,22 +579,17 @@ class floris_power(Component):
         turbineXw = self.turbineXw
         nTurbines = turbineXw.size
 
-        # wakeOverlapTRel = self.wakeOverlapTRel
-        wakeOverlapTRel = np.zeros((nTurbines, nTurbines, 3))
-
-        # convert the input vector to the array used for calculations
-        for i in range(0, nTurbines):
-            wakeOverlapTRel[i, :, 0] = self.wakeOverlapTRel[3*nTurbines*i:3*nTurbines*i+nTurbines]
-            wakeOverlapTRel[i, :, 1] = self.wakeOverlapTRel[3*nTurbines*i+nTurbines:3*nTurbines*i+2*nTurbines]
-            wakeOverlapTRel[i, :, 2] = self.wakeOverlapTRel[3*nTurbines*i+2*nTurbines:3*nTurbines*i+3*nTurbines]
+        if self.cullWakes:
+            wakePairs = np.asarray(self.wakePairs, dtype=int)
+            wakeOverlapTRel = self.wakeOverlapTRel
+        else:
+            # convert the input vector to the array used for calculations
+            wakeOverlapTRel = self.wakeOverlapTRel.reshape(nTurbines, 3, nTurbines).transpose(0, 2, 1)
 
         ke = self.parameters.ke
         keCorrArray = self.parameters.keCorrArray
         keCorrCT = self.parameters.keCorrCT
         baselineCT = self.parameters.baselineCT
-        CTcorrected = self.parameters.CTcorrected
-        CPcorrected = self.parameters.CPcorrected
-        pP = self.parameters.pP
         Ct = self.Ct
         Vinf = self.wind_speed
         turbineXw = self.turbineXw
@@ -408,22 +611,9 @@ class floris_power(Component):
         velY = self.wsw_position[1][:]
         velZ = self.wsw_position[2][:]
         nSamples = np.size(velX)
-        wakeCentersY = self.wakeCentersY
-        wakeCentersZ = self.wakeCentersZ
-        wakeDiameters = self.wakeDiameters
-
-        axialIndProvided = self.parameters.axialIndProvided
 
-        if CTcorrected == False:
-            Ct = Ct * (np.cos(yaw)**2)
-
-        if CPcorrected == False:
-            Cp = Cp * np.cos(yaw)**pP
-
-        if axialIndProvided:
-            axialInd = axialInduction
-        else:
-            axialInd = np.array([CTtoAxialInd(ct) for ct in Ct])
+        # yaw corrected coefficients and axial induction
+        Ct, Cp, axialInd = calcRotorCoefficients(Ct, Cp, yaw, axialInduction, self.parameters)[:3]
 
         # adjust k_e to C_T, adjusted to yaw
         ke = ke + keCorrCT*(Ct-baselineCT) # FT = Ct*0.5*rho*A*(U*cos(yaw))^2, hence, thrust decreases with cos^2
@@ -435,71 +625,42 @@ class floris_power(Component):
         # velocity deficits, in order not to over-complicate code
         # (avoid loops in calculating overlaps)
 
-        keArray = np.zeros(nTurbines)
-        for turb in range(0, nTurbines):
-            s = np.sum(wakeOverlapTRel[turb, :, 0]+wakeOverlapTRel[turb, :, 1])
-            keArray[turb] = ke[turb]*(1+s*keCorrArray)
+        if self.cullWakes:
+            s = np.bincount(wakePairs[0], weights=wakeOverlapTRel[:, 0]+wakeOverlapTRel[:, 1], minlength=nTurbines)
+        else:
+            s = np.sum(wakeOverlapTRel[:, :, 0]+wakeOverlapTRel[:, :, 1], 1)
+        keArray = ke*(1+s*keCorrArray)
+
+        # converged state of the turbines, the flow field can be sampled from it with floris_samples
+        self.axialInd = axialInd
+        self.keArray = keArray
+
+        # recovery coefficients of each wake zone of each turbine
+        if useaUbU:
+            mUArray = MU/np.cos(aU*np.pi/180+bU*yaw[:, np.newaxis]) # CHANGE: ke now only corrected with CT, which is already corrected with yaw
+        else:
+            mUArray = np.tile(MU, (nTurbines, 1))
 
         # calculate velocities in full flow field (optional)
-        self.ws_array = np.tile(Vinf, nSamples)
+        if self.sampleMemory > 0:
+            chunkSize = calcSampleChunkSize(nTurbines, self.sampleMemory/max(self.nThreads, 1), velX.dtype.itemsize)
+            self.ws_array = calcSampleVelocitiesChunked(velX, velY, velZ, turbineXw, self.turbineYw, self.hubHeight,
+                                                        rotorDiameter, yaw, self.Ct, axialInd, keArray, mUArray, Vinf,
+                                                        self.parameters, chunkSize, self.nThreads, self.cullWakes)
+        else:
+            self.ws_array = calcSampleVelocities(velX, velY, velZ, turbineXw, self.wakeCentersY, self.wakeCentersZ,
+                                                 self.wakeDiameters, rotorDiameter, axialInd, keArray, mUArray, Vinf,
+                                                 shearCoefficientAlpha, shearZh)
 
-        # apply shear profile
-        self.ws_array = self.ws_array*(velZ/shearZh)**shearCoefficientAlpha
-        
-        for turb in range(0, nTurbines):
-            if useaUbU:
-                mU = MU/np.cos(aU*np.pi/180+bU*yaw[turb]) # CHANGE: ke now only corrected with CT, which is already corrected with yaw
-            else:
-                mU = MU
-
-            for loc in range(0, nSamples):
-                deltax = velX[loc] - turbineXw[turb]
-                deltay = velY[loc] - wakeCentersY[loc, turb]
-                deltaz = velZ[loc] - wakeCentersZ[loc, turb]
-                radiusLoc = np.sqrt(deltay**2+deltaz**2)
-                axialIndAndNearRotor = 2*axialInd[turb]
-
-                if deltax > 0 and radiusLoc < wakeDiameters[loc, turb, 0]/2.0:    # check if in zone 1
-                    reductionFactor = axialIndAndNearRotor*\
-                                      np.power((rotorDiameter[turb]/(rotorDiameter[turb]+2*keArray[turb]*(mU[0])*np.maximum(0, deltax))), 2)
-                elif deltax > 0 and radiusLoc < wakeDiameters[loc, turb, 1]/2.0:    # check if in zone 2
-                    reductionFactor = axialIndAndNearRotor*\
-                                      np.power((rotorDiameter[turb]/(rotorDiameter[turb]+2*keArray[turb]*(mU[1])*np.maximum(0, deltax))), 2)
-                elif deltax > 0 and radiusLoc < wakeDiameters[loc, turb, 2]/2.0:    # check if in zone 3
-                    reductionFactor = axialIndAndNearRotor*\
-                                      np.power((rotorDiameter[turb]/(rotorDiameter[turb]+2*keArray[turb]*(mU[2])*np.maximum(0, deltax))), 2)
-                elif deltax <= 0 and radiusLoc < rotorDiameter[turb]/2.0:     # check if axial induction zone in front of rotor
-                    reductionFactor = axialIndAndNearRotor*(0.5+np.arctan(2.0*np.minimum(0, deltax)/(rotorDiameter[turb]))/np.pi)
-                else:
-                    reductionFactor = 0
-                self.ws_array[loc] *= (1-reductionFactor)
         #print 'ws_array in floris_power is: ', self.ws_array
         # find effective wind speeds at downstream turbines, then predict power downstream turbine
-        self.velocitiesTurbines = np.tile(Vinf, nTurbines)
-
-        for turbI in range(0, nTurbines):
-
-            # find overlap-area weighted effect of each wake zone
-            wakeEffCoeff = 0
-            for turb in range(0, nTurbines):
+        if not self.cullWakes:
+            # all pairs of turbines where TURBI is downstream of TURB
+            wakePairs = np.array(np.nonzero(turbineXw[:, np.newaxis] > turbineXw))
+            wakeOverlapTRel = wakeOverlapTRel[wakePairs[0], wakePairs[1]]
 
-                wakeEffCoeffPerZone = 0
-                deltax = turbineXw[turbI] - turbineXw[turb]
-
-                if deltax > 0:
-                    if useaUbU:
-                        mU = MU/np.cos(aU*np.pi/180+bU*yaw[turb])
-                    else:
-                        mU = MU
-                    for zone in range(0, 3):
-                        wakeEffCoeffPerZone = wakeEffCoeffPerZone + np.power((rotorDiameter[turb])/(rotorDiameter[turb]+2*keArray[turb]*mU[zone]*deltax), 2.0) * wakeOverlapTRel[turbI, turb, zone]
-
-                    wakeEffCoeff = wakeEffCoeff + np.power(axialInd[turb]*wakeEffCoeffPerZone, 2.0)
-
-            wakeEffCoeff = (1 - 2 * np.sqrt(wakeEffCoeff))
-
-            # multiply the inflow speed with the wake coefficients to find effective wind speed at turbine
-            self.velocitiesTurbines[turbI] *= wakeEffCoeff
+        self.velocitiesTurbines = calcTurbineVelocities(turbineXw, wakePairs, wakeOverlapTRel, rotorDiameter, axialInd,
+                                                        keArray, mUArray, Vinf)
 
         if self.verbose:
             print "wind speed at turbines %s [m/s]" % self.velocitiesTurbines
@@ -515,60 +676,1825 @@ class floris_power(Component):
             print "powers turbines %s [kW]" % self.wt_power
 
         self.power = np.sum(self.wt_power)
-        
 
-def CTtoAxialInd(CT):
-    if CT > 0.96: # Glauert condition
-        axial_induction = 0.143+np.sqrt(0.0203-0.6427*(0.889-CT))
-    else:
-        axial_induction = 0.5*(1-np.sqrt(1-CT))
-    return axial_induction
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
 
+        return ('wakeOverlapTRel', 'Ct', 'Cp', 'yaw', 'turbineXw', 'axialInduction'), \
+               ('velocitiesTurbines', 'wt_power', 'power')
 
-def calcOverlapAreas(turbineX,turbineY,rotorDiameter,wakeDiameters,wakeCenters):
-    """calculate overlap of rotors and wake zones (wake zone location defined by wake center and wake diameter)
-    turbineX,turbineY is x,y-location of center of rotor
+    def linearize_pairs(self):
+        """state and partial derivatives of the turbine velocities and powers, with the wake interactions given per
+        (TURBI,TURB) pair with TURBI downstream of TURB"""
 
-    wakeOverlap(TURBI,TURB,ZONEI) = overlap area of zone ZONEI of wake of turbine TURB with rotor of downstream turbine
-    TURBI"""
-
-    nTurbines = turbineY.size
-
-    wakeOverlap = np.zeros((nTurbines,nTurbines,3))
-
-    for turb in range(0,nTurbines):
-        for turbI in range(0,nTurbines):
-            if turbineX[turbI] > turbineX[turb]:
-                OVdYd = wakeCenters[turbI,turb]-turbineY[turbI]
-                OVr = rotorDiameter[turbI]/2
-                for zone in range(0,3):
-                    OVR = wakeDiameters[turbI,turb,zone]/2
-                    OVdYd = abs(OVdYd)
-                    if OVdYd != 0:
-                        OVL = (-np.power(OVr,2.0)+np.power(OVR,2.0)+np.power(OVdYd,2.0))/(2.0*OVdYd)
-                    else:
-                        OVL = 0
-
-                    OVz = np.power(OVR,2.0)-np.power(OVL,2.0)
-
-                    if OVz > 0:
-                        OVz = np.sqrt(OVz)
-                    else:
-                        OVz = 0
-
-                    if OVdYd < (OVr+OVR):
-                        if OVL < OVR and (OVdYd-OVL) < OVr:
-                            wakeOverlap[turbI,turb,zone] = np.power(OVR,2.0)*np.arccos(OVL/OVR) + np.power(OVr,2.0)*np.arccos((OVdYd-OVL)/OVr) - OVdYd*OVz
-                        elif OVR > OVr:
-                            wakeOverlap[turbI,turb,zone] = np.pi*np.power(OVr,2.0)
-                        else:
-                            wakeOverlap[turbI,turb,zone] = np.pi*np.power(OVR,2.0)
-                    else:
-                        wakeOverlap[turbI,turb,zone] = 0
-
-    for turb in range(0,nTurbines):
-        for turbI in range(0,nTurbines):
-            wakeOverlap[turbI,turb,2] = wakeOverlap[turbI,turb,2]-wakeOverlap[turbI,turb,1]
-            wakeOverlap[turbI,turb,1] = wakeOverlap[turbI,turb,1]-wakeOverlap[turbI,turb,0]
+        parameters = self.parameters
+        turbineXw = self.turbineXw
+        nTurbines = turbineXw.size
+        rotorDiameter = self.rotorDiameter
+        yaw = self.yaw*np.pi/180.
+        Vinf = self.wind_speed
 
-    return wakeOverlap
+        if self.cullWakes:
+            wakePairs = np.asarray(self.wakePairs, dtype=int)
+            wakeOverlapTRel = np.reshape(self.wakeOverlapTRel, (-1, 3))
+        else:
+            wakePairs = np.array(np.nonzero(turbineXw[:, np.newaxis] > turbineXw))
+            wakeOverlapTRel = np.reshape(self.wakeOverlapTRel, (nTurbines, 3, nTurbines)).transpose(0, 2, 1)
+            wakeOverlapTRel = wakeOverlapTRel[wakePairs[0], wakePairs[1]]
+        turbI, turb = wakePairs
+
+        # yaw corrected coefficients, axial induction and their derivatives
+        Ct, Cp, axialInd, dCtCorr_dCt, dCtCorr_dyaw, dCpCorr_dCp, dCpCorr_dyaw, dAxialInd_dCt = \
+            calcRotorCoefficients(self.Ct, self.Cp, yaw, self.axialInduction, parameters)
+
+        # wake recovery with array effects, as in execute
+        ke = parameters.ke + parameters.keCorrCT*(Ct-parameters.baselineCT)
+        s = np.bincount(turbI, weights=wakeOverlapTRel[:, 0]+wakeOverlapTRel[:, 1], minlength=nTurbines)
+        keArray = ke*(1+s*parameters.keCorrArray)
+        dkeArray_dCt = parameters.keCorrCT*(1+s*parameters.keCorrArray)
+        dkeArray_ds = ke*parameters.keCorrArray
+
+        if parameters.useaUbU:
+            angle = parameters.aU*np.pi/180+parameters.bU*yaw[:, np.newaxis]
+            mUArray = parameters.MU/np.cos(angle)
+            dmUArray_dyaw = mUArray*np.tan(angle)*parameters.bU
+        else:
+            mUArray = np.tile(parameters.MU, (nTurbines, 1))
+            dmUArray_dyaw = np.zeros((nTurbines, 3))
+
+        # velocity deficit of each pair, as in calcTurbineVelocities
+        deltax = (turbineXw[turbI]-turbineXw[turb])[:, np.newaxis]
+        denominator = rotorDiameter[turb][:, np.newaxis]+2*keArray[turb][:, np.newaxis]*mUArray[turb]*deltax
+        zoneCoeff = np.power(rotorDiameter[turb][:, np.newaxis]/denominator, 2.0)
+        wakeEffCoeffPerZone = np.sum(zoneCoeff*wakeOverlapTRel, 1)
+        pairDeficit = axialInd[turb]*wakeEffCoeffPerZone
+        deficit = np.sqrt(np.bincount(turbI, weights=pairDeficit**2, minlength=nTurbines))
+        velocitiesTurbines = Vinf*(1-2*deficit)
+
+        # the combined deficit is not differentiable where it vanishes, use the derivative of the wake-free side
+        with np.errstate(divide='ignore'):
+            dVelocity_dDeficitSq = np.where(deficit > 0, -Vinf/deficit, 0.0)
+
+        powerCoeff = 0.5*self.air_density*np.pi*rotorDiameter**2/4.*self.generator_efficiency/1000
+        dPower_dVelocity = 3*np.power(velocitiesTurbines, 2.0)*powerCoeff*Cp
+        dPower_dCpCorr = np.power(velocitiesTurbines, 3.0)*powerCoeff
+
+        return dict(turbI=turbI, turb=turb, wakeOverlapTRel=wakeOverlapTRel, dCtCorr_dCt=dCtCorr_dCt,
+                    dCtCorr_dyaw=dCtCorr_dyaw, dCpCorr_dCp=dCpCorr_dCp, dCpCorr_dyaw=dCpCorr_dyaw, axialInd=axialInd,
+                    dAxialInd_dCt=dAxialInd_dCt, keArray=keArray, dkeArray_dCt=dkeArray_dCt, dkeArray_ds=dkeArray_ds,
+                    mUArray=mUArray, dmUArray_dyaw=dmUArray_dyaw, deltax=deltax, denominator=denominator,
+                    zoneCoeff=zoneCoeff, wakeEffCoeffPerZone=wakeEffCoeffPerZone, pairDeficit=pairDeficit,
+                    dVelocity_dDeficitSq=dVelocity_dDeficitSq, dPower_dVelocity=dPower_dVelocity,
+                    dPower_dCpCorr=dPower_dCpCorr)
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        nTurbines = self.turbineXw.size
+        lin = self.linearize_pairs()
+        turbI = lin['turbI']
+        turb = lin['turb']
+
+        def perturbation(name):
+            if name in arg:
+                return np.ravel(arg[name])
+            return np.zeros(nTurbines)
+
+        dCt = perturbation('Ct')
+        dCp = perturbation('Cp')
+        dyaw = perturbation('yaw')*np.pi/180.
+        dX = perturbation('turbineXw')
+        if 'wakeOverlapTRel' in arg and self.cullWakes:
+            dOverlap = np.reshape(arg['wakeOverlapTRel'], (-1, 3))
+            ds = np.bincount(turbI, weights=dOverlap[:, 0]+dOverlap[:, 1], minlength=nTurbines)
+        elif 'wakeOverlapTRel' in arg:
+            # the array effect sums over all entries of the overlap matrix, the deficit only over downstream pairs
+            dOverlap = np.reshape(arg['wakeOverlapTRel'], (nTurbines, 3, nTurbines)).transpose(0, 2, 1)
+            ds = np.sum(dOverlap[:, :, 0]+dOverlap[:, :, 1], 1)
+            dOverlap = dOverlap[turbI, turb]
+        else:
+            dOverlap = np.zeros((turbI.size, 3))
+            ds = np.zeros(nTurbines)
+
+        dCtCorr = lin['dCtCorr_dCt']*dCt + lin['dCtCorr_dyaw']*dyaw
+        if self.parameters.axialIndProvided:
+            dAxialInd = perturbation('axialInduction')
+        else:
+            dAxialInd = lin['dAxialInd_dCt']*dCtCorr
+        dkeArray = lin['dkeArray_dCt']*dCtCorr + lin['dkeArray_ds']*ds
+        dmUArray = lin['dmUArray_dyaw']*dyaw[:, np.newaxis]
+
+        deltax = lin['deltax']
+        dDenominator = 2*(dkeArray[turb][:, np.newaxis]*lin['mUArray'][turb]*deltax +
+                          lin['keArray'][turb][:, np.newaxis]*dmUArray[turb]*deltax +
+                          lin['keArray'][turb][:, np.newaxis]*lin['mUArray'][turb]*(dX[turbI]-dX[turb])[:, np.newaxis])
+        dZoneCoeff = -2*lin['zoneCoeff']/lin['denominator']*dDenominator
+        dWakeEffCoeffPerZone = np.sum(lin['zoneCoeff']*dOverlap + dZoneCoeff*lin['wakeOverlapTRel'], 1)
+        dPairDeficit = dAxialInd[turb]*lin['wakeEffCoeffPerZone'] + lin['axialInd'][turb]*dWakeEffCoeffPerZone
+        dVelocity = lin['dVelocity_dDeficitSq']*np.bincount(turbI, weights=2*lin['pairDeficit']*dPairDeficit,
+                                                            minlength=nTurbines)
+
+        dPower = lin['dPower_dVelocity']*dVelocity + \
+                 lin['dPower_dCpCorr']*(lin['dCpCorr_dCp']*dCp + lin['dCpCorr_dyaw']*dyaw)
+
+        if 'velocitiesTurbines' in result:
+            result['velocitiesTurbines'] += dVelocity.reshape(np.shape(result['velocitiesTurbines']))
+        if 'wt_power' in result:
+            result['wt_power'] += dPower.reshape(np.shape(result['wt_power']))
+        if 'power' in result:
+            result['power'] += np.sum(dPower)
+
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
+
+        nTurbines = self.turbineXw.size
+        lin = self.linearize_pairs()
+        turbI = lin['turbI']
+        turb = lin['turb']
+
+        sPower = np.zeros(nTurbines)
+        sVelocity = np.zeros(nTurbines)
+        if 'wt_power' in arg:
+            sPower += np.ravel(arg['wt_power'])
+        if 'power' in arg:
+            sPower += np.sum(arg['power'])
+        if 'velocitiesTurbines' in arg:
+            sVelocity += np.ravel(arg['velocitiesTurbines'])
+        sVelocity += lin['dPower_dVelocity']*sPower
+        sCpCorr = lin['dPower_dCpCorr']*sPower
+
+        sPairDeficit = (lin['dVelocity_dDeficitSq']*sVelocity)[turbI]*2*lin['pairDeficit']
+        sAxialInd = np.bincount(turb, weights=sPairDeficit*lin['wakeEffCoeffPerZone'], minlength=nTurbines)
+        sWakeEffCoeffPerZone = sPairDeficit*lin['axialInd'][turb]
+        sOverlap = sWakeEffCoeffPerZone[:, np.newaxis]*lin['zoneCoeff']
+        sZoneCoeff = sWakeEffCoeffPerZone[:, np.newaxis]*lin['wakeOverlapTRel']
+        sDenominator = -2*lin['zoneCoeff']/lin['denominator']*sZoneCoeff
+
+        deltax = lin['deltax']
+        keArray = lin['keArray'][turb][:, np.newaxis]
+        sDeltax = np.sum(2*sDenominator*keArray*lin['mUArray'][turb], 1)
+        skeArray = np.bincount(turb, weights=np.sum(2*sDenominator*lin['mUArray'][turb]*deltax, 1),
+                               minlength=nTurbines)
+        smUArray = np.zeros((nTurbines, 3))
+        for zone in range(0, 3):
+            smUArray[:, zone] = np.bincount(turb, weights=2*sDenominator[:, zone]*keArray[:, 0]*deltax[:, 0],
+                                            minlength=nTurbines)
+
+        sCtCorr = lin['dkeArray_dCt']*skeArray
+        ss = lin['dkeArray_ds']*skeArray
+        if not self.parameters.axialIndProvided:
+            sCtCorr += lin['dAxialInd_dCt']*sAxialInd
+
+        syaw = lin['dCtCorr_dyaw']*sCtCorr + lin['dCpCorr_dyaw']*sCpCorr + np.sum(lin['dmUArray_dyaw']*smUArray, 1)
+
+        if 'Ct' in result:
+            result['Ct'] += (lin['dCtCorr_dCt']*sCtCorr).reshape(np.shape(result['Ct']))
+        if 'Cp' in result:
+            result['Cp'] += (lin['dCpCorr_dCp']*sCpCorr).reshape(np.shape(result['Cp']))
+        if 'yaw' in result:
+            result['yaw'] += (syaw*np.pi/180.).reshape(np.shape(result['yaw']))
+        if 'axialInduction' in result and self.parameters.axialIndProvided:
+            result['axialInduction'] += sAxialInd.reshape(np.shape(result['axialInduction']))
+        if 'turbineXw' in result:
+            sX = np.bincount(turbI, weights=sDeltax, minlength=nTurbines) - \
+                 np.bincount(turb, weights=sDeltax, minlength=nTurbines)
+            result['turbineXw'] += sX.reshape(np.shape(result['turbineXw']))
+        if 'wakeOverlapTRel' in result:
+            if self.cullWakes:
+                sOverlap[:, 0:2] += ss[turbI][:, np.newaxis]
+            else:
+                # pair format to vector format, ordered by TURBI, then ZONEI, then TURB, the array effect sums over
+                # all entries of the overlap matrix
+                sOverlapPairs = sOverlap
+                sOverlap = np.zeros((nTurbines, nTurbines, 3))
+                sOverlap[turbI, turb] = sOverlapPairs
+                sOverlap[:, :, 0:2] += ss[:, np.newaxis, np.newaxis]
+                sOverlap = sOverlap.transpose(0, 2, 1)
+            result['wakeOverlapTRel'] += sOverlap.reshape(np.shape(result['wakeOverlapTRel']))
+
+
+class floris_samples(Component):
+    """ Calculates the wind speed at the sample locations from the solved state of the turbines (thrust coefficient,
+    axial induction and wake expansion coefficient as found by floris_power, floris_sweep or floris_directions), only
+    the wakes at the samples are evaluated """
+
+    parameters = VarTree(FLORISParameters(), iotype='in')
+
+    # Flow property variables
+    wind_speed = Float(iotype='in', units='m/s', desc='free stream wind velocity')
+
+    def __init__(self, nTurbines, nSamples, sampleMemory=0, sampleDtype='float', nThreads=1, cullWakes=False):
+        super(floris_samples, self).__init__()
+
+        # memory budget (bytes) for the per-sample wake arrays, if positive the samples are evaluated in tiles, shared
+        # by nThreads threads
+        self.sampleMemory = sampleMemory
+        self.nThreads = nThreads
+
+        # if True, each turbine only visits the samples near its wake (see calcSampleVelocitiesCulled)
+        self.cullWakes = cullWakes
+
+        # Explicitly size input arrays
+        self.add('turbineXw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='X positions of turbines in the wind direction reference frame'))
+        self.add('turbineYw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='Y positions of turbines in the wind direction reference frame'))
+        self.add('hubHeight', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                    desc='hub heights of all turbines'))
+        self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='rotor diameters of all turbines'))
+        self.add('yaw', Array(np.zeros(nTurbines), iotype='in', desc='yaw of each turbine', units='deg'))
+        self.add('Ct', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                             desc='thrust coefficient of each turbine as given by the rotor model'))
+        self.add('axialInd', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                   desc='axial induction of each turbine'))
+        self.add('keArray', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                  desc='wake expansion coefficient of each turbine'))
+        self.add('wsw_position', Array(np.zeros([3, nSamples], dtype=sampleDtype), iotype='in', units='m', dtype=sampleDtype, desc='positions where measurements are desired in the windframe'))
+
+        # Explicitly size output arrays
+        self.add('ws_array', Array(np.zeros(nSamples, dtype=sampleDtype), iotype='out', units='m/s', dtype=sampleDtype, desc='wind speed at measurement locations'))
+
+    def execute(self):
+
+        parameters = self.parameters
+        nTurbines = self.turbineXw.size
+        yaw = self.yaw*np.pi/180.
+
+        velX = self.wsw_position[0][:]
+        velY = self.wsw_position[1][:]
+        velZ = self.wsw_position[2][:]
+
+        # recovery coefficients of each wake zone of each turbine, as in floris_power
+        if parameters.useaUbU:
+            mUArray = parameters.MU/np.cos(parameters.aU*np.pi/180+parameters.bU*yaw[:, np.newaxis])
+        else:
+            mUArray = np.tile(parameters.MU, (nTurbines, 1))
+
+        if self.sampleMemory > 0:
+            chunkSize = calcSampleChunkSize(nTurbines, self.sampleMemory/max(self.nThreads, 1), velX.dtype.itemsize)
+        else:
+            chunkSize = max(velX.size, 1)
+
+        self.ws_array = calcSampleVelocitiesChunked(velX, velY, velZ, self.turbineXw, self.turbineYw, self.hubHeight,
+                                                    self.rotorDiameter, yaw, self.Ct, self.axialInd, self.keArray,
+                                                    mUArray, self.wind_speed, parameters, chunkSize, self.nThreads,
+                                                    self.cullWakes)
+
+
+class floris_grid(Component):
+    """ Calculates the wind speed on a structured grid of samples from the solved state of the turbines, as
+    floris_samples. The grid axes point downwind, crosswind and up, so the wakes are evaluated once per downwind
+    coordinate of the grid. """
+
+    parameters = VarTree(FLORISParameters(), iotype='in')
+
+    # Flow property variables
+    wind_speed = Float(iotype='in', units='m/s', desc='free stream wind velocity')
+    wind_direction = Float(iotype='in', units='deg', desc='wind direction using direction to, in deg. ccw from east')
+
+    # grid specification
+    gridHeight = Float(iotype='in', units='m', desc='height of the lowest grid layer')
+
+    def __init__(self, nTurbines, gridShape, sampleDtype='float'):
+        super(floris_grid, self).__init__()
+
+        # number of grid points downwind, crosswind and, for a 3D grid, vertically
+        self.gridShape = tuple(gridShape)
+        self.sampleDtype = sampleDtype
+
+        # Explicitly size input arrays
+        self.add('gridOrigin', Array(np.zeros(2), iotype='in', dtype='float', units='m', \
+                                     desc='x and y position of the first grid point in original ref. frame'))
+        self.add('gridSpacing', Array(np.zeros(3), iotype='in', dtype='float', units='m', \
+                                      desc='distance between grid points downwind, crosswind and vertically'))
+        self.add('turbineXw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='X positions of turbines in the wind direction reference frame'))
+        self.add('turbineYw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='Y positions of turbines in the wind direction reference frame'))
+        self.add('hubHeight', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                    desc='hub heights of all turbines'))
+        self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='rotor diameters of all turbines'))
+        self.add('yaw', Array(np.zeros(nTurbines), iotype='in', desc='yaw of each turbine', units='deg'))
+        self.add('Ct', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                             desc='thrust coefficient of each turbine as given by the rotor model'))
+        self.add('axialInd', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                   desc='axial induction of each turbine'))
+        self.add('keArray', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                  desc='wake expansion coefficient of each turbine'))
+
+        # Explicitly size output arrays
+        self.add('ws_grid', Array(np.zeros(gridShape, dtype=sampleDtype), iotype='out', units='m/s', dtype=sampleDtype, desc='wind speed at the grid points'))
+
+    def execute(self):
+
+        parameters = self.parameters
+        nTurbines = self.turbineXw.size
+        yaw = self.yaw*np.pi/180.
+
+        gridX, gridY, gridZ = calcGridAxes(self.gridOrigin, self.gridSpacing, self.gridShape, self.gridHeight,
+                                           self.wind_direction, self.sampleDtype)
+
+        # recovery coefficients of each wake zone of each turbine, as in floris_power
+        if parameters.useaUbU:
+            mUArray = parameters.MU/np.cos(parameters.aU*np.pi/180+parameters.bU*yaw[:, np.newaxis])
+        else:
+            mUArray = np.tile(parameters.MU, (nTurbines, 1))
+
+        ws_grid = calcGridVelocities(gridX, gridY, gridZ, self.turbineXw, self.turbineYw, self.hubHeight,
+                                     self.rotorDiameter, yaw, self.Ct, self.axialInd, self.keArray, mUArray,
+                                     self.wind_speed, parameters)
+
+        self.ws_grid = ws_grid.reshape(self.gridShape)
+
+
+class floris_sweep(Component):
+    """ Solves the effective wind speed, rotor coefficients and power of each turbine in a single sweep from the most
+    upstream to the most downstream turbine (replaces the fixed point iteration over rotor_CPCT, floris_wcent_wdiam,
+    floris_overlap and floris_power). The derivatives of the powers are finite differences of the sweep, see
+    calcSweepPowerGradients, unlike the analytic derivatives of the components it replaces. """
+
+    parameters = VarTree(FLORISParameters(), iotype='in')
+    verbose = Bool(False, iotype='in', desc='verbosity of FLORIS, False is no output')
+
+    # Flow property variables
+    wind_speed = Float(iotype='in', units='m/s', desc='free stream wind velocity')
+    air_density = Float(iotype='in', units='kg/(m*m*m)', desc='air density in free stream')
+
+    # rotor property variables
+    pP = Float(3.0, iotype='in', desc='yaw correction exponent of the rotor power coefficient')
+
+    power = Float(iotype='out', units='kW', desc='total power output of the wind farm')
+
+    def __init__(self, nTurbines, datasize=0, cacheSize=0, fdStep=1e-6, fdForm='forward'):
+        super(floris_sweep, self).__init__()
+
+        # number of converged turbine states kept for repeated evaluations, see PowerCache
+        self.cache = PowerCache(cacheSize)
+
+        # step and form ('forward' or 'central') of the finite differences of the derivatives, which are evaluated
+        # for all perturbations at once, see calcSweepPowerGradients
+        self.fdStep = fdStep
+        self.fdForm = fdForm
+        self.powerGradients = None
+
+        # Explicitly size input arrays
+        self.add('windSpeedToCPCT', VarTree(windSpeedToCPCT(datasize), iotype='in', desc='pre-calculated CPCT'))
+        self.add('turbineXw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='X positions of turbines in the wind direction reference frame'))
+        self.add('turbineYw', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                    desc='Y positions of turbines in the wind direction reference frame'))
+        self.add('yaw', Array(np.zeros(nTurbines), iotype='in', desc='yaw of each turbine', units='deg'))
+        self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='rotor diameters of all turbines'))
+        self.add('axialInduction', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                         desc='axial induction of all turbines'))
+        self.add('generator_efficiency', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                               desc='generator efficiency of all turbines'))
+
+        # Explicitly size output arrays
+        self.add('CP', Array(np.zeros(nTurbines), iotype='out', desc='power coefficient of each turbine'))
+        self.add('CT', Array(np.zeros(nTurbines), iotype='out', desc='thrust coefficient of each turbine'))
+        self.add('velocitiesTurbines', Array(np.zeros(nTurbines), iotype='out', units='m/s'))
+        self.add('wt_power', Array(np.zeros(nTurbines), iotype='out', units='kW'))
+        self.add('axialInd', Array(np.zeros(nTurbines), iotype='out', desc='axial induction of each turbine'))
+        self.add('keArray', Array(np.zeros(nTurbines), iotype='out', desc='wake expansion coefficient of each turbine'))
+
+    def execute(self):
+
+        self.velocitiesTurbines, self.CP, self.CT, self.wt_power, self.axialInd, self.keArray = \
+            calcSweepPower(self.turbineXw, self.turbineYw, self.yaw, self.rotorDiameter, self.axialInduction,
+                           self.generator_efficiency, self.wind_speed, self.air_density, self.pP,
+                           self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT,
+                           self.parameters, cache=self.cache)
+        self.powerGradients = None
+
+        if self.verbose:
+            print "wind speed at turbines %s [m/s]" % self.velocitiesTurbines
+            print "C_P turbines %s" % self.CP
+            print "C_T turbines %s" % self.CT
+            print "powers turbines %s [kW]" % self.wt_power
+
+        self.power = np.sum(self.wt_power)
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineXw', 'turbineYw', 'yaw'), ('wt_power', 'power')
+
+    def linearize_power(self):
+        """finite difference derivatives of wt_power with respect to turbineXw, turbineYw and yaw, evaluated once per
+        execution (calcSweepPowerGradients for a wind direction of zero, where the wind direction reference frame is
+        the original reference frame)"""
+
+        if self.powerGradients is None:
+            self.powerGradients = \
+                calcSweepPowerGradients(self.turbineXw, self.turbineYw, 0.0, self.yaw, self.rotorDiameter,
+                                        self.axialInduction, self.generator_efficiency, self.wind_speed,
+                                        self.air_density, self.pP, self.windSpeedToCPCT.wind_speed,
+                                        self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT, self.parameters,
+                                        self.fdStep, self.fdForm)
+
+        return self.powerGradients
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        frameArg = dict((sweepFrameNames.get(name, name), value) for name, value in arg.items())
+        dPower = applyPowerGradients(self.linearize_power(), frameArg, (1, self.yaw.size))[0]
+
+        if 'wt_power' in result:
+            result['wt_power'] += dPower.reshape(np.shape(result['wt_power']))
+        if 'power' in result:
+            result['power'] += np.sum(dPower)
+
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
+
+        sPower = np.zeros((1, self.yaw.size))
+        if 'wt_power' in arg:
+            sPower += np.reshape(arg['wt_power'], sPower.shape)
+        if 'power' in arg:
+            sPower += np.sum(arg['power'])
+
+        frameResult = dict((sweepFrameNames.get(name, name), value) for name, value in result.items())
+        applyPowerGradientsT(self.linearize_power(), sPower, frameResult)
+
+
+
+class floris_directions(Component):
+    """ Solves the effective wind speed, rotor coefficients and power of each turbine for all wind directions at once,
+    with the wind directions as leading array axis (replaces floris_windframe and floris_sweep, or the fixed point
+    iteration, of each direction). The derivatives of the powers are finite differences of the sweep, with the step
+    and form given by fdStep and fdForm (forward by default), see calcSweepPowerGradients; unlike the wake chain of
+    the fixed point iteration they are not analytic. """
+
+    parameters = VarTree(FLORISParameters(), iotype='in')
+    verbose = Bool(False, iotype='in', desc='verbosity of FLORIS, False is no output')
+
+    # Flow property variables
+    air_density = Float(iotype='in', units='kg/(m*m*m)', desc='air density in free stream')
+
+    # rotor property variables
+    pP = Float(3.0, iotype='in', desc='yaw correction exponent of the rotor power coefficient')
+
+    def __init__(self, nTurbines, nDirections, datasize=0, nProcesses=1, fdStep=1e-6, fdForm='forward', cacheSize=0):
+        super(floris_directions, self).__init__()
+
+        # number of converged turbine states kept for repeated evaluations, see PowerCache
+        self.cache = PowerCache(cacheSize)
+
+        # number of worker processes the directions are spread over, 1 solves all directions in this process
+        self.nProcesses = nProcesses
+
+        # step and form ('forward' or 'central') of the finite differences of the derivatives, which are evaluated
+        # for all perturbations at once, see calcSweepPowerGradients
+        self.fdStep = fdStep
+        self.fdForm = fdForm
+        self.powerGradients = None
+
+        # Explicitly size input arrays
+        self.add('windSpeedToCPCT', VarTree(windSpeedToCPCT(datasize), iotype='in', desc='pre-calculated CPCT'))
+        self.add('turbineX', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                   desc='x positions of turbines in original ref. frame'))
+        self.add('turbineY', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                   desc='y positions of turbines in original ref. frame'))
+        self.add('wind_directions', Array(np.zeros(nDirections), iotype='in', dtype='float', units='deg', \
+                                          desc='wind directions in degrees ccw from east'))
+        self.add('wind_speeds', Array(np.zeros(nDirections), iotype='in', dtype='float', units='m/s', \
+                                      desc='free stream wind velocity for each direction'))
+        self.add('yaw', Array(np.zeros([nDirections, nTurbines]), iotype='in', units='deg', \
+                              desc='yaw of each turbine for each direction'))
+        self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='rotor diameters of all turbines'))
+        self.add('axialInduction', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                         desc='axial induction of all turbines'))
+        self.add('generator_efficiency', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                               desc='generator efficiency of all turbines'))
+
+        # Explicitly size output arrays
+        self.add('turbineXw', Array(np.zeros([nDirections, nTurbines]), iotype='out', units='m', \
+                                    desc='X positions of turbines in the wind direction reference frame'))
+        self.add('turbineYw', Array(np.zeros([nDirections, nTurbines]), iotype='out', units='m', \
+                                    desc='Y positions of turbines in the wind direction reference frame'))
+        self.add('CP', Array(np.zeros([nDirections, nTurbines]), iotype='out', \
+                             desc='power coefficient of each turbine for each direction'))
+        self.add('CT', Array(np.zeros([nDirections, nTurbines]), iotype='out', \
+                             desc='thrust coefficient of each turbine for each direction'))
+        self.add('velocitiesTurbines', Array(np.zeros([nDirections, nTurbines]), iotype='out', units='m/s'))
+        self.add('wt_power', Array(np.zeros([nDirections, nTurbines]), iotype='out', units='kW'))
+        self.add('power', Array(np.zeros(nDirections), iotype='out', units='kW', \
+                                desc='total power output of the wind farm for each direction'))
+        self.add('axialInd', Array(np.zeros([nDirections, nTurbines]), iotype='out', \
+                                   desc='axial induction of each turbine for each direction'))
+        self.add('keArray', Array(np.zeros([nDirections, nTurbines]), iotype='out', \
+                                  desc='wake expansion coefficient of each turbine for each direction'))
+
+    def execute(self):
+
+        self.turbineXw, self.turbineYw = calcWindFrame(self.turbineX, self.turbineY, self.wind_directions)
+
+        self.velocitiesTurbines, self.CP, self.CT, self.wt_power, self.axialInd, self.keArray = \
+            calcSweepPower(self.turbineXw, self.turbineYw, self.yaw, self.rotorDiameter, self.axialInduction,
+                           self.generator_efficiency, self.wind_speeds, self.air_density, self.pP,
+                           self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT,
+                           self.parameters, self.nProcesses, self.cache)
+        self.powerGradients = None
+
+        if self.verbose:
+            print "wind directions %s deg" % self.wind_directions
+            print "wind speed at turbines %s [m/s]" % self.velocitiesTurbines
+            print "C_P turbines %s" % self.CP
+            print "C_T turbines %s" % self.CT
+            print "powers turbines %s [kW]" % self.wt_power
+
+        self.power = np.sum(self.wt_power, axis=1)
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineX', 'turbineY', 'yaw'), ('wt_power', 'power')
+
+    def linearize_power(self):
+        """finite difference derivatives of wt_power with respect to turbineX, turbineY and yaw, evaluated once per
+        execution"""
+
+        if self.powerGradients is None:
+            self.powerGradients = \
+                calcSweepPowerGradients(self.turbineX, self.turbineY, self.wind_directions, self.yaw,
+                                        self.rotorDiameter, self.axialInduction, self.generator_efficiency,
+                                        self.wind_speeds, self.air_density, self.pP, self.windSpeedToCPCT.wind_speed,
+                                        self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT, self.parameters,
+                                        self.fdStep, self.fdForm, self.nProcesses)
+
+        return self.powerGradients
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        dPower = applyPowerGradients(self.linearize_power(), arg, self.yaw.shape)
+
+        if 'wt_power' in result:
+            result['wt_power'] += dPower.reshape(np.shape(result['wt_power']))
+        if 'power' in result:
+            result['power'] += np.sum(dPower, axis=1).reshape(np.shape(result['power']))
+
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
+
+        sPower = np.zeros(self.yaw.shape)
+        if 'wt_power' in arg:
+            sPower += np.reshape(arg['wt_power'], sPower.shape)
+        if 'power' in arg:
+            sPower += np.reshape(arg['power'], (-1, 1))
+
+        applyPowerGradientsT(self.linearize_power(), sPower, result)
+
+
+class floris_windrose(Component):
+    """ Solves the effective wind speed, rotor coefficients and power of each turbine for all combinations of wind
+    direction and wind speed bin of a joint windrose, and the resulting AEP. Turbine positions and their upstream
+    ordering are computed once per direction and shared by all speed bins. As in floris_directions, the derivatives
+    of the powers are finite differences of the sweep given by fdStep and fdForm, see calcSweepPowerGradients. """
+
+    parameters = VarTree(FLORISParameters(), iotype='in')
+    verbose = Bool(False, iotype='in', desc='verbosity of FLORIS, False is no output')
+
+    # Flow property variables
+    air_density = Float(iotype='in', units='kg/(m*m*m)', desc='air density in free stream')
+
+    # rotor property variables
+    pP = Float(3.0, iotype='in', desc='yaw correction exponent of the rotor power coefficient')
+
+    AEP = Float(iotype='out', units='kW', desc='total annual energy output of wind farm')
+
+    def __init__(self, nTurbines, nDirections, nSpeeds, datasize=0, nProcesses=1, fdStep=1e-6, fdForm='forward',
+                 cacheSize=0):
+        super(floris_windrose, self).__init__()
+
+        # number of converged turbine states kept for repeated evaluations, see PowerCache
+        self.cache = PowerCache(cacheSize)
+
+        # number of worker processes the directions are spread over, 1 solves all directions in this process
+        self.nProcesses = nProcesses
+
+        # step and form ('forward' or 'central') of the finite differences of the derivatives, which are evaluated
+        # for all perturbations at once, see calcSweepPowerGradients
+        self.fdStep = fdStep
+        self.fdForm = fdForm
+        self.powerGradients = None
+
+        # Explicitly size input arrays
+        self.add('windSpeedToCPCT', VarTree(windSpeedToCPCT(datasize), iotype='in', desc='pre-calculated CPCT'))
+        self.add('turbineX', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                   desc='x positions of turbines in original ref. frame'))
+        self.add('turbineY', Array(np.zeros(nTurbines), iotype='in', dtype='float', units='m', \
+                                   desc='y positions of turbines in original ref. frame'))
+        self.add('wind_directions', Array(np.zeros(nDirections), iotype='in', dtype='float', units='deg', \
+                                          desc='wind directions in degrees ccw from east'))
+        self.add('wind_speeds', Array(np.zeros(nSpeeds), iotype='in', dtype='float', units='m/s', \
+                                      desc='free stream wind velocity of each speed bin'))
+        self.add('windrose_frequencies', Array(np.zeros([nDirections, nSpeeds]), iotype='in', dtype='float', \
+                                               desc='frequency of each combination of wind direction and speed bin'))
+        self.add('yaw', Array(np.zeros([nDirections, nTurbines]), iotype='in', units='deg', \
+                              desc='yaw of each turbine for each direction'))
+        self.add('rotorDiameter', Array(np.zeros(nTurbines), dtype='float', iotype='in', units='m', \
+                                        desc='rotor diameters of all turbines'))
+        self.add('axialInduction', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                         desc='axial induction of all turbines'))
+        self.add('generator_efficiency', Array(np.zeros(nTurbines), iotype='in', dtype='float', \
+                                               desc='generator efficiency of all turbines'))
+
+        # Explicitly size output arrays
+        self.add('CP', Array(np.zeros([nDirections, nSpeeds, nTurbines]), iotype='out', \
+                             desc='power coefficient of each turbine for each direction and speed bin'))
+        self.add('CT', Array(np.zeros([nDirections, nSpeeds, nTurbines]), iotype='out', \
+                             desc='thrust coefficient of each turbine for each direction and speed bin'))
+        self.add('velocitiesTurbines', Array(np.zeros([nDirections, nSpeeds, nTurbines]), iotype='out', units='m/s'))
+        self.add('wt_power', Array(np.zeros([nDirections, nSpeeds, nTurbines]), iotype='out', units='kW'))
+        self.add('power', Array(np.zeros([nDirections, nSpeeds]), iotype='out', units='kW', \
+                                desc='total power output of the wind farm for each direction and speed bin'))
+        self.add('frequencies_directions', Array(np.zeros(nDirections), iotype='out', \
+                                                 desc='frequency of each direction over all speed bins'))
+        self.add('power_directions', Array(np.zeros(nDirections), iotype='out', units='kW', \
+                                           desc='frequency weighted mean power of each direction over all speed bins'))
+
+    def execute(self):
+
+        frequencies = self.windrose_frequencies
+
+        # turbine positions are shared by all speed bins of a direction
+        turbineXw, turbineYw = calcWindFrame(self.turbineX, self.turbineY, self.wind_directions)
+        Vinf = np.tile(self.wind_speeds, (turbineXw.shape[0], 1))
+
+        self.velocitiesTurbines, self.CP, self.CT, self.wt_power = \
+            calcSweepPower(turbineXw, turbineYw, self.yaw, self.rotorDiameter, self.axialInduction,
+                           self.generator_efficiency, Vinf, self.air_density, self.pP, self.windSpeedToCPCT.wind_speed,
+                           self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT, self.parameters, self.nProcesses,
+                           self.cache)[:4]
+        self.powerGradients = None
+
+        if self.verbose:
+            print "wind directions %s deg" % self.wind_directions
+            print "wind speeds %s [m/s]" % self.wind_speeds
+            print "wind speed at turbines %s [m/s]" % self.velocitiesTurbines
+
+        self.power = np.sum(self.wt_power, axis=2)
+
+        # reduce the speed bins of each direction, so that sum(power_directions*frequencies_directions) is the
+        # frequency weighted power of the whole windrose
+        self.frequencies_directions = np.sum(frequencies, axis=1)
+        weightedPower = np.sum(self.power*frequencies, axis=1)
+        self.power_directions = np.where(self.frequencies_directions > 0, weightedPower, 0.0) / \
+                                np.where(self.frequencies_directions > 0, self.frequencies_directions, 1.0)
+
+        # number of hours in a year
+        hours = 8760.0
+        self.AEP = np.sum(weightedPower)*hours
+
+        if self.verbose:
+            print "power of the wind farm %s [kW]" % self.power
+            print "AEP %s" % self.AEP
+
+    def list_deriv_vars(self):
+        """specifies the inputs and outputs where derivatives are defined"""
+
+        return ('turbineX', 'turbineY', 'yaw'), ('wt_power', 'power', 'power_directions', 'AEP')
+
+    def linearize_power(self):
+        """finite difference derivatives of wt_power with respect to turbineX, turbineY and yaw, evaluated once per
+        execution"""
+
+        if self.powerGradients is None:
+            Vinf = np.tile(self.wind_speeds, (self.wind_directions.size, 1))
+            self.powerGradients = \
+                calcSweepPowerGradients(self.turbineX, self.turbineY, self.wind_directions, self.yaw,
+                                        self.rotorDiameter, self.axialInduction, self.generator_efficiency, Vinf,
+                                        self.air_density, self.pP, self.windSpeedToCPCT.wind_speed,
+                                        self.windSpeedToCPCT.CP, self.windSpeedToCPCT.CT, self.parameters,
+                                        self.fdStep, self.fdForm, self.nProcesses)
+
+        return self.powerGradients
+
+    def apply_deriv(self, arg, result):
+        """matrix-free product of the Jacobian with the input perturbations in arg"""
+
+        frequencies = self.windrose_frequencies
+        frequencies_directions = np.sum(frequencies, axis=1)
+
+        dPower = applyPowerGradients(self.linearize_power(), arg, self.yaw.shape)
+        dWeightedPower = np.sum(np.sum(dPower, axis=2)*frequencies, axis=1)
+
+        if 'wt_power' in result:
+            result['wt_power'] += dPower.reshape(np.shape(result['wt_power']))
+        if 'power' in result:
+            result['power'] += np.sum(dPower, axis=2).reshape(np.shape(result['power']))
+        if 'power_directions' in result:
+            dPowerDirections = np.where(frequencies_directions > 0, dWeightedPower, 0.0) / \
+                               np.where(frequencies_directions > 0, frequencies_directions, 1.0)
+            result['power_directions'] += dPowerDirections.reshape(np.shape(result['power_directions']))
+        if 'AEP' in result:
+            result['AEP'] += np.sum(dWeightedPower)*8760.0
+
+    def apply_derivT(self, arg, result):
+        """matrix-free product of the transposed Jacobian with the output seeds in arg"""
+
+        frequencies = self.windrose_frequencies
+        frequencies_directions = np.sum(frequencies, axis=1)
+        nDirections, nSpeeds = frequencies.shape
+
+        # seeds of the frequency weighted power of each direction, and of the power of each direction and speed bin
+        sWeightedPower = np.zeros(nDirections)
+        if 'power_directions' in arg:
+            sWeightedPower += np.where(frequencies_directions > 0, np.ravel(arg['power_directions']), 0.0) / \
+                              np.where(frequencies_directions > 0, frequencies_directions, 1.0)
+        if 'AEP' in arg:
+            sWeightedPower += arg['AEP']*8760.0
+        sPowerSpeeds = sWeightedPower[:, np.newaxis]*frequencies
+        if 'power' in arg:
+            sPowerSpeeds += np.reshape(arg['power'], (nDirections, nSpeeds))
+
+        sPower = np.repeat(sPowerSpeeds[:, :, np.newaxis], self.yaw.shape[1], axis=2)
+        if 'wt_power' in arg:
+            sPower += np.reshape(arg['wt_power'], sPower.shape)
+
+        applyPowerGradientsT(self.linearize_power(), sPower, result)
+
+
+def setKernelBackend(backend):
+    """select the implementation of calcZoneOverlap, calcSampleVelocities, calcSampleVelocitiesChunked and
+    calcTurbineVelocities: 'numpy', 'numba' (compiled loops, requires numba) or 'auto' (numba when it is installed)"""
+
+    global kernelBackend
+
+    if backend == 'auto':
+        backend = 'numba' if numba_kernels.available else 'numpy'
+    if backend not in ('numpy', 'numba'):
+        raise ValueError("unknown kernel backend '%s', use 'numpy', 'numba' or 'auto'" % backend)
+    if backend == 'numba' and not numba_kernels.available:
+        raise ValueError("the numba kernel backend requires numba to be installed")
+
+    kernelBackend = backend
+
+
+def calcWakeParameters(yaw, Ct, rotorDiameter, parameters):
+    """calculate the initial wake angle, initial wake diameter and wake zone expansion rates of each turbine
+
+    yaw in radians, Ct as provided by the rotor model (corrected to yaw here if parameters.CTcorrected is False).
+    Returns wakeAngleInit(TURB), wakeDiameter0(TURB), zoneExpansion(TURB,ZONEI)"""
+
+    if parameters.CTcorrected == False:
+        Ct = Ct * calcYawCorrection(yaw, parameters.pP)[1]
+
+    wakeAngleInit = 0.5 * np.sin(yaw) * Ct
+    if parameters.useWakeAngle:
+        wakeAngleInit += parameters.initialWakeAngle*np.pi/180.0
+
+    # adjust k_e to C_T, adjusted to yaw
+    ke = parameters.ke + parameters.keCorrCT*(Ct-parameters.baselineCT) # FT = Ct*0.5*rho*A*(U*cos(yaw))^2, hence, thrust decreases with cos^2
+                                                                        #   Should ke increase directly with thrust? ==>No - Turbulence characteristics in wind-turbine wakes, A. Crespo"'*, J. Hern'andez b
+
+    if parameters.adjustInitialWakeDiamToYaw:
+        wakeDiameter0 = rotorDiameter * np.cos(yaw) # CHANGE: initial wake diameter at rotor adjusted to yaw
+    else:
+        wakeDiameter0 = rotorDiameter
+
+    zoneExpansion = 2*ke[..., np.newaxis]*parameters.me
+
+    return wakeAngleInit, wakeDiameter0, zoneExpansion
+
+
+def calcWakeParametersDerivatives(yaw, Ct, rotorDiameter, parameters):
+    """calculate the derivatives of the outputs of calcWakeParameters with respect to yaw (in radians) and Ct
+
+    Returns dWakeAngleInit_dyaw(TURB), dWakeAngleInit_dCt(TURB), dWakeDiameter0_dyaw(TURB),
+    dZoneExpansion_dyaw(TURB,ZONEI), dZoneExpansion_dCt(TURB,ZONEI)"""
+
+    dCtCorr_dCt = np.ones(np.shape(Ct))
+    dCtCorr_dyaw = np.zeros(np.shape(Ct))
+    if parameters.CTcorrected == False:
+        dCtCorr_dCt, dCTcorrection_dyaw = calcYawCorrection(yaw, parameters.pP)[1::2]
+        dCtCorr_dyaw = Ct*dCTcorrection_dyaw
+        Ct = Ct * dCtCorr_dCt
+
+    dWakeAngleInit_dyaw = 0.5 * np.cos(yaw) * Ct + 0.5 * np.sin(yaw) * dCtCorr_dyaw
+    dWakeAngleInit_dCt = 0.5 * np.sin(yaw) * dCtCorr_dCt
+
+    if parameters.adjustInitialWakeDiamToYaw:
+        dWakeDiameter0_dyaw = -rotorDiameter * np.sin(yaw)
+    else:
+        dWakeDiameter0_dyaw = np.zeros(np.shape(yaw))
+
+    dZoneExpansion_dCtCorr = 2*parameters.keCorrCT*np.asarray(parameters.me)
+    dZoneExpansion_dyaw = dCtCorr_dyaw[..., np.newaxis]*dZoneExpansion_dCtCorr
+    dZoneExpansion_dCt = dCtCorr_dCt[..., np.newaxis]*dZoneExpansion_dCtCorr
+
+    return dWakeAngleInit_dyaw, dWakeAngleInit_dCt, dWakeDiameter0_dyaw, dZoneExpansion_dyaw, dZoneExpansion_dCt
+
+
+def calcWakeGeometrySamples(velX, turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit, wakeDiameter0,
+                            zoneExpansion, parameters):
+    """calculate the center and zone diameters of each turbine wake at sample locations velX (in the wind direction
+    reference frame)
+
+    The wake arrays are evaluated in the floating point precision of velX, samples in any shape are taken in
+    flattened order.
+    Returns wakeCentersY(LOC,TURB), wakeCentersZ(LOC,TURB), wakeDiameters(LOC,TURB,ZONEI)"""
+
+    velX = np.ravel(velX)
+    dtype = np.result_type(velX, np.float32)
+    turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit, wakeDiameter0, zoneExpansion = \
+        [np.asarray(x, dtype=dtype) for x in (turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit,
+                                              wakeDiameter0, zoneExpansion)]
+
+    deltax = np.maximum(velX[:, np.newaxis]-turbineXw, 0)
+
+    displacement = calcWakeDisplacement(deltax, wakeAngleInit, rotorDiameter, parameters.kd) # yaw-induced deflection
+    if not parameters.useWakeAngle:
+        displacement += parameters.bd*deltax
+
+    # initial displacement for no yaw (positive to the left looking downstream)
+    wakeCentersY = (turbineYw+parameters.initialWakeDisplacement) + displacement
+    wakeCentersZ = np.tile(hubHeight, (velX.size, 1))
+
+    wakeDiameters = wakeDiameter0[:, np.newaxis] + zoneExpansion*deltax[:, :, np.newaxis]
+
+    return wakeCentersY, wakeCentersZ, wakeDiameters
+
+
+def calcWakeDisplacement(deltax, wakeAngleInit, rotorDiameter, kd):
+    """calculate the yaw-induced lateral displacement of the wake center of each turbine at downstream distance deltax
+
+    deltax(...,TURB) = (non-negative) downstream distance from turbine TURB, wakeAngleInit(TURB) = initial wake angle"""
+
+    factor = (2.0*kd*deltax/rotorDiameter)+1.0
+    displacement = (wakeAngleInit*(15.0*(factor**4.0)+(wakeAngleInit**2.0))/
+                    ((30.0*kd*(factor**5.0))/rotorDiameter)) - \
+                   (wakeAngleInit*rotorDiameter*(15.0+(wakeAngleInit**2.0))/(30.0*kd))
+
+    return displacement
+
+
+def calcWakeDisplacementDerivatives(deltax, wakeAngleInit, rotorDiameter, kd):
+    """calculate the derivatives of calcWakeDisplacement with respect to deltax and wakeAngleInit
+
+    Returns dDisplacement_ddeltax, dDisplacement_dwakeAngleInit with the shape of the displacement"""
+
+    factor = (2.0*kd*deltax/rotorDiameter)+1.0
+    dDisplacement_ddeltax = -wakeAngleInit/(factor**2.0) - (wakeAngleInit**3.0)/(3.0*(factor**6.0))
+    dDisplacement_dwakeAngleInit = rotorDiameter/(30.0*kd)*(15.0/factor + 3.0*(wakeAngleInit**2.0)/(factor**5.0) -
+                                                            15.0 - 3.0*(wakeAngleInit**2.0))
+
+    return dDisplacement_ddeltax, dDisplacement_dwakeAngleInit
+
+
+def calcWakePairsDerivatives(turbI, turb, turbineXw, yaw, Ct, rotorDiameter, parameters):
+    """calculate the partial derivatives of the wake center and wake zone diameters of the wake of turbine TURB at
+    turbine TURBI, for each (TURBI,TURB) pair, as computed by floris_wcent_wdiam (yaw in radians)
+
+    The center depends on turbineYw(TURB) with unit derivative, on turbineXw(TURBI) and turbineXw(TURB) through the
+    downstream distance, and on yaw(TURB) and Ct(TURB). The diameters depend on the same except turbineYw.
+    Returns dCenter_dX(PAIR), dCenter_dyaw(PAIR), dCenter_dCt(PAIR), dDiameter_dX(PAIR,ZONEI),
+    dDiameter_dyaw(PAIR,ZONEI), dDiameter_dCt(PAIR,ZONEI), with dX the derivative with respect to the downstream
+    distance turbineXw(TURBI)-turbineXw(TURB)"""
+
+    wakeAngleInit, wakeDiameter0, zoneExpansion = calcWakeParameters(yaw, Ct, rotorDiameter, parameters)
+    dWakeAngleInit_dyaw, dWakeAngleInit_dCt, dWakeDiameter0_dyaw, dZoneExpansion_dyaw, dZoneExpansion_dCt = \
+        calcWakeParametersDerivatives(yaw, Ct, rotorDiameter, parameters)
+
+    deltax = turbineXw[turbI]-turbineXw[turb]
+    downstream = deltax > 0
+
+    # wake center, the displacement is evaluated at the clipped distance as in floris_wcent_wdiam
+    dDisplacement_ddeltax, dDisplacement_dwakeAngleInit = \
+        calcWakeDisplacementDerivatives(np.maximum(deltax, 0.0), wakeAngleInit[turb], rotorDiameter[turb],
+                                        parameters.kd)
+    dCenter_dX = np.where(downstream, dDisplacement_ddeltax, 0.0)
+    dCenter_dyaw = dDisplacement_dwakeAngleInit*dWakeAngleInit_dyaw[turb]
+    dCenter_dCt = dDisplacement_dwakeAngleInit*dWakeAngleInit_dCt[turb]
+
+    # wake zone diameters, zero where the diameter is clipped
+    wakeDiametersT = wakeDiameter0[turb][:, np.newaxis] + zoneExpansion[turb]*deltax[:, np.newaxis]
+    active = wakeDiametersT > 0
+    dDiameter_dX = np.where(active, zoneExpansion[turb], 0.0)
+    dDiameter_dyaw = np.where(active, dWakeDiameter0_dyaw[turb][:, np.newaxis] +
+                              dZoneExpansion_dyaw[turb]*deltax[:, np.newaxis], 0.0)
+    dDiameter_dCt = np.where(active, dZoneExpansion_dCt[turb]*deltax[:, np.newaxis], 0.0)
+
+    return dCenter_dX, dCenter_dyaw, dCenter_dCt, dDiameter_dX, dDiameter_dyaw, dDiameter_dCt
+
+
+def calcSampleVelocities(velX, velY, velZ, turbineXw, wakeCentersY, wakeCentersZ, wakeDiameters, rotorDiameter,
+                         axialInd, keArray, mU, Vinf, shearCoefficientAlpha, shearZh, out=None):
+    """calculate the wind speed at sample locations velX,velY,velZ (in the wind direction reference frame)
+
+    wakeCentersY(LOC,TURB), wakeCentersZ(LOC,TURB) = center of the wake of turbine TURB at sample LOC
+    wakeDiameters(LOC,TURB,ZONEI) = diameter of zone ZONEI of the wake of turbine TURB at sample LOC
+    mU(TURB,ZONEI) = recovery coefficient of zone ZONEI of the wake of turbine TURB
+
+    For each turbine, all samples are classified at once into wake zone 1, 2 or 3, the axial induction zone in front
+    of the rotor, or the free stream, following the same precedence as the former loop over samples. The wind speeds
+    are evaluated in the floating point precision of the samples, and written into out if it is given. Samples in any
+    shape are taken in flattened order."""
+
+    velX, velY, velZ = np.ravel(velX), np.ravel(velY), np.ravel(velZ)
+
+    if kernelBackend == 'numba':
+        return numba_kernels.calcSampleVelocities(velX, velY, velZ, turbineXw, wakeCentersY, wakeCentersZ,
+                                                  wakeDiameters, rotorDiameter, axialInd, keArray, mU, Vinf,
+                                                  shearCoefficientAlpha, shearZh, out)
+
+    nTurbines = turbineXw.size
+    dtype = np.result_type(velX, np.float32)
+    turbineXw, rotorDiameter, axialInd, keArray, mU = [np.asarray(x, dtype=dtype) for x in (turbineXw, rotorDiameter,
+                                                                                         axialInd, keArray, mU)]
+
+    # apply shear profile to the free-stream velocity
+    if out is None:
+        ws_array = np.asarray(Vinf*(velZ/shearZh)**shearCoefficientAlpha, dtype=dtype)
+    else:
+        ws_array = out
+        ws_array[:] = Vinf*(velZ/shearZh)**shearCoefficientAlpha
+
+    if velX.size == 0:
+        return ws_array
+
+    for turb in range(0, nTurbines):
+        deltax = velX - turbineXw[turb]
+        deltay = velY - wakeCentersY[:, turb]
+        deltaz = velZ - wakeCentersZ[:, turb]
+        radiusLoc = np.sqrt(deltay**2+deltaz**2)
+        axialIndAndNearRotor = 2*axialInd[turb]
+
+        # innermost wake zone containing each sample (3 if outside of the wake)
+        zone = np.select([radiusLoc < wakeDiameters[:, turb, 0]/2.0, radiusLoc < wakeDiameters[:, turb, 1]/2.0,
+                          radiusLoc < wakeDiameters[:, turb, 2]/2.0], [0, 1, 2], 3)
+        inWake = (deltax > 0) & (zone < 3)
+        inInduction = (deltax <= 0) & (radiusLoc < rotorDiameter[turb]/2.0)   # axial induction zone in front of rotor
+
+        reductionFactor = np.zeros(velX.size, dtype=dtype)
+        reductionFactor[inWake] = axialIndAndNearRotor*\
+            np.power((rotorDiameter[turb]/(rotorDiameter[turb]+2*keArray[turb]*mU[turb, zone[inWake]]*np.maximum(0, deltax[inWake]))), 2)
+        reductionFactor[inInduction] = axialIndAndNearRotor*\
+            (0.5+np.arctan(2.0*np.minimum(0, deltax[inInduction])/(rotorDiameter[turb]))/np.pi)
+
+        ws_array *= (1-reductionFactor)
+
+    return ws_array
+
+
+# default bytes for the per-sample wake arrays of floris_assembly_opt_AEP with nThreads > 1, the samples are split
+# into tiles of this size (see calcSampleChunkSize) so that they can be shared between the threads
+threadSampleMemory = 64*2**20
+
+
+def calcSampleChunkSize(nTurbines, sampleMemory, itemsize=8):
+    """number of samples per tile such that the per-sample wake arrays of a tile fit in sampleMemory bytes, with
+    itemsize bytes per value (4 for single precision samples)"""
+
+    # wake centers, three zone diameters and temporaries, about ten values per sample and turbine
+    bytesPerSample = 10*itemsize*max(nTurbines, 1)
+
+    return max(int(sampleMemory//bytesPerSample), 1)
+
+
+def calcSampleVelocitiesChunked(velX, velY, velZ, turbineXw, turbineYw, hubHeight, rotorDiameter, yaw, Ct, axialInd,
+                                keArray, mU, Vinf, parameters, chunkSize, nThreads=1, cullSamples=False):
+    """calculate the wind speed at sample locations velX,velY,velZ (in the wind direction reference frame) in tiles of
+    chunkSize samples
+
+    The wake geometry at the samples is computed per tile (as in floris_wcent_wdiam, with Ct as provided by the rotor
+    model and yaw in radians) and each tile is written into the output directly, so the per-sample wake arrays never
+    exceed chunkSize samples. The compiled kernels evaluate the wake geometry per sample and turbine instead and
+    write each tile straight into the output. With nThreads > 1 the tiles are evaluated on a pool of threads, the
+    kernels release the GIL while they work on a tile. With cullSamples, each turbine only visits the samples of a
+    tile near its wake or axial induction zone, see calcSampleVelocitiesCulled."""
+
+    nSamples = velX.size
+    ws_array = np.zeros(nSamples, dtype=np.result_type(velX, np.float32))
+
+    wakeAngleInit, wakeDiameter0, zoneExpansion = calcWakeParameters(yaw, Ct, rotorDiameter, parameters)
+
+    def evaluateTile(tile):
+        if cullSamples:
+            calcSampleVelocitiesCulled(velX[tile], velY[tile], velZ[tile], turbineXw, turbineYw, hubHeight,
+                                       rotorDiameter, wakeAngleInit, wakeDiameter0, zoneExpansion, axialInd, keArray,
+                                       mU, Vinf, parameters, ws_array[tile])
+            return
+        if kernelBackend == 'numba':
+            numba_kernels.calcSampleVelocitiesWakes(velX[tile], velY[tile], velZ[tile], turbineXw, turbineYw,
+                                                    hubHeight, rotorDiameter, wakeAngleInit, wakeDiameter0,
+                                                    zoneExpansion, axialInd, keArray, mU, Vinf, parameters,
+                                                    ws_array[tile])
+            return
+        wakeCentersY, wakeCentersZ, wakeDiameters = calcWakeGeometrySamples(velX[tile], turbineXw, turbineYw,
+                                                                            hubHeight, rotorDiameter, wakeAngleInit,
+                                                                            wakeDiameter0, zoneExpansion, parameters)
+        calcSampleVelocities(velX[tile], velY[tile], velZ[tile], turbineXw, wakeCentersY, wakeCentersZ, wakeDiameters,
+                             rotorDiameter, axialInd, keArray, mU, Vinf, parameters.shearCoefficientAlpha,
+                             parameters.shearZh, ws_array[tile])
+
+    if kernelBackend == 'numba' and nThreads <= 1:
+        # no per-sample wake arrays, a single tile covers all samples
+        chunkSize = max(nSamples, 1)
+
+    tiles = [slice(start, min(start+chunkSize, nSamples)) for start in range(0, nSamples, chunkSize)]
+
+    if nThreads > 1 and len(tiles) > 1:
+        getThreadPool(nThreads).map(evaluateTile, tiles)
+    else:
+        for tile in tiles:
+            evaluateTile(tile)
+
+    return ws_array
+
+
+def calcSampleVelocitiesCulled(velX, velY, velZ, turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit,
+                               wakeDiameter0, zoneExpansion, axialInd, keArray, mU, Vinf, parameters, out=None,
+                               blockSize=256):
+    """calculate the wind speed at sample locations velX,velY,velZ (in the wind direction reference frame), with each
+    turbine only visiting the samples near its wake or its axial induction zone
+
+    The samples are sorted by velX into slabs of about sqrt(nSamples*blockSize) samples, sorted by velY within each
+    slab and grouped into blocks of blockSize samples with downstream, crosswind and vertical bounds. A block is
+    visited by a turbine if its bounds intersect the outermost wake zone (bounded as in calcWakePairs) downstream of
+    the turbine, or the rotor disk projected upstream. The wakes of the visited samples are evaluated as
+    in calcWakeGeometrySamples and calcSampleVelocities, the other samples are not reduced by the turbine, so the wind
+    speeds are the same as without culling. They are written into out if it is given."""
+
+    dtype = np.result_type(velX, np.float32)
+    nTurbines = np.size(turbineXw)
+    nSamples = velX.size
+    wakeDiameter0 = wakeDiameter0*np.ones(nTurbines)
+
+    # apply shear profile to the free-stream velocity
+    if out is None:
+        ws_array = np.asarray(Vinf*(velZ/parameters.shearZh)**parameters.shearCoefficientAlpha, dtype=dtype)
+    else:
+        ws_array = out
+        ws_array[:] = Vinf*(velZ/parameters.shearZh)**parameters.shearCoefficientAlpha
+
+    if nSamples == 0:
+        return ws_array
+
+    # blocks of samples sorted by downstream position in slabs and by crosswind position within a slab, with the
+    # bounds of each block
+    slabSize = blockSize*int(np.ceil(np.sqrt(float(nSamples)/blockSize)))
+    slab = np.empty(nSamples, dtype=int)
+    slab[np.argsort(velX, kind='mergesort')] = np.arange(nSamples)//slabSize
+    order = np.lexsort((velY, slab))
+    starts = np.arange(0, nSamples, blockSize)
+    ends = np.minimum(starts+blockSize, nSamples)
+    blockXMin, blockXMax, blockYMin, blockYMax, blockZMin, blockZMax = \
+        [reduction.reduceat(values[order], starts)[:, np.newaxis] for values in (velX, velY, velZ)
+         for reduction in (np.minimum, np.maximum)]
+
+    # largest zone radius of each wake in each block (zone diameters are linear in deltax)
+    deltaxMin = np.maximum(blockXMin-turbineXw, 0)
+    deltaxMax = np.maximum(blockXMax-turbineXw, 0)
+    zoneRadiusMax = np.maximum(np.max(wakeDiameter0[:, np.newaxis]+zoneExpansion*deltaxMin[:, :, np.newaxis], 2),
+                               np.max(wakeDiameter0[:, np.newaxis]+zoneExpansion*deltaxMax[:, :, np.newaxis], 2))/2.
+
+    # bound on the displacement of the wake center, see calcWakePairs
+    kd = parameters.kd
+    if kd > 0:
+        displacementMax = np.abs(wakeAngleInit)*rotorDiameter*(15.0+(wakeAngleInit**2.0))/(30.0*kd)
+    else:
+        displacementMax = np.inf
+    if not parameters.useWakeAngle:
+        displacementMax = displacementMax + np.abs(parameters.bd)*deltaxMax
+
+    # blocks intersecting the outermost wake zone downstream, or the rotor disk upstream of each turbine, with a
+    # margin for the precision of the samples
+    wakeCenterY = turbineYw+parameters.initialWakeDisplacement
+    halfWidthY = (zoneRadiusMax+displacementMax)*(1.0+1e-4)+1e-4*np.abs(wakeCenterY)
+    halfWidthZ = zoneRadiusMax*(1.0+1e-4)+1e-4*np.abs(hubHeight)
+    inWake = (blockXMax > turbineXw) & (blockYMin < wakeCenterY+halfWidthY) & (blockYMax > wakeCenterY-halfWidthY) & \
+             (blockZMin < hubHeight+halfWidthZ) & (blockZMax > hubHeight-halfWidthZ)
+    rotorRadius = rotorDiameter/2.*(1.0+1e-4)
+    halfWidthY = rotorRadius+1e-4*np.abs(wakeCenterY)
+    halfWidthZ = rotorRadius+1e-4*np.abs(hubHeight)
+    inInduction = (blockXMin <= turbineXw) & (blockYMin < wakeCenterY+halfWidthY) & \
+                  (blockYMax > wakeCenterY-halfWidthY) & (blockZMin < hubHeight+halfWidthZ) & \
+                  (blockZMax > hubHeight-halfWidthZ)
+    visited = inWake | inInduction
+
+    for turb in range(0, nTurbines):
+        blocks = np.flatnonzero(visited[:, turb])
+        if blocks.size == 0:
+            continue
+
+        # samples of the visited blocks
+        sizes = ends[blocks]-starts[blocks]
+        loc = order[np.repeat(starts[blocks]-np.cumsum(sizes)+sizes, sizes)+np.arange(np.sum(sizes))]
+
+        wake = slice(turb, turb+1)
+        wakeCentersY, wakeCentersZ, wakeDiameters = calcWakeGeometrySamples(velX[loc], turbineXw[wake],
+                                                                            turbineYw[wake], hubHeight[wake],
+                                                                            rotorDiameter[wake], wakeAngleInit[wake],
+                                                                            wakeDiameter0[wake], zoneExpansion[wake],
+                                                                            parameters)
+
+        # velocity reduction of this wake alone, without free-stream speed and shear profile
+        ws_array[loc] *= calcSampleVelocities(velX[loc], velY[loc], velZ[loc], turbineXw[wake], wakeCentersY,
+                                              wakeCentersZ, wakeDiameters, rotorDiameter[wake], axialInd[wake],
+                                              keArray[wake], mU[wake], 1.0, 0.0, parameters.shearZh)
+
+    return ws_array
+
+
+# thread pools by number of threads, they are kept for later evaluations
+threadPools = {}
+
+
+def getThreadPool(nThreads):
+    """pool of nThreads threads, created on first use"""
+
+    if nThreads not in threadPools:
+        threadPools[nThreads] = ThreadPool(nThreads)
+
+    return threadPools[nThreads]
+
+
+def closeThreadPools():
+    """close the pools of getThreadPool and wait for their threads to exit, pools are created again on their next
+    use"""
+
+    while threadPools:
+        pool = threadPools.pop(next(iter(threadPools)))
+        pool.close()
+        pool.join()
+
+
+atexit.register(closeThreadPools)
+
+
+def calcGridVelocities(gridX, gridY, gridZ, turbineXw, turbineYw, hubHeight, rotorDiameter, yaw, Ct, axialInd,
+                       keArray, mU, Vinf, parameters):
+    """calculate the wind speed on the grid of all combinations of the downwind coordinates gridX, crosswind
+    coordinates gridY and heights gridZ (in the wind direction reference frame)
+
+    The wake geometry (as in calcSampleVelocitiesChunked, with Ct as provided by the rotor model and yaw in radians)
+    and the wake velocity deficits only depend on the downwind coordinate, so they are evaluated once per gridX and
+    broadcast over the crosswind and vertical axes. The samples are classified as in calcSampleVelocities.
+    Returns ws_grid(X,Y,Z) in the floating point precision of gridX"""
+
+    dtype = np.result_type(gridX, np.float32)
+    gridX, gridY, gridZ = [np.asarray(x, dtype=dtype) for x in (gridX, gridY, gridZ)]
+    nTurbines = np.size(turbineXw)
+
+    wakeAngleInit, wakeDiameter0, zoneExpansion = calcWakeParameters(yaw, Ct, rotorDiameter, parameters)
+    wakeCentersY, wakeCentersZ, wakeDiameters = calcWakeGeometrySamples(gridX, turbineXw, turbineYw, hubHeight,
+                                                                        rotorDiameter, wakeAngleInit, wakeDiameter0,
+                                                                        zoneExpansion, parameters)
+    turbineXw, rotorDiameter, axialInd, keArray, mU = [np.asarray(x, dtype=dtype) for x in (turbineXw, rotorDiameter,
+                                                                                         axialInd, keArray, mU)]
+
+    # apply shear profile to the free-stream velocity
+    ws_grid = np.empty((gridX.size, gridY.size, gridZ.size), dtype=dtype)
+    ws_grid[:] = Vinf*(gridZ/parameters.shearZh)**parameters.shearCoefficientAlpha
+
+    for turb in range(0, nTurbines):
+        deltax = gridX - turbineXw[turb]
+        deltay = gridY - wakeCentersY[:, turb, np.newaxis]
+        deltaz = gridZ - wakeCentersZ[:, turb, np.newaxis]
+        radiusLoc = np.sqrt(deltay[:, :, np.newaxis]**2+deltaz[:, np.newaxis, :]**2)
+        axialIndAndNearRotor = 2*axialInd[turb]
+
+        # velocity reduction in each wake zone and in the axial induction zone in front of the rotor, per downwind
+        # coordinate
+        wakeReduction = axialIndAndNearRotor*\
+            np.power((rotorDiameter[turb]/(rotorDiameter[turb]+2*keArray[turb]*mU[turb]*np.maximum(0, deltax[:, np.newaxis]))), 2)
+        wakeReduction[deltax <= 0] = 0
+        inductionReduction = np.where(deltax <= 0, axialIndAndNearRotor*\
+            (0.5+np.arctan(2.0*np.minimum(0, deltax)/(rotorDiameter[turb]))/np.pi), 0).astype(dtype)
+
+        radii = wakeDiameters[:, turb, :, np.newaxis, np.newaxis]/2.0
+        reductionFactor = np.select([radiusLoc < radii[:, 0], radiusLoc < radii[:, 1], radiusLoc < radii[:, 2]],
+                                    [wakeReduction[:, k, np.newaxis, np.newaxis] for k in range(3)], 0)
+        reductionFactor += np.where(radiusLoc < rotorDiameter[turb]/2.0, inductionReduction[:, np.newaxis, np.newaxis],
+                                    0)
+
+        ws_grid *= (1-reductionFactor)
+
+    return ws_grid
+
+
+def calcGridAxes(gridOrigin, gridSpacing, gridShape, gridHeight, windDirection, dtype='float'):
+    """coordinates of a structured grid along its downwind, crosswind and vertical axes in the wind direction
+    reference frame, for the first grid point at gridOrigin (x,y in the original reference frame) and height
+    gridHeight, gridSpacing between the points and gridShape points along each axis (one layer if 2D)
+
+    Returns gridX(X), gridY(Y), gridZ(Z)"""
+
+    gridShape = tuple(gridShape)+(1,)*(3-len(gridShape))
+    originXw, originYw = calcWindFrame(gridOrigin[0], gridOrigin[1], windDirection)
+
+    gridX = originXw[0, 0] + gridSpacing[0]*np.arange(gridShape[0])
+    gridY = originYw[0, 0] + gridSpacing[1]*np.arange(gridShape[1])
+    gridZ = gridHeight + gridSpacing[2]*np.arange(gridShape[2])
+
+    return gridX.astype(dtype), gridY.astype(dtype), gridZ.astype(dtype)
+
+
+def calcGridPositions(gridOrigin, gridSpacing, gridShape, gridHeight, windDirection):
+    """positions of the points of a structured grid as in calcGridAxes in the original reference frame, for plotting
+
+    Returns gridX, gridY, gridZ with shape gridShape"""
+
+    gridXw, gridYw, gridZ = calcGridAxes(gridOrigin, gridSpacing, gridShape, gridHeight, windDirection)
+    gridXw, gridYw, gridZ = np.meshgrid(gridXw, gridYw, gridZ, indexing='ij')
+
+    # rotate back from the wind direction reference frame
+    gridX, gridY = calcWindFrame(gridXw.ravel(), gridYw.ravel(), -windDirection)
+
+    return gridX.reshape(gridShape), gridY.reshape(gridShape), gridZ.reshape(gridShape)
+
+
+def calcWakePairs(turbineXw, turbineYw, rotorDiameter, wakeAngleInit, wakeDiameter0, zoneExpansion, parameters):
+    """find all pairs of turbines (TURBI,TURB) where the rotor of TURBI overlaps with the wake of upstream turbine TURB,
+    and calculate the wake center and zone diameters of each of these pairs
+
+    Candidate pairs are taken from a crosswind window around each turbine that bounds its outermost wake zone (and
+    its wake displacement) up to the most downstream turbine, using the turbines sorted by crosswind position. The
+    candidates are then reduced to pairs with TURBI downstream of TURB whose rotor is within the outermost zone.
+
+    Returns wakePairs(2,PAIR) ordered by TURBI then TURB, wakeCentersYT(PAIR) and wakeDiametersT(PAIR,ZONEI)"""
+
+    kd = parameters.kd
+    initialWakeDisplacement = parameters.initialWakeDisplacement
+    nTurbines = turbineXw.size
+
+    if nTurbines == 0:
+        return np.zeros((2, 0), dtype=int), np.zeros(0), np.zeros((0, 3))
+
+    # largest zone radius of each wake up to the most downstream turbine (zone diameters are linear in deltax)
+    deltaxMax = np.max(turbineXw)-turbineXw
+    zoneRadiusMax = np.maximum(wakeDiameter0, np.max(wakeDiameter0[:, np.newaxis] +
+                                                     zoneExpansion*deltaxMax[:, np.newaxis], 1))/2.
+
+    # bound on the displacement of the wake center, see calcWakeDisplacement (only valid for kd > 0)
+    if kd > 0:
+        displacementMax = np.abs(initialWakeDisplacement) + \
+                          np.abs(wakeAngleInit)*rotorDiameter*(15.0+(wakeAngleInit**2.0))/(30.0*kd)
+    else:
+        displacementMax = np.inf
+
+    halfWidth = (zoneRadiusMax + displacementMax + np.max(rotorDiameter)/2.)*(1.0+1e-9)
+
+    # candidate pairs from the crosswind window of each upstream turbine
+    order = np.argsort(turbineYw)
+    sortedY = turbineYw[order]
+    first = np.searchsorted(sortedY, turbineYw-halfWidth, side='left')
+    last = np.searchsorted(sortedY, turbineYw+halfWidth, side='right')
+    nCandidates = last-first
+    turb = np.repeat(np.arange(nTurbines), nCandidates)
+    offset = np.arange(turb.size)-np.repeat(np.cumsum(nCandidates)-nCandidates, nCandidates)
+    turbI = order[np.repeat(first, nCandidates)+offset]
+
+    # keep downstream turbines only
+    downstream = turbineXw[turbI] > turbineXw[turb]
+    turbI = turbI[downstream]
+    turb = turb[downstream]
+
+    # wake center and zone diameters as in floris_wcent_wdiam
+    deltax = turbineXw[turbI]-turbineXw[turb]
+    wakeCentersYT = (turbineYw[turb]+initialWakeDisplacement) + \
+                    calcWakeDisplacement(deltax, wakeAngleInit[turb], rotorDiameter[turb], kd)
+    wakeDiametersT = np.maximum(wakeDiameter0[turb][:, np.newaxis] + zoneExpansion[turb]*deltax[:, np.newaxis], 0)
+
+    # keep pairs where the rotor intersects with the outermost wake zone
+    overlapping = np.abs(wakeCentersYT-turbineYw[turbI]) < (rotorDiameter[turbI]+np.max(wakeDiametersT, 1))/2
+    turbI = turbI[overlapping]
+    turb = turb[overlapping]
+
+    order = np.lexsort((turb, turbI))
+    wakePairs = np.array([turbI[order], turb[order]])
+
+    return wakePairs, wakeCentersYT[overlapping][order], wakeDiametersT[overlapping][order]
+
+
+def calcTurbineVelocities(turbineXw, wakePairs, wakeOverlapTRel, rotorDiameter, axialInd, keArray, mU, Vinf):
+    """calculate the effective wind speed at each turbine from the wakes of upstream turbines
+
+    wakePairs(2,PAIR) = (TURBI,TURB) pairs ordered by TURBI then TURB, with TURBI downstream of TURB
+    wakeOverlapTRel(PAIR,ZONEI) = overlap of zone ZONEI of wake of TURB with rotor of TURBI relative to rotor area
+    mU(TURB,ZONEI) = recovery coefficient of zone ZONEI of the wake of turbine TURB"""
+
+    if kernelBackend == 'numba':
+        return numba_kernels.calcTurbineVelocities(turbineXw, wakePairs, wakeOverlapTRel, rotorDiameter, axialInd,
+                                                   keArray, mU, Vinf)
+
+    nTurbines = turbineXw.size
+    turbI, turb = wakePairs
+
+    deltax = turbineXw[turbI] - turbineXw[turb]
+
+    # find overlap-area weighted effect of each wake zone
+    wakeEffCoeffPerZone = np.zeros(turb.size)
+    for zone in range(0, 3):
+        wakeEffCoeffPerZone = wakeEffCoeffPerZone + np.power((rotorDiameter[turb])/(rotorDiameter[turb]+2*keArray[turb]*mU[turb, zone]*deltax), 2.0) * wakeOverlapTRel[:, zone]
+
+    wakeEffCoeff = np.bincount(turbI, weights=np.power(axialInd[turb]*wakeEffCoeffPerZone, 2.0), minlength=nTurbines)
+
+    wakeEffCoeff = (1 - 2 * np.sqrt(wakeEffCoeff))
+
+    # multiply the inflow speed with the wake coefficients to find effective wind speed at turbine
+    return Vinf*wakeEffCoeff
+
+
+def calcSweepVelocities(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, Vinf, pP, curve_wind_speed,
+                        curve_CP, curve_CT, parameters):
+    """solve the effective wind speed and rotor coefficients of each turbine in a single pass over the turbines
+    ordered from upstream to downstream (yaw in degrees)
+
+    Wakes only travel downstream, so once all upstream turbines are solved the wind speed at a turbine follows
+    directly from their wakes, and its rotor coefficients and own wake from its wind speed. The result is the
+    converged solution of the fixed point iteration between the rotor model and floris_power.
+
+    turbineXw, turbineYw have shape (TURB) or (DIR,TURB) to solve several wind directions at once, stepping through
+    the turbines of all directions by their upstream rank. yaw and axialInduction have shape (TURB) or (DIR,TURB).
+    Vinf is a scalar or has shape (DIR), or has shape (DIR,SPEED) to solve several wind speeds for each direction,
+    sharing the turbine positions, upstream ordering and downstream distances of each direction across its speeds.
+    Returns velocitiesTurbines, CP, CT, axialInd, keArray with the shape of turbineXw, or with shape (DIR,SPEED,TURB)
+    if Vinf has shape (DIR,SPEED). CP and CT as given by the rotor model, axialInd and keArray the axial induction and
+    wake expansion coefficient of each turbine as in floris_power."""
+
+    shape = np.shape(turbineXw)
+    turbineXw = np.atleast_2d(turbineXw)
+    turbineYw = np.atleast_2d(turbineYw)
+    nDirections, nTurbines = turbineXw.shape
+    directions = np.arange(nDirections)
+
+    if np.ndim(Vinf) == 2:
+        shape = np.shape(Vinf)+(nTurbines,)
+    else:
+        Vinf = (Vinf*np.ones(nDirections))[:, np.newaxis]
+    nSpeeds = Vinf.shape[1]
+
+    kd = parameters.kd
+    yaw = yaw*np.ones((nDirections, nTurbines))
+    yawRad = yaw*np.pi/180.
+    axialInduction = axialInduction*np.ones((nDirections, nTurbines))
+    rotorArea = np.pi*rotorDiameter**2/4.
+
+    # recovery coefficients of each wake zone of each turbine
+    if parameters.useaUbU:
+        mU = parameters.MU/np.cos(parameters.aU*np.pi/180+parameters.bU*yawRad[:, np.newaxis, :, np.newaxis])
+    else:
+        mU = parameters.MU*np.ones((nDirections, 1, nTurbines, 1))
+
+    # state of each turbine for each direction and speed
+    velocitiesTurbines = np.zeros((nDirections, nSpeeds, nTurbines))
+    CP = np.zeros((nDirections, nSpeeds, nTurbines))
+    CT = np.zeros((nDirections, nSpeeds, nTurbines))
+    axialInd = np.zeros((nDirections, nSpeeds, nTurbines))
+    keArray = np.zeros((nDirections, nSpeeds, nTurbines))
+    wakeAngleInit = np.zeros((nDirections, nSpeeds, nTurbines))
+    wakeDiameter0 = np.zeros((nDirections, nSpeeds, nTurbines))
+    zoneExpansion = np.zeros((nDirections, nSpeeds, nTurbines, 3))
+
+    order = np.argsort(turbineXw, axis=1, kind='mergesort')
+    curve = CPCTCurve(curve_wind_speed, curve_CP, curve_CT)
+
+    for rank in range(0, nTurbines):
+
+        # turbine of this rank in each direction, all turbines upstream of it have been solved
+        turbI = order[:, rank]
+        deltax = turbineXw[directions, turbI][:, np.newaxis]-turbineXw
+        upstream = deltax > 0
+        deltax = np.where(upstream, deltax, 0)[:, np.newaxis, :]
+
+        # wake centers, zone diameters and overlaps of the upstream wakes at turbI, as in floris_wcent_wdiam and
+        # floris_overlap
+        wakeCentersYT = (turbineYw+parameters.initialWakeDisplacement)[:, np.newaxis, :] + \
+                        calcWakeDisplacement(deltax, wakeAngleInit, rotorDiameter, kd)
+        wakeDiametersT = np.maximum(wakeDiameter0[..., np.newaxis]+zoneExpansion*deltax[..., np.newaxis], 0)
+        wakeOverlapTRel = calcZoneOverlap(np.abs(wakeCentersYT -
+                                                 turbineYw[directions, turbI][:, np.newaxis, np.newaxis])[..., np.newaxis],
+                                          (rotorDiameter[turbI]/2)[:, np.newaxis, np.newaxis, np.newaxis],
+                                          wakeDiametersT/2) / rotorArea[turbI][:, np.newaxis, np.newaxis, np.newaxis]
+        wakeOverlapTRel = np.where(upstream[:, np.newaxis, :, np.newaxis], wakeOverlapTRel, 0.0)
+
+        # wind speed at turbI, as in floris_power
+        wakeEffCoeffPerZone = np.sum(np.power(rotorDiameter[:, np.newaxis] /
+                                              (rotorDiameter[:, np.newaxis]+2*keArray[..., np.newaxis]*mU *
+                                               deltax[..., np.newaxis]), 2.0)*wakeOverlapTRel, axis=3)
+        wakeEffCoeff = 1-2*np.sqrt(np.sum(np.power(axialInd*wakeEffCoeffPerZone, 2.0), axis=2))
+        velocitiesTurbines[directions, :, turbI] = Vinf*wakeEffCoeff
+        overlapSum = np.sum(wakeOverlapTRel[..., 0]+wakeOverlapTRel[..., 1], axis=2)
+
+        # rotor coefficients at the effective wind speed
+        yawI = yaw[directions, turbI][:, np.newaxis]
+        yawRadI = yawRad[directions, turbI][:, np.newaxis]
+        CP[directions, :, turbI], CT[directions, :, turbI] = curve.evaluate(velocitiesTurbines[directions, :, turbI],
+                                                                            yawI, pP)[:2]
+
+        # wake of turbI, as in floris_wcent_wdiam
+        wakeAngleInit[directions, :, turbI], wakeDiameter0[directions, :, turbI], zoneExpansion[directions, :, turbI] = \
+            calcWakeParameters(yawRadI, CT[directions, :, turbI], rotorDiameter[turbI][:, np.newaxis], parameters)
+
+        # axial induction and wake recovery of turbI, as in floris_power
+        Ct, _, axialInd[directions, :, turbI] = \
+            calcRotorCoefficients(CT[directions, :, turbI], CP[directions, :, turbI], yawRadI,
+                                  axialInduction[directions, turbI][:, np.newaxis], parameters)[:3]
+        ke = parameters.ke + parameters.keCorrCT*(Ct-parameters.baselineCT)
+        keArray[directions, :, turbI] = ke*(1+overlapSum*parameters.keCorrArray)
+
+    return velocitiesTurbines.reshape(shape), CP.reshape(shape), CT.reshape(shape), axialInd.reshape(shape), \
+        keArray.reshape(shape)
+
+
+def calcSweepVelocitiesParallel(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, Vinf, pP, curve_wind_speed,
+                                curve_CP, curve_CT, parameters, nProcesses):
+    """calcSweepVelocities for turbineXw, turbineYw of shape (DIR,TURB), with the wind directions split into chunks
+    that are solved by a pool of nProcesses worker processes (see getProcessPool)
+
+    The directions are independent, so the results are identical to those of a single calcSweepVelocities call."""
+
+    if nProcesses <= 1 or np.ndim(turbineXw) < 2 or np.shape(turbineXw)[0] <= 1:
+        return calcSweepVelocities(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, Vinf, pP,
+                                   curve_wind_speed, curve_CP, curve_CT, parameters)
+
+    nDirections, nTurbines = np.shape(turbineXw)
+
+    # per-direction inputs with the directions as leading axis, so they can be split like the turbine positions
+    yaw = yaw*np.ones((nDirections, nTurbines))
+    axialInduction = axialInduction*np.ones((nDirections, nTurbines))
+    if np.ndim(Vinf) < 2:
+        Vinf = Vinf*np.ones(nDirections)
+
+    chunks = np.array_split(np.arange(nDirections), min(nProcesses, nDirections))
+    values = ParameterValues(parameters)
+    tasks = [(turbineXw[chunk], turbineYw[chunk], yaw[chunk], rotorDiameter, axialInduction[chunk], Vinf[chunk], pP,
+              curve_wind_speed, curve_CP, curve_CT, values) for chunk in chunks]
+
+    results = getProcessPool(nProcesses).map(calcSweepVelocitiesTask, tasks)
+
+    return tuple(np.concatenate([result[k] for result in results]) for k in range(5))
+
+
+def calcSweepVelocitiesTask(task):
+    """calcSweepVelocities of one chunk of directions in a worker process, task holds its arguments"""
+
+    return calcSweepVelocities(*task)
+
+
+# worker process pools by number of processes, they are kept for later evaluations
+processPools = {}
+
+
+def getProcessPool(nProcesses):
+    """pool of nProcesses worker processes, created on first use"""
+
+    if nProcesses not in processPools:
+        processPools[nProcesses] = multiprocessing.Pool(nProcesses)
+
+    return processPools[nProcesses]
+
+
+def closeProcessPools():
+    """close the pools of getProcessPool and wait for their worker processes to exit, pools are created again on
+    their next use"""
+
+    while processPools:
+        pool = processPools.pop(next(iter(processPools)))
+        pool.close()
+        pool.join()
+
+
+atexit.register(closeProcessPools)
+
+
+class ParameterValues(object):
+    """ Plain copy of the values of a FLORISParameters tree, which can be sent to worker processes """
+
+    def __init__(self, parameters):
+
+        for name in parameters.trait_names(iotype='in'):
+            setattr(self, name, getattr(parameters, name))
+
+
+def calcSweepPower(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, generator_efficiency, Vinf, rho, pP,
+                   curve_wind_speed, curve_CP, curve_CT, parameters, nProcesses=1, cache=None):
+    """solve the turbines of all directions with calcSweepVelocitiesParallel and find their power as in floris_sweep
+    (yaw in degrees)
+
+    If a PowerCache is given, states it holds are returned without solving them again.
+
+    Returns velocitiesTurbines, CP, CT, wt_power, axialInd, keArray with the shapes of calcSweepVelocities, wt_power in
+    kW"""
+
+    if cache is not None and cache.maxSize > 0:
+        key = calcStateKey(parameters, turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, generator_efficiency,
+                           Vinf, rho, pP, curve_wind_speed, curve_CP, curve_CT)
+        state = cache.get(key)
+        if state is None:
+            state = calcSweepPower(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, generator_efficiency,
+                                   Vinf, rho, pP, curve_wind_speed, curve_CP, curve_CT, parameters, nProcesses)
+            cache.put(key, state)
+        return tuple(np.copy(value) for value in state)
+
+    rotorArea = np.pi*rotorDiameter**2/4.
+
+    velocitiesTurbines, CP, CT, axialInd, keArray = \
+        calcSweepVelocitiesParallel(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, Vinf, pP,
+                                    curve_wind_speed, curve_CP, curve_CT, parameters, nProcesses)
+
+    Cp = CP
+    if parameters.CPcorrected == False:
+        CPcorrection = calcYawCorrection(yaw*np.pi/180., parameters.pP)[0]*np.ones(np.shape(turbineXw))
+        if np.ndim(Vinf) == 2:
+            CPcorrection = CPcorrection[:, np.newaxis, :]
+        Cp = Cp * CPcorrection
+
+    wt_power = np.power(velocitiesTurbines, 3.0) * (0.5*rho*rotorArea*Cp) * generator_efficiency
+    wt_power /= 1000  # in kW
+
+    return velocitiesTurbines, CP, CT, wt_power, axialInd, keArray
+
+
+def calcYawSweepPower(turbineX, turbineY, windDirection, yaw, rotorDiameter, axialInduction, generator_efficiency, Vinf,
+                      rho, pP, curve_wind_speed, curve_CP, curve_CT, parameters, nProcesses=1, cache=None):
+    """find the power of the turbines for each case of a sweep of yaw settings yaw(CASE,TURB) (in degrees) at a single
+    wind direction and speed
+
+    The cases are solved together as the directions of calcSweepPower, with the turbine positions rotated into the
+    wind direction reference frame once.
+    Returns velocitiesTurbines(CASE,TURB), wt_power(CASE,TURB) in kW"""
+
+    yaw = np.atleast_2d(yaw)
+    nCases = yaw.shape[0]
+
+    turbineXw, turbineYw = calcWindFrame(turbineX, turbineY, windDirection)
+    turbineXw = np.repeat(turbineXw, nCases, axis=0)
+    turbineYw = np.repeat(turbineYw, nCases, axis=0)
+
+    velocitiesTurbines, CP, CT, wt_power = calcSweepPower(turbineXw, turbineYw, yaw, rotorDiameter, axialInduction,
+                                                          generator_efficiency, Vinf, rho, pP, curve_wind_speed,
+                                                          curve_CP, curve_CT, parameters, nProcesses, cache)[:4]
+
+    return velocitiesTurbines, wt_power
+
+
+def calcSweepPowerGradients(turbineX, turbineY, windDirections, yaw, rotorDiameter, axialInduction,
+                            generator_efficiency, Vinf, rho, pP, curve_wind_speed, curve_CP, curve_CT, parameters,
+                            step=1e-6, form='forward', nProcesses=1):
+    """finite difference derivatives of the turbine powers of calcSweepPower with respect to the turbine positions
+    turbineX, turbineY (TURB) and yaw (DIR,TURB) in degrees
+
+    Instead of a model evaluation per perturbed variable, the perturbed states of all variables are stacked along the
+    direction axis of calcSweepVelocities and solved in a single call. The directions are independent, so perturbing
+    the yaw of turbine j in all directions at once gives the derivatives with respect to yaw[d,j] of each direction d.
+    form is 'forward' or 'central'.
+
+    Returns dwt_power_dturbineX, dwt_power_dturbineY, dwt_power_dyaw with shape (DIR,TURB,TURB), or (DIR,SPEED,TURB,TURB)
+    if Vinf has shape (DIR,SPEED), the last axis being the perturbed turbine. dwt_power_dyaw holds the derivatives
+    with respect to the yaw of the same direction."""
+
+    nDirections = np.size(windDirections)
+    nTurbines = np.size(turbineX)
+
+    if form == 'central':
+        signs = (1.0, -1.0)
+    elif form == 'forward':
+        signs = (1.0,)
+    else:
+        raise ValueError("unknown finite difference form '%s', use 'forward' or 'central'" % form)
+
+    # perturbations of each state (CASE,TURB): the unperturbed state, then turbineX, turbineY and yaw of each turbine
+    # for each sign
+    perturbation = step*np.eye(nTurbines)
+    none = np.zeros((nTurbines, nTurbines))
+    offsetX, offsetY, offsetYaw = [np.zeros((1, nTurbines))], [np.zeros((1, nTurbines))], [np.zeros((1, nTurbines))]
+    for sign in signs:
+        offsetX += [sign*perturbation, none, none]
+        offsetY += [none, sign*perturbation, none]
+        offsetYaw += [none, none, sign*perturbation]
+    offsetX, offsetY, offsetYaw = np.concatenate(offsetX), np.concatenate(offsetY), np.concatenate(offsetYaw)
+    nCases = offsetX.shape[0]
+
+    # states (DIR*CASE,TURB) in the wind direction reference frame, as in calcWindFrame
+    windDirection = np.reshape(windDirections, (-1, 1, 1))*np.pi/180.0
+    caseX = turbineX+offsetX
+    caseY = turbineY+offsetY
+    turbineXw = np.cos(-windDirection)*caseX - np.sin(-windDirection)*caseY
+    turbineYw = np.sin(-windDirection)*caseX + np.cos(-windDirection)*caseY
+    caseYaw = (yaw*np.ones((nDirections, nTurbines)))[:, np.newaxis, :]+offsetYaw
+    caseAxialInduction = (axialInduction*np.ones((nDirections, nTurbines)))[:, np.newaxis, :]*np.ones((1, nCases, 1))
+    if np.ndim(Vinf) == 2:
+        caseVinf = np.repeat(Vinf, nCases, axis=0)
+    else:
+        caseVinf = np.repeat(Vinf*np.ones(nDirections), nCases)
+
+    wt_power = calcSweepPower(turbineXw.reshape(-1, nTurbines), turbineYw.reshape(-1, nTurbines),
+                              caseYaw.reshape(-1, nTurbines), rotorDiameter,
+                              caseAxialInduction.reshape(-1, nTurbines), generator_efficiency, caseVinf, rho, pP,
+                              curve_wind_speed, curve_CP, curve_CT, parameters, nProcesses)[3]
+
+    # cases as second to last axis, (DIR,CASE,TURB) or (DIR,SPEED,CASE,TURB)
+    wt_power = wt_power.reshape((nDirections, nCases)+wt_power.shape[1:])
+    wt_power = np.moveaxis(wt_power, 1, -2)
+
+    nVariables = 3*nTurbines
+    if form == 'central':
+        gradients = (wt_power[..., 1:1+nVariables, :]-wt_power[..., 1+nVariables:, :])/(2*step)
+    else:
+        gradients = (wt_power[..., 1:, :]-wt_power[..., :1, :])/step
+    gradients = np.swapaxes(gradients, -1, -2)
+
+    return gradients[..., :nTurbines], gradients[..., nTurbines:2*nTurbines], gradients[..., 2*nTurbines:]
+
+
+# inputs of floris_sweep and the variables of calcSweepPowerGradients they are perturbed as
+sweepFrameNames = {'turbineXw': 'turbineX', 'turbineYw': 'turbineY'}
+
+
+def applyPowerGradients(gradients, arg, yawShape):
+    """perturbation of wt_power for the perturbations of turbineX, turbineY and yaw in arg, with the gradients of
+    calcSweepPowerGradients"""
+
+    dwt_power_dturbineX, dwt_power_dturbineY, dwt_power_dyaw = gradients
+
+    dPower = np.zeros(dwt_power_dyaw.shape[:-1])
+    if 'turbineX' in arg:
+        dPower += np.dot(dwt_power_dturbineX, np.ravel(arg['turbineX']))
+    if 'turbineY' in arg:
+        dPower += np.dot(dwt_power_dturbineY, np.ravel(arg['turbineY']))
+    if 'yaw' in arg:
+        dyaw = np.reshape(arg['yaw'], yawShape)
+        if dwt_power_dyaw.ndim == 4:
+            dyaw = dyaw[:, np.newaxis, :]
+        dPower += np.einsum('...ij,...j->...i', dwt_power_dyaw, dyaw)
+
+    return dPower
+
+
+def applyPowerGradientsT(gradients, sPower, result):
+    """add the seeds of turbineX, turbineY and yaw for the seeds sPower of wt_power to result, with the gradients of
+    calcSweepPowerGradients"""
+
+    dwt_power_dturbineX, dwt_power_dturbineY, dwt_power_dyaw = gradients
+    nTurbines = dwt_power_dyaw.shape[-1]
+
+    if 'turbineX' in result:
+        sX = np.dot(sPower.reshape(-1), dwt_power_dturbineX.reshape(-1, nTurbines))
+        result['turbineX'] += sX.reshape(np.shape(result['turbineX']))
+    if 'turbineY' in result:
+        sY = np.dot(sPower.reshape(-1), dwt_power_dturbineY.reshape(-1, nTurbines))
+        result['turbineY'] += sY.reshape(np.shape(result['turbineY']))
+    if 'yaw' in result:
+        sYaw = np.einsum('...i,...ij->...j', sPower, dwt_power_dyaw)
+        if sYaw.ndim == 3:
+            sYaw = np.sum(sYaw, axis=1)
+        result['yaw'] += sYaw.reshape(np.shape(result['yaw']))
+
+
+class PowerCache(object):
+    """ Bounded cache of converged turbine states by the key of calcStateKey, the least recently used state is
+    dropped when more than maxSize states are held (maxSize 0 disables the cache) """
+
+    def __init__(self, maxSize):
+
+        self.maxSize = maxSize
+        self.states = OrderedDict()
+
+    def get(self, key):
+        """state of key, or None if it is not held"""
+
+        state = self.states.pop(key, None)
+        if state is not None:
+            self.states[key] = state
+
+        return state
+
+    def put(self, key, state):
+
+        self.states.pop(key, None)
+        self.states[key] = state
+        while len(self.states) > self.maxSize:
+            self.states.popitem(last=False)
+
+
+def calcStateKey(parameters, *values):
+    """hash of the FLORISParameters values and of the given arrays and scalars, including their shapes and types
+
+    The turbine positions in the wind direction reference frame also hold the wind direction."""
+
+    parameterValues = [np.asarray(getattr(parameters, name)) for name in sorted(parameters.trait_names(iotype='in'))]
+
+    digest = hashlib.sha1()
+    for value in parameterValues+[np.asarray(value) for value in values]:
+        digest.update(str(value.dtype)+str(value.shape))
+        digest.update(np.ascontiguousarray(value).tobytes())
+
+    return digest.hexdigest()
+
+
+def calcWindFrame(turbineX, turbineY, windDirection):
+    """rotate turbine positions into the downwind-crosswind reference frame of each wind direction, as in
+    floris_windframe (windDirection in degrees)
+
+    Returns turbineXw(DIR,TURB), turbineYw(DIR,TURB) for windDirection(DIR)"""
+
+    windDirection = np.reshape(windDirection, (-1, 1))*np.pi/180.0
+    turbineXw = np.cos(-windDirection)*turbineX - np.sin(-windDirection)*turbineY
+    turbineYw = np.sin(-windDirection)*turbineX + np.cos(-windDirection)*turbineY
+
+    return turbineXw, turbineYw
+
+
+def calcOverlapAreas(turbineX,turbineY,rotorDiameter,wakeDiameters,wakeCenters):
+    """calculate overlap of rotors and wake zones (wake zone location defined by wake center and wake diameter)
+    turbineX,turbineY is x,y-location of center of rotor
+
+    wakeOverlap(TURBI,TURB,ZONEI) = overlap area of zone ZONEI of wake of turbine TURB with rotor of downstream turbine
+    TURBI
+
+    All (TURBI,TURB,ZONEI) triples are evaluated at once by broadcasting, pairs where TURBI is not downstream of TURB
+    are masked to zero. Results are identical to those of the former loop over turbines, turbines and zones."""
+
+    # distance between wake center and rotor center, and radii, all with shape (TURBI,TURB,ZONEI)
+    OVdYd = np.abs(wakeCenters-turbineY[..., :, np.newaxis])[..., np.newaxis]
+    OVr = (rotorDiameter/2)[..., :, np.newaxis, np.newaxis]
+    OVR = wakeDiameters/2
+
+    wakeOverlap = calcZoneOverlap(OVdYd, OVr, OVR)
+
+    # only rotors downstream of a turbine can overlap with its wake
+    downstream = (turbineX[..., :, np.newaxis] > turbineX[..., np.newaxis, :])[..., np.newaxis]
+    wakeOverlap = np.where(downstream, wakeOverlap, 0.0)
+
+    return wakeOverlap
+
+
+def calcOverlapAreasPairs(turbineY, rotorDiameter, wakePairs, wakeDiameters, wakeCenters):
+    """calculate overlap of rotors and wake zones for a list of (downstream turbine, upstream turbine) pairs
+
+    wakePairs(0,PAIR), wakePairs(1,PAIR) = indices TURBI, TURB of each pair (TURBI downstream of TURB)
+    wakeCenters(PAIR), wakeDiameters(PAIR,ZONEI) = wake center and zone diameters of wake of TURB at rotor of TURBI
+
+    wakeOverlap(PAIR,ZONEI) = overlap area of zone ZONEI of wake of turbine TURB with rotor of turbine TURBI"""
+
+    turbI = wakePairs[0]
+
+    OVdYd = np.abs(wakeCenters-turbineY[turbI])[:, np.newaxis]
+    OVr = (rotorDiameter/2)[turbI][:, np.newaxis]
+    OVR = wakeDiameters/2
+
+    return calcZoneOverlap(OVdYd, OVr, OVR)
+
+
+def calcZoneOverlap(OVdYd, OVr, OVR):
+    """calculate the overlap area of each wake zone ring with a rotor
+
+    OVdYd = distance between wake center and rotor center, OVr = rotor radius, OVR(...,ZONEI) = wake zone radius, all
+    broadcast against each other. The last axis of the result runs over the zones."""
+
+    if kernelBackend == 'numba':
+        return numba_kernels.calcZoneOverlap(OVdYd, OVr, OVR)
+
+    # branches that are not selected may divide by zero or leave the domain of arccos, those values are discarded
+    with np.errstate(divide='ignore', invalid='ignore'):
+        OVL = np.where(OVdYd != 0, (-np.power(OVr,2.0)+np.power(OVR,2.0)+np.power(OVdYd,2.0))/(2.0*OVdYd), 0.0)
+        OVz = np.sqrt(np.maximum(np.power(OVR,2.0)-np.power(OVL,2.0), 0.0))
+        partialOverlap = np.power(OVR,2.0)*np.arccos(OVL/OVR) + np.power(OVr,2.0)*np.arccos((OVdYd-OVL)/OVr) - OVdYd*OVz
+
+    fullOverlap = np.where(OVR > OVr, np.pi*np.power(OVr,2.0), np.pi*np.power(OVR,2.0))
+    zoneOverlap = np.where((OVL < OVR) & ((OVdYd-OVL) < OVr), partialOverlap, fullOverlap)
+
+    # only rotors that intersect the wake zone have overlap
+    zoneOverlap = np.where(OVdYd < (OVr+OVR), zoneOverlap, 0.0)
+
+    # convert overlap of full zone disks to overlap of the zone rings
+    zoneOverlap[..., 2] = zoneOverlap[..., 2]-zoneOverlap[..., 1]
+    zoneOverlap[..., 1] = zoneOverlap[..., 1]-zoneOverlap[..., 0]
+
+    return zoneOverlap
+
+
+def calcZoneOverlapDerivatives(OVdYd, OVr, OVR):
+    """calculate the derivatives of the overlap area of each full wake zone disk with a rotor (calcZoneOverlap before
+    the conversion to rings) with respect to OVdYd and OVR
+
+    Where disk and rotor intersect partially, the area decreases with the chord length as the centers move apart and
+    grows with the arc length of the wake zone circle as its radius grows. Contained disks only grow with their own
+    radius. Returns dOverlap_dOVdYd, dOverlap_dOVR with the shape of the calcZoneOverlap result"""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        OVL = np.where(OVdYd != 0, (-np.power(OVr,2.0)+np.power(OVR,2.0)+np.power(OVdYd,2.0))/(2.0*OVdYd), 0.0)
+        OVz = np.sqrt(np.maximum(np.power(OVR,2.0)-np.power(OVL,2.0), 0.0))
+        partialOverlap = (OVL < OVR) & ((OVdYd-OVL) < OVr)
+        dPartial_dOVR = 2.0*OVR*np.arccos(OVL/OVR)
+
+    dFull_dOVR = np.where(OVR > OVr, 0.0, 2.0*np.pi*OVR)
+    dOverlap_dOVdYd = np.where(partialOverlap, -2.0*OVz, 0.0)
+    dOverlap_dOVR = np.where(partialOverlap, dPartial_dOVR, dFull_dOVR)
+
+    # only rotors that intersect the wake zone have overlap
+    intersect = OVdYd < (OVr+OVR)
+    dOverlap_dOVdYd = np.where(intersect, dOverlap_dOVdYd, 0.0)
+    dOverlap_dOVR = np.where(intersect, dOverlap_dOVR, 0.0)
+
+    return dOverlap_dOVdYd, dOverlap_dOVR
@@ -12,6 +12,7 @@ import pickle
 
 from Parameters import FLORISParameters
 from Circle_assembly import floris_assembly_opt_AEP
+from Circle_components import calcYawSweepPower
 
 # Load steady-state power data from SOWFA 
 ICOWESdata = loadmat('YawPosResults.mat')
@@ -30,9 +31,12 @@ datasize = NREL5MWCPCT.CP.size
 turbineXinit = np.array([1118.1, 1881.9])
 turbineYinit = np.array([1279.5, 1720.5])
 
+# the hub-height plane (ws_positionX etc.) and the cut-through plane (ws_positionX_cut etc.) are sampled in the same
+# run from one turbine solve
 myFloris = floris_assembly_opt_AEP(nTurbines=2, nDirections=1, optimize_yaw=False,
                                    optimize_position=False,
-                                   datasize=datasize, nSamples = resolution*resolution)
+                                   datasize=datasize, nSamples = resolution*resolution,
+                                   sampleSets=[('cut', resolution*resolution)], solver='sweep')
 
 # use default FLORIS parameters
 myFloris.parameters = FLORISParameters()
@@ -78,9 +82,23 @@ ws_positionX = xx.flatten()
 ws_positionY = yy.flatten()
 ws_positionZ = np.ones(ws_positionX.shape)*hub_height
 
+# sample positions of both planes do not change with the yaw or position of the back turbine
+myFloris.ws_positionX = np.copy(ws_positionX)
+myFloris.ws_positionY = np.copy(ws_positionY)
+myFloris.ws_positionZ = np.copy(ws_positionZ)
+myFloris.ws_positionX_cut = np.copy(positionF[0])
+myFloris.ws_positionY_cut = np.copy(positionF[1])
+myFloris.ws_positionZ_cut = np.copy(positionF[2])
+
 # SWEEP TURBINE YAW
-FLORISpower = list()
 yawrange = ICOWESdata['yaw'][0]
+yawCases = np.array([yawrange, np.zeros(len(yawrange))]).transpose()
+
+# turbine powers of all yaw settings from a single vectorized evaluation
+FLORISpower = calcYawSweepPower(myFloris.turbineX, myFloris.turbineY, windDirection, yawCases,
+                                myFloris.rotorDiameter, myFloris.axialInduction, myFloris.generator_efficiency,
+                                wind_speed, myFloris.air_density, myFloris.parameters.pP, myFloris.curve_wind_speed,
+                                myFloris.curve_CP, myFloris.curve_CT, myFloris.parameters)[1]
 
 velocities = list()
 velocities_cut = list()
@@ -89,20 +107,10 @@ for yaw1 in yawrange:
 
     myFloris.yaw = np.array([yaw1, 0.0])
 
-    # Call FLORIS horizontal slice
-    myFloris.ws_positionX = np.copy(ws_positionX)
-    myFloris.ws_positionY = np.copy(ws_positionY)
-    myFloris.ws_positionZ = np.copy(ws_positionZ)
+    # Call FLORIS horizontal and cut-through slice
     myFloris.run()
-    FLORISpower.append(myFloris.floris_power_0.wt_power)
     velocities.append(np.copy(myFloris.ws_array_0))
-
-   # Call FLORIS cut-through slice
-    myFloris.ws_positionX = np.copy(positionF[0])
-    myFloris.ws_positionY = np.copy(positionF[1])
-    myFloris.ws_positionZ = np.copy(positionF[2])
-    myFloris.run()
-    velocities_cut.append(np.copy(myFloris.ws_array_0))
+    velocities_cut.append(np.copy(myFloris.ws_array_cut_0))
 
 # plot slices
 velocities = np.array(velocities)
@@ -170,20 +178,11 @@ for pos2 in posrange:
     myFloris.turbineX = XY[0,:]
     myFloris.turbineY = XY[1,:]
 
-    # Call FLORIS horizontal slice
-    myFloris.ws_positionX = np.copy(ws_positionX)
-    myFloris.ws_positionY = np.copy(ws_positionY)
-    myFloris.ws_positionZ = np.copy(ws_positionZ)
+    # Call FLORIS horizontal and cut-through slice
     myFloris.run()
-    FLORISpower.append(myFloris.floris_power_0.wt_power)
+    FLORISpower.append(myFloris.floris_sweep_0.wt_power)
     velocities.append(np.copy(myFloris.ws_array_0))
-
-    # Call FLORIS cut-through slice
-    myFloris.ws_positionX = np.copy(positionF[0])
-    myFloris.ws_positionY = np.copy(positionF[1])
-    myFloris.ws_positionZ = np.copy(positionF[2])
-    myFloris.run()
-    velocities_cut.append(np.copy(myFloris.ws_array_0))
+    velocities_cut.append(np.copy(myFloris.ws_array_cut_0))
 
 # plot powers
 FLORISpower = np.array(FLORISpower)
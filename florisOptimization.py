@@ -2,6 +2,7 @@ from matplotlib import pyplot as plt
 import cPickle as pickle
 import numpy as np
 from Circle_assembly import floris_assembly_opt_AEP
+from Circle_components import calcWindFrame, calcGridPositions
 from scipy.io import loadmat
 
 import time
@@ -117,14 +118,13 @@ optYawMaxIncrease = optYaws[caseMaxIncrease]
 windDirectionFLORISmaxIncrease = windDirectionsFLORIS[caseMaxIncrease]
 windDirectionsWindRosemaxIncrease = windDirectionsWindRose[caseMaxIncrease]
 
-# ... define sampling field
+# ... define sampling grid, aligned with the wind direction and covering the farm
 resolution = 300
-xSamples = np.linspace(np.min(turbineX-200.), np.max(turbineX+200.), resolution)
-ySamples = np.linspace(np.min(turbineY-200.), np.max(turbineY+200.), resolution)
-nSamples = resolution**2
-xxSamples, yySamples = np.meshgrid(xSamples, ySamples)
-zzSamples = np.ones(xxSamples.shape)*optFloris.hubHeight[0]
-nSamples = len(zzSamples.flatten())
+gridShape = (resolution, resolution)
+turbineXw, turbineYw = calcWindFrame(turbineX, turbineY, windDirection)
+gridOrigin = np.ravel(calcWindFrame(np.min(turbineXw-200.), np.min(turbineYw-200.), -windDirection))
+gridSpacing = np.array([np.ptp(turbineXw)+400., np.ptp(turbineYw)+400., 0.])/(resolution-1)
+xxSamples, yySamples, zzSamples = calcGridPositions(gridOrigin, gridSpacing, gridShape, hub_height, windDirection)
 
 # setup the plot figure
 fig, axes = plt.subplots(nrows = 1, ncols = 2, figsize=(20,10))
@@ -134,7 +134,7 @@ fig.suptitle('wind direction %.1f deg' % windDirectionsWindRosemaxIncrease)
 # .. setup FLORIS for visualization case
 yaws = list()
 
-visualFloris = floris_assembly_opt_AEP(nTurbines=nTurbines, nDirections=1, optimize_yaw=False, optimize_position=False, datasize=datasize, nSamples = nSamples, nSpeeds = 1)
+visualFloris = floris_assembly_opt_AEP(nTurbines=nTurbines, nDirections=1, optimize_yaw=False, optimize_position=False, datasize=datasize, nSamples = 0, sampleGrids = [('farm', gridShape)], nSpeeds = 1, sampleDtype = 'float32')
 
 visualFloris.windrose_directions    = np.array([windDirection]);
 visualFloris.initVelocitiesTurbines = np.copy(np.ones_like(baselineFloris.windrose_directions)*windSpeed)
@@ -150,16 +150,16 @@ visualFloris.turbineY               = turbineY
 visualFloris.axialInduction         = np.ones(nTurbines)*axialInduction # values used for initialization only
 visualFloris.hubHeight              = np.ones(nTurbines)*hub_height
 visualFloris.generator_efficiency   = np.ones(nTurbines)*generator_efficiency
-visualFloris.ws_positionX           = xxSamples.flatten()
-visualFloris.ws_positionY           = yySamples.flatten()
-visualFloris.ws_positionZ           = zzSamples.flatten()
+visualFloris.gridOrigin_farm        = gridOrigin
+visualFloris.gridSpacing_farm       = gridSpacing
+visualFloris.gridHeight_farm        = hub_height
 
 # run visual baseline case (default zero yaw)
 print 'running visualization'
 tic = time.time()
 visualFloris.run()
 toc = time.time()
-velocitiesBaseline = np.copy(visualFloris.ws_array_0.reshape(len(ySamples), len(xSamples)))
+velocitiesBaseline = np.copy(visualFloris.ws_grid_farm_0)
 yaws.append(np.copy(visualFloris.yaw))
 
 # run visual optimal yawcase
@@ -168,13 +168,13 @@ yaws.append(np.copy(visualFloris.yaw))
 visualFloris.run()
 print 'done'
 print('FLORIS visualization took %.03f sec.' % (toc-tic))
-velocitiesOpt = np.copy(visualFloris.ws_array_0.reshape(len(ySamples), len(xSamples)))
+velocitiesOpt = np.copy(visualFloris.ws_grid_farm_0)
 
 vmax = np.max([velocitiesBaseline.max(),velocitiesOpt.max()])
 vmin = np.min([velocitiesBaseline.min(),velocitiesOpt.min()])
-axes[0].pcolormesh(xSamples, ySamples, velocitiesBaseline, cmap='coolwarm', vmin=vmin, vmax=vmax)
+axes[0].pcolormesh(xxSamples, yySamples, velocitiesBaseline, cmap='coolwarm', vmin=vmin, vmax=vmax)
 axes[0].set_title('baseline')
-im = axes[1].pcolormesh(xSamples, ySamples, velocitiesOpt, cmap='coolwarm', vmin=vmin, vmax=vmax)
+im = axes[1].pcolormesh(xxSamples, yySamples, velocitiesOpt, cmap='coolwarm', vmin=vmin, vmax=vmax)
 axes[1].set_title('optimized yaw')
 
 for axI, ax in enumerate(axes):
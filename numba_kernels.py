@@ -0,0 +1,203 @@
+"""compiled versions of the overlap, wake geometry and turbine velocity kernels of Circle_components
+
+The kernels take the arguments of the Circle_components functions of the same name and loop over turbines, pairs and
+samples without temporary arrays. They are only used when numba is installed, see Circle_components.setKernelBackend.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    available = True
+except ImportError:
+    available = False
+
+    def njit(*args, **kwargs):
+        """without numba the loops below stay plain Python, they are not selected as backend then"""
+        return lambda function: function
+
+
+@njit(cache=True, nogil=True)
+def _diskOverlap(OVdYd, OVr, OVR):
+    """overlap area of a wake zone disk of radius OVR with a rotor of radius OVr at distance OVdYd, as in
+    calcZoneOverlap before the conversion to rings"""
+
+    if not OVdYd < OVr+OVR:
+        return 0.0
+
+    if OVdYd != 0:
+        OVL = (-OVr*OVr+OVR*OVR+OVdYd*OVdYd)/(2.0*OVdYd)
+    else:
+        OVL = 0.0
+
+    if OVL < OVR and (OVdYd-OVL) < OVr:
+        OVz = np.sqrt(max(OVR*OVR-OVL*OVL, 0.0))
+        return OVR*OVR*np.arccos(OVL/OVR) + OVr*OVr*np.arccos((OVdYd-OVL)/OVr) - OVdYd*OVz
+    elif OVR > OVr:
+        return np.pi*OVr*OVr
+    else:
+        return np.pi*OVR*OVR
+
+
+@njit(cache=True, nogil=True)
+def _zoneOverlap(OVdYd, OVr, OVR, zoneOverlap):
+
+    for k in range(OVdYd.shape[0]):
+        inner = 0.0
+        for zone in range(OVdYd.shape[1]):
+            disk = _diskOverlap(OVdYd[k, zone], OVr[k, zone], OVR[k, zone])
+            zoneOverlap[k, zone] = disk-inner
+            inner = disk
+
+
+def calcZoneOverlap(OVdYd, OVr, OVR):
+    """compiled calcZoneOverlap"""
+
+    OVdYd, OVr, OVR = np.broadcast_arrays(np.asarray(OVdYd, dtype=float), np.asarray(OVr, dtype=float),
+                                          np.asarray(OVR, dtype=float))
+    shape = OVdYd.shape
+    nZones = shape[-1]
+
+    zoneOverlap = np.zeros((OVdYd.size//nZones, nZones))
+    _zoneOverlap(np.ascontiguousarray(OVdYd).reshape(-1, nZones), np.ascontiguousarray(OVr).reshape(-1, nZones),
+                 np.ascontiguousarray(OVR).reshape(-1, nZones), zoneOverlap)
+
+    return zoneOverlap.reshape(shape)
+
+
+@njit(cache=True, nogil=True)
+def _wakeReduction(deltax, radiusLoc, wakeDiameter0, wakeDiameter1, wakeDiameter2, rotorDiameter, axialInd, ke, mU):
+    """velocity reduction factor of one wake at a sample, classified as in calcSampleVelocities"""
+
+    if radiusLoc < wakeDiameter0/2.0:
+        zone = 0
+    elif radiusLoc < wakeDiameter1/2.0:
+        zone = 1
+    elif radiusLoc < wakeDiameter2/2.0:
+        zone = 2
+    else:
+        zone = 3
+
+    if deltax > 0 and zone < 3:
+        coeff = rotorDiameter/(rotorDiameter+2*ke*mU[zone]*max(0.0, deltax))
+        return (2*axialInd)*(coeff*coeff)
+    elif deltax <= 0 and radiusLoc < rotorDiameter/2.0:
+        return (2*axialInd)*(0.5+np.arctan(2.0*min(0.0, deltax)/rotorDiameter)/np.pi)
+    return 0.0
+
+
+@njit(cache=True, nogil=True)
+def _sampleVelocities(velX, velY, velZ, turbineXw, wakeCentersY, wakeCentersZ, wakeDiameters, rotorDiameter,
+                      axialInd, keArray, mU, Vinf, shearCoefficientAlpha, shearZh, ws_array):
+
+    for loc in range(velX.size):
+        ws = Vinf*(velZ[loc]/shearZh)**shearCoefficientAlpha
+        for turb in range(turbineXw.size):
+            deltay = velY[loc]-wakeCentersY[loc, turb]
+            deltaz = velZ[loc]-wakeCentersZ[loc, turb]
+            radiusLoc = np.sqrt(deltay*deltay+deltaz*deltaz)
+            ws *= 1-_wakeReduction(velX[loc]-turbineXw[turb], radiusLoc, wakeDiameters[loc, turb, 0],
+                                   wakeDiameters[loc, turb, 1], wakeDiameters[loc, turb, 2], rotorDiameter[turb],
+                                   axialInd[turb], keArray[turb], mU[turb])
+        ws_array[loc] = ws
+
+
+def calcSampleVelocities(velX, velY, velZ, turbineXw, wakeCentersY, wakeCentersZ, wakeDiameters, rotorDiameter,
+                         axialInd, keArray, mU, Vinf, shearCoefficientAlpha, shearZh, out=None):
+    """compiled calcSampleVelocities, the per-sample arrays are used in their own precision"""
+
+    ws_array = out if out is not None else np.zeros(np.size(velX), dtype=np.result_type(velX, np.float32))
+    _sampleVelocities(np.asarray(velX), np.asarray(velY), np.asarray(velZ), np.asarray(turbineXw, dtype=float),
+                      np.asarray(wakeCentersY), np.asarray(wakeCentersZ), np.asarray(wakeDiameters),
+                      np.asarray(rotorDiameter, dtype=float), np.asarray(axialInd, dtype=float),
+                      np.asarray(keArray, dtype=float), np.asarray(mU, dtype=float), float(Vinf),
+                      float(shearCoefficientAlpha), float(shearZh), ws_array)
+
+    return ws_array
+
+
+@njit(cache=True, nogil=True)
+def _wakeDisplacement(deltax, wakeAngleInit, rotorDiameter, kd):
+    """yaw-induced displacement of a wake center, as in calcWakeDisplacement"""
+
+    factor = (2.0*kd*deltax/rotorDiameter)+1.0
+    factor4 = (factor*factor)*(factor*factor)
+    wakeAngleInit2 = wakeAngleInit*wakeAngleInit
+    return (wakeAngleInit*(15.0*factor4+wakeAngleInit2)/((30.0*kd*(factor4*factor))/rotorDiameter)) - \
+        (wakeAngleInit*rotorDiameter*(15.0+wakeAngleInit2)/(30.0*kd))
+
+
+@njit(cache=True, nogil=True)
+def _sampleVelocitiesWakes(velX, velY, velZ, turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit,
+                           wakeDiameter0, zoneExpansion, axialInd, keArray, mU, Vinf, kd, useWakeAngle, bd,
+                           initialWakeDisplacement, shearCoefficientAlpha, shearZh, ws_array):
+
+    for loc in range(velX.size):
+        ws = Vinf*(velZ[loc]/shearZh)**shearCoefficientAlpha
+        for turb in range(turbineXw.size):
+            # wake center and zone diameters at the sample, as in calcWakeGeometrySamples
+            deltax = velX[loc]-turbineXw[turb]
+            deltaxWake = max(deltax, 0.0)
+            displacement = _wakeDisplacement(deltaxWake, wakeAngleInit[turb], rotorDiameter[turb], kd)
+            if not useWakeAngle:
+                displacement += bd*deltaxWake
+            deltay = velY[loc]-(turbineYw[turb]+initialWakeDisplacement+displacement)
+            deltaz = velZ[loc]-hubHeight[turb]
+            radiusLoc = np.sqrt(deltay*deltay+deltaz*deltaz)
+            ws *= 1-_wakeReduction(deltax, radiusLoc, wakeDiameter0[turb]+zoneExpansion[turb, 0]*deltaxWake,
+                                   wakeDiameter0[turb]+zoneExpansion[turb, 1]*deltaxWake,
+                                   wakeDiameter0[turb]+zoneExpansion[turb, 2]*deltaxWake, rotorDiameter[turb],
+                                   axialInd[turb], keArray[turb], mU[turb])
+        ws_array[loc] = ws
+
+
+def calcSampleVelocitiesWakes(velX, velY, velZ, turbineXw, turbineYw, hubHeight, rotorDiameter, wakeAngleInit,
+                              wakeDiameter0, zoneExpansion, axialInd, keArray, mU, Vinf, parameters, out=None):
+    """wind speed at the samples with the wake geometry evaluated per sample and turbine in the same loop, as
+    calcSampleVelocities on the results of calcWakeGeometrySamples but without the per-sample wake arrays. The wind
+    speeds are written into out if it is given."""
+
+    ws_array = out if out is not None else np.zeros(np.size(velX), dtype=np.result_type(velX, np.float32))
+    _sampleVelocitiesWakes(np.asarray(velX), np.asarray(velY), np.asarray(velZ), np.asarray(turbineXw, dtype=float),
+                           np.asarray(turbineYw, dtype=float), np.asarray(hubHeight, dtype=float),
+                           np.asarray(rotorDiameter, dtype=float), np.asarray(wakeAngleInit, dtype=float),
+                           np.asarray(wakeDiameter0, dtype=float)*np.ones(np.size(turbineXw)),
+                           np.asarray(zoneExpansion, dtype=float), np.asarray(axialInd, dtype=float),
+                           np.asarray(keArray, dtype=float), np.asarray(mU, dtype=float), float(Vinf),
+                           float(parameters.kd), bool(parameters.useWakeAngle), float(parameters.bd),
+                           float(parameters.initialWakeDisplacement), float(parameters.shearCoefficientAlpha),
+                           float(parameters.shearZh), ws_array)
+
+    return ws_array
+
+
+@njit(cache=True, nogil=True)
+def _turbineVelocities(turbineXw, turbI, turb, wakeOverlapTRel, rotorDiameter, axialInd, keArray, mU, Vinf,
+                       velocitiesTurbines):
+
+    wakeEffCoeff = np.zeros(turbineXw.size)
+    for pair in range(turbI.size):
+        deltax = turbineXw[turbI[pair]]-turbineXw[turb[pair]]
+        wakeEffCoeffPerZone = 0.0
+        upstream = turb[pair]
+        for zone in range(3):
+            coeff = rotorDiameter[upstream]/(rotorDiameter[upstream]+2*keArray[upstream]*mU[upstream, zone]*deltax)
+            wakeEffCoeffPerZone += coeff*coeff*wakeOverlapTRel[pair, zone]
+        pairDeficit = axialInd[upstream]*wakeEffCoeffPerZone
+        wakeEffCoeff[turbI[pair]] += pairDeficit*pairDeficit
+
+    for turbine in range(turbineXw.size):
+        velocitiesTurbines[turbine] = Vinf*(1-2*np.sqrt(wakeEffCoeff[turbine]))
+
+
+def calcTurbineVelocities(turbineXw, wakePairs, wakeOverlapTRel, rotorDiameter, axialInd, keArray, mU, Vinf):
+    """compiled calcTurbineVelocities"""
+
+    velocitiesTurbines = np.zeros(np.size(turbineXw))
+    _turbineVelocities(np.asarray(turbineXw, dtype=float), np.asarray(wakePairs[0], dtype=np.int64),
+                       np.asarray(wakePairs[1], dtype=np.int64), np.asarray(wakeOverlapTRel, dtype=float),
+                       np.asarray(rotorDiameter, dtype=float), np.asarray(axialInd, dtype=float),
+                       np.asarray(keArray, dtype=float), np.asarray(mU, dtype=float), float(Vinf),
+                       velocitiesTurbines)
+
+    return velocitiesTurbines
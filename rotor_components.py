@@ -1,7 +1,7 @@
 from openmdao.main.api import Component, VariableTree
 from openmdao.lib.datatypes.api import Array, Float, Bool, Int, List, Str, VarTree
 import numpy as np
-from scipy import interp
+from sparse_derivatives import applyDiagonalDeriv, applyDiagonalDerivT
 
 ## Components that interpolate a predefined CP/CT curve and apply a yaw correction
 
@@ -34,87 +34,185 @@ class CPCT_Interpolate(Component):
         self.add('CP', Array(np.zeros(nTurbines), iotype='out'))
         self.add('CT', Array(np.zeros(nTurbines), iotype='out'))
 
+        # segment slopes of the CP/CT curve, rebuilt when the curve changes
+        self.curve = None
+
     def execute(self):
 
         #print 'in CPCT_Interpolate'
-        
-        print "first speed, first CT", self.windSpeedToCPCT.wind_speed[0], self.windSpeedToCPCT.CT[0], self.windSpeedToCPCT.CT[1]
-        print "last speed, last CT", self.windSpeedToCPCT.wind_speed[-1], self.windSpeedToCPCT.CP[-1]
-        print "pP: ", self.pP
-        wind_speed_ax = np.cos(self.yaw*np.pi/180.0)**(self.pP/3.0)*self.wind_speed_hub
-        # use interpolation on precalculated CP-CT curve
-        wind_speed_ax = np.maximum(wind_speed_ax, self.windSpeedToCPCT.wind_speed[0])
-        wind_speed_ax = np.minimum(wind_speed_ax, self.windSpeedToCPCT.wind_speed[-1])
-        self.CP = interp(wind_speed_ax, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP)
-        self.CT = interp(wind_speed_ax, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CT)
 
-        # normalize on incoming wind speed to correct coefficients for yaw
-        self.CP = self.CP * np.cos(self.yaw*np.pi/180.0)**self.pP
-        self.CT = self.CT * np.cos(self.yaw*np.pi/180.0)**2
-        
-        print "in rotor, Cp = ", self.CP
-        print "in rotor, Ct = ", self.CT
-        print "in rotor, pP = ", self.pP
-        # print 'in CPCT interp, wind_speed_hub = ', self.wind_speed_hub
+        curve = self.windSpeedToCPCT
+        if self.curve is None or not self.curve.matches(curve.wind_speed, curve.CP, curve.CT):
+            self.curve = CPCTCurve(curve.wind_speed, curve.CP, curve.CT)
+
+        # coefficients and their derivatives in one pass, the derivatives are kept for the derivative products
+        self.CP, self.CT, self.dCP_dwind, self.dCP_dyaw, self.dCT_dwind, self.dCT_dyaw = \
+            self.curve.evaluate(self.wind_speed_hub, self.yaw, self.pP)
 
     def list_deriv_vars(self):
         return ('yaw', 'wind_speed_hub'), ('CP', 'CT')
 
-    def provideJ(self):
-
-        #print 'in CPCT_Interpolate - provideJ'
-        
-         # standard central differencing
-        # set step size for finite differencing
-        h = 1e-6
-
-        # calculate upper and lower function values
-        wind_speed_ax_high_yaw = np.cos((self.yaw+h)*np.pi/180.0)**(self.pP/3.0)*self.wind_speed_hub
-        wind_speed_ax_low_yaw = np.cos((self.yaw-h)*np.pi/180.0)**(self.pP/3.0)*self.wind_speed_hub
-        wind_speed_ax_high_wind = np.cos(self.yaw*np.pi/180.0)**(self.pP/3.0)*(self.wind_speed_hub+h)
-        wind_speed_ax_low_wind = np.cos(self.yaw*np.pi/180.0)**(self.pP/3.0)*(self.wind_speed_hub-h)
-
-        # use interpolation on precalculated CP-CT curve
-        wind_speed_ax_high_yaw = np.maximum(wind_speed_ax_high_yaw, self.windSpeedToCPCT.wind_speed[0])
-        wind_speed_ax_low_yaw = np.maximum(wind_speed_ax_low_yaw, self.windSpeedToCPCT.wind_speed[0])
-        wind_speed_ax_high_wind = np.maximum(wind_speed_ax_high_wind, self.windSpeedToCPCT.wind_speed[0])
-        wind_speed_ax_low_wind = np.maximum(wind_speed_ax_low_wind, self.windSpeedToCPCT.wind_speed[0])
-
-        wind_speed_ax_high_yaw = np.minimum(wind_speed_ax_high_yaw, self.windSpeedToCPCT.wind_speed[-1])
-        wind_speed_ax_low_yaw = np.minimum(wind_speed_ax_low_yaw, self.windSpeedToCPCT.wind_speed[-1])
-        wind_speed_ax_high_wind = np.minimum(wind_speed_ax_high_wind, self.windSpeedToCPCT.wind_speed[-1])
-        wind_speed_ax_low_wind = np.minimum(wind_speed_ax_low_wind, self.windSpeedToCPCT.wind_speed[-1])
-
-        CP_high_yaw = interp(wind_speed_ax_high_yaw, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP)
-        CP_low_yaw = interp(wind_speed_ax_low_yaw, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP)
-        CP_high_wind = interp(wind_speed_ax_high_wind, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP)
-        CP_low_wind = interp(wind_speed_ax_low_wind, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CP)
-
-        CT_high_yaw = interp(wind_speed_ax_high_yaw, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CT)
-        CT_low_yaw = interp(wind_speed_ax_low_yaw, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CT)
-        CT_high_wind = interp(wind_speed_ax_high_wind, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CT)
-        CT_low_wind = interp(wind_speed_ax_low_wind, self.windSpeedToCPCT.wind_speed, self.windSpeedToCPCT.CT)
+    def apply_deriv(self, arg, result):
+        applyDiagonalDeriv(self.diagonalJ(), arg, result)
+
+    def apply_derivT(self, arg, result):
+        applyDiagonalDerivT(self.diagonalJ(), arg, result)
+
+    def diagonalJ(self):
+        """the Jacobian is diagonal in each block, only the diagonals of the exact derivatives are kept"""
+
+        return {('CP', 'yaw'): self.dCP_dyaw, ('CP', 'wind_speed_hub'): self.dCP_dwind,
+                ('CT', 'yaw'): self.dCT_dyaw, ('CT', 'wind_speed_hub'): self.dCT_dwind}
+
+
+class CPCTCurve(object):
+    """ Pre-calculated CP/CT curve with the slope of each segment, for evaluating the yaw corrected coefficients and
+    their exact derivatives in one vectorized call """
+
+    def __init__(self, wind_speed, CP, CT):
+
+        self.wind_speed = np.array(wind_speed, dtype=float)
+        self.CP = np.array(CP, dtype=float)
+        self.CT = np.array(CT, dtype=float)
+
+        # slope of each segment, as used by linear interpolation
+        self.CP_slope = np.diff(self.CP)/np.diff(self.wind_speed)
+        self.CT_slope = np.diff(self.CT)/np.diff(self.wind_speed)
+
+    def matches(self, wind_speed, CP, CT):
+        """True if the curve was built from these points"""
+
+        return np.array_equal(wind_speed, self.wind_speed) and np.array_equal(CP, self.CP) and \
+            np.array_equal(CT, self.CT)
+
+    def interpolate(self, wind_speed_ax):
+        """linear interpolation of CP and CT, clipped to the ends of the curve
+
+        Returns CP, CT and their derivatives with respect to wind_speed_ax (zero outside the curve, right-sided at
+        the points of the curve)"""
+
+        wind_speed = self.wind_speed
+        inside = (wind_speed_ax >= wind_speed[0]) & (wind_speed_ax < wind_speed[-1])
+        wind_speed_ax = np.minimum(np.maximum(wind_speed_ax, wind_speed[0]), wind_speed[-1])
+
+        # segment of each wind speed, the last point belongs to the last segment
+        segment = np.clip(np.searchsorted(wind_speed, wind_speed_ax, side='right')-1, 0, wind_speed.size-2)
+        offset = wind_speed_ax-wind_speed[segment]
+
+        CP = self.CP[segment] + self.CP_slope[segment]*offset
+        CT = self.CT[segment] + self.CT_slope[segment]*offset
+        dCP = np.where(inside, self.CP_slope[segment], 0.0)
+        dCT = np.where(inside, self.CT_slope[segment], 0.0)
+
+        return CP, CT, dCP, dCT
+
+    def evaluate(self, wind_speed_hub, yaw, pP):
+        """yaw corrected CP and CT at the hub-height wind speed (yaw in degrees)
+
+        Returns CP, CT, dCP_dwind, dCP_dyaw, dCT_dwind, dCT_dyaw with the derivatives with respect to wind_speed_hub
+        and yaw (per degree) of each turbine"""
+
+        yaw = yaw*np.pi/180.0
+
+        # wind speed normal to the rotor, cos(yaw)**(pP/3) times the hub-height wind speed
+        wind_speed_correction, _, dwind_speed_correction_dyaw, _ = calcYawCorrection(yaw, pP/3.0)
+        wind_speed_ax = wind_speed_correction*wind_speed_hub
+        dwind_ax_dwind = wind_speed_correction
+        dwind_ax_dyaw = dwind_speed_correction_dyaw*wind_speed_hub*np.pi/180.0
+
+        CP, CT, dCP, dCT = self.interpolate(wind_speed_ax)
 
         # normalize on incoming wind speed to correct coefficients for yaw
-        CP_high_yaw = CP_high_yaw * np.cos((self.yaw+h)*np.pi/180.0)**self.pP
-        CP_low_yaw = CP_low_yaw * np.cos((self.yaw-h)*np.pi/180.0)**self.pP
-        CP_high_wind = CP_high_wind * np.cos((self.yaw)*np.pi/180.0)**self.pP
-        CP_low_wind = CP_low_wind * np.cos((self.yaw)*np.pi/180.0)**self.pP
-
-        CT_high_yaw = CT_high_yaw * np.cos((self.yaw+h)*np.pi/180.0)**2
-        CT_low_yaw = CT_low_yaw * np.cos((self.yaw-h)*np.pi/180.0)**2
-        CT_high_wind = CT_high_wind * np.cos((self.yaw)*np.pi/180.0)**2
-        CT_low_wind = CT_low_wind * np.cos((self.yaw)*np.pi/180.0)**2
-
-        # compute derivative via central differencing and arrange in sub-matrices of the Jacobian
-        dCP_dyaw = np.eye(self.nTurbines)*(CP_high_yaw-CP_low_yaw)/(2.0*h)
-        dCP_dwind = np.eye(self.nTurbines)*(CP_high_wind-CP_low_wind)/(2.0*h)
-        dCT_dyaw = np.eye(self.nTurbines)*(CT_high_yaw-CT_low_yaw)/(2.0*h)
-        dCT_dwind = np.eye(self.nTurbines)*(CT_high_wind-CT_low_wind)/(2.0*h)
-
-        # compile full Jacobian from sub-matrices
-        dCP = np.hstack((dCP_dyaw, dCP_dwind))
-        dCT = np.hstack((dCT_dyaw, dCT_dwind))
-        J = np.vstack((dCP, dCT))
-
-        return J
+        CPcorrection, CTcorrection, dCPcorrection_dyaw, dCTcorrection_dyaw = calcYawCorrection(yaw, pP)
+        dCP_dwind = dCP*dwind_ax_dwind*CPcorrection
+        dCP_dyaw = dCP*dwind_ax_dyaw*CPcorrection + CP*dCPcorrection_dyaw*np.pi/180.0
+        dCT_dwind = dCT*dwind_ax_dwind*CTcorrection
+        dCT_dyaw = dCT*dwind_ax_dyaw*CTcorrection + CT*dCTcorrection_dyaw*np.pi/180.0
+
+        return CP*CPcorrection, CT*CTcorrection, dCP_dwind, dCP_dyaw, dCT_dwind, dCT_dyaw
+
+
+def calcYawCorrection(yaw, pP):
+    """factors correcting the power and thrust coefficients of each turbine for yaw (yaw in radians)
+
+    Returns CPcorrection = cos(yaw)**pP, CTcorrection = cos(yaw)**2 and their derivatives with respect to yaw"""
+
+    cosYaw = np.cos(yaw)
+    sinYaw = np.sin(yaw)
+
+    CPcorrection = cosYaw**pP
+    CTcorrection = cosYaw**2
+    dCPcorrection_dyaw = -pP*cosYaw**(pP-1.0)*sinYaw
+    dCTcorrection_dyaw = -2.0*cosYaw*sinYaw
+
+    return CPcorrection, CTcorrection, dCPcorrection_dyaw, dCTcorrection_dyaw
+
+
+def calcYawCorrectedCoefficients(Ct, Cp, yaw, pP, CTcorrected, CPcorrected):
+    """thrust and power coefficients of each turbine, corrected for yaw unless the rotor model already did
+    (yaw in radians)
+
+    Returns Ct, Cp, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw"""
+
+    CPcorrection, CTcorrection, dCPcorrection_dyaw, dCTcorrection_dyaw = calcYawCorrection(yaw, pP)
+
+    if CTcorrected:
+        dCt_dCt = np.ones(np.shape(Ct))
+        dCt_dyaw = np.zeros(np.shape(Ct))
+    else:
+        dCt_dCt = CTcorrection
+        dCt_dyaw = Ct*dCTcorrection_dyaw
+        Ct = Ct*CTcorrection
+
+    if CPcorrected:
+        dCp_dCp = np.ones(np.shape(Cp))
+        dCp_dyaw = np.zeros(np.shape(Cp))
+    else:
+        dCp_dCp = CPcorrection
+        dCp_dyaw = Cp*dCPcorrection_dyaw
+        Cp = Cp*CPcorrection
+
+    return Ct, Cp, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw
+
+
+def calcRotorCoefficients(Ct, Cp, yaw, axialInduction, parameters):
+    """yaw corrected thrust and power coefficients and axial induction of each turbine as used by the wake model,
+    following parameters.CTcorrected, CPcorrected, axialIndProvided and pP (yaw in radians)
+
+    Returns Ct, Cp, axialInd, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw and dAxialInd_dCt (with respect to the corrected
+    Ct)"""
+
+    Ct, Cp, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw = \
+        calcYawCorrectedCoefficients(Ct, Cp, yaw, parameters.pP, parameters.CTcorrected, parameters.CPcorrected)
+
+    if parameters.axialIndProvided:
+        axialInd = axialInduction
+        dAxialInd_dCt = np.zeros(np.shape(Ct))
+    else:
+        axialInd = calcAxialInduction(Ct)
+        dAxialInd_dCt = calcAxialInductionDerivative(Ct)
+
+    return Ct, Cp, axialInd, dCt_dCt, dCt_dyaw, dCp_dCp, dCp_dyaw, dAxialInd_dCt
+
+
+def CTtoAxialInd(CT):
+    """axial induction of a turbine for a scalar thrust coefficient, as calcAxialInduction"""
+
+    return float(calcAxialInduction(np.asarray(CT, dtype=float)))
+
+
+def calcAxialInduction(CT):
+    """axial induction of each turbine for an array of thrust coefficients, with the Glauert correction above
+    CT = 0.96"""
+
+    with np.errstate(invalid='ignore'):
+        axial_induction = np.where(CT > 0.96, 0.143+np.sqrt(0.0203-0.6427*(0.889-CT)), 0.5*(1-np.sqrt(1-CT)))
+    return axial_induction
+
+
+def calcAxialInductionDerivative(CT):
+    """derivative of calcAxialInduction with respect to the thrust coefficient"""
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dAxialInd_dCT = np.where(CT > 0.96, 0.5*0.6427/np.sqrt(0.0203-0.6427*(0.889-CT)), 0.25/np.sqrt(1-CT))
+    return dAxialInd_dCT
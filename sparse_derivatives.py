@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def applyDiagonalDeriv(J, arg, result):
+    """forward derivative product of an elementwise component for apply_deriv
+
+    J maps (output, input) to the diagonal of that block of the Jacobian, as an array or a scalar times the identity,
+    blocks that are not in J are zero"""
+
+    for (output, input), diagonal in J.items():
+        if output in result and input in arg:
+            result[output] += (diagonal*np.ravel(arg[input])).reshape(np.shape(result[output]))
+
+
+def applyDiagonalDerivT(J, arg, result):
+    """adjoint derivative product of an elementwise component for apply_derivT, J as in applyDiagonalDeriv"""
+
+    for (output, input), diagonal in J.items():
+        if output in arg and input in result:
+            result[input] += (diagonal*np.ravel(arg[output])).reshape(np.shape(result[input]))
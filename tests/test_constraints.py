@@ -0,0 +1,67 @@
+"""sparse Jacobian of the turbine separation constraint of Analytic_components against central finite differences
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Analytic_components import dist_const, dist_const_J
+
+
+class SeparationTest(unittest.TestCase):
+
+    nTurbines = 6
+
+    def setUp(self):
+        self.rng = np.random.RandomState(13)
+
+    def test_jacobian(self):
+
+        comp = dist_const(nTurbines=self.nTurbines)
+        for repeat in range(0, 3):
+            turbineX = self.rng.uniform(0., 2000., self.nTurbines)
+            turbineY = self.rng.uniform(0., 2000., self.nTurbines)
+            comp.turbineX, comp.turbineY = turbineX, turbineY
+            comp.execute()
+            J = comp.J
+            values = J.toarray()
+
+            expected = []
+            step = 1e-3
+            for k in range(0, 2*self.nTurbines):
+                separation = []
+                for sign in (1., -1.):
+                    perturbed = np.concatenate((turbineX, turbineY))
+                    perturbed[k] += sign*step
+                    comp.turbineX, comp.turbineY = perturbed[:self.nTurbines], perturbed[self.nTurbines:]
+                    comp.execute()
+                    separation.append(np.array(comp.separation))
+                expected.append((separation[0]-separation[1])/(2*step))
+            np.testing.assert_allclose(values, np.transpose(expected), rtol=1e-5, atol=1e-6)
+
+            # the pattern is kept, its values follow the layout
+            self.assertTrue(comp.J is J)
+
+        i, j = np.triu_indices(self.nTurbines, 1)
+        np.testing.assert_allclose(comp.separation, np.hypot(comp.turbineX[j]-comp.turbineX[i],
+                                                             comp.turbineY[j]-comp.turbineY[i]), rtol=1e-12)
+
+    def test_turbine_count(self):
+
+        J = dist_const_J(self.rng.uniform(0., 2000., 4), self.rng.uniform(0., 2000., 4))
+        turbineX = self.rng.uniform(0., 2000., self.nTurbines)
+        turbineY = self.rng.uniform(0., 2000., self.nTurbines)
+
+        J = dist_const_J(turbineX, turbineY, J)
+        np.testing.assert_allclose(J.toarray(), dist_const_J(turbineX, turbineY).toarray(), rtol=1e-14)
+        self.assertEqual(J.shape, (self.nTurbines*(self.nTurbines-1)/2, 2*self.nTurbines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""results with culled wakes (cullWakes) against the dense evaluation of all turbine pairs and all samples
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import Circle_components
+from Parameters import FLORISParameters
+from test_derivatives import WakeChain
+from test_kernel_backends import randomFarm
+
+
+class CullWakesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(11)
+
+    def test_turbine_pairs(self):
+
+        nTurbines = 30
+        for windDirection in (0., 35., 90.):
+            turbineX = self.rng.uniform(0., 4000., nTurbines)
+            turbineY = self.rng.uniform(0., 4000., nTurbines)
+            yaw = self.rng.uniform(-20., 20., nTurbines)
+
+            # the same turbine properties for both chains
+            seed = self.rng.randint(1000)
+            dense = WakeChain(np.random.RandomState(seed), nTurbines, FLORISParameters(), False, windDirection)
+            culled = WakeChain(np.random.RandomState(seed), nTurbines, FLORISParameters(), True, windDirection)
+
+            wt_power = dense.run(turbineX, turbineY, yaw)
+            np.testing.assert_allclose(culled.run(turbineX, turbineY, yaw), wt_power, rtol=1e-12)
+            np.testing.assert_allclose(culled.power.velocitiesTurbines, dense.power.velocitiesTurbines, rtol=1e-12)
+
+            # only part of the pairs interact
+            nPairs = np.shape(culled.wcent.wakePairs)[1]
+            self.assertTrue(0 < nPairs < nTurbines*(nTurbines-1)/2)
+
+    def farmSamples(self, nTurbines, nSamples):
+
+        parameters = FLORISParameters()
+        farm = randomFarm(self.rng, nTurbines, nSamples, parameters)
+        samples = (farm['velX'], farm['velY'], farm['velZ'])
+        turbines = (farm['turbineXw'], farm['turbineYw'], farm['hubHeight'], farm['rotorDiameter'])
+        state = (farm['axialInd'], farm['keArray'], farm['mU'], 8.)
+
+        return farm, samples, turbines, state, parameters
+
+    def test_samples(self):
+
+        farm, samples, turbines, state, parameters = self.farmSamples(15, 5000)
+        args = samples + turbines + (farm['yaw'], farm['Ct']) + state + (parameters, 5000)
+        expected = Circle_components.calcSampleVelocitiesChunked(*args)
+
+        for blockSize in (1, 16, 256):
+            ws_array = Circle_components.calcSampleVelocitiesCulled(*(samples + turbines + (farm['wakeAngleInit'],
+                                                                    farm['wakeDiameter0'], farm['zoneExpansion']) +
+                                                                    state + (parameters,)), blockSize=blockSize)
+            np.testing.assert_allclose(ws_array, expected, rtol=1e-12, err_msg='blockSize=%d' % blockSize)
+
+        # chunked, and on a pool of threads
+        for chunkSize, nThreads in ((700, 1), (700, 3)):
+            ws_array = Circle_components.calcSampleVelocitiesChunked(*(args[:-1] + (chunkSize, nThreads, True)))
+            np.testing.assert_allclose(ws_array, expected, rtol=1e-12,
+                                       err_msg='chunkSize=%d, nThreads=%d' % (chunkSize, nThreads))
+
+    def test_samples_empty(self):
+
+        farm, samples, turbines, state, parameters = self.farmSamples(5, 0)
+        ws_array = Circle_components.calcSampleVelocitiesCulled(*(samples + turbines + (farm['wakeAngleInit'],
+                                                                farm['wakeDiameter0'], farm['zoneExpansion']) + state +
+                                                                (parameters,)))
+        self.assertEqual(ws_array.shape, (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
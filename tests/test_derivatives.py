@@ -0,0 +1,375 @@
+"""analytic derivatives of the wake chain components of Circle_components against central finite differences
+
+Each of floris_wcent_wdiam, floris_overlap and floris_power is checked by itself, and the chain
+floris_windframe -> floris_wcent_wdiam -> floris_overlap -> floris_power is checked with respect to turbineX, turbineY
+and yaw, with all turbine pairs and with the interacting pairs only (cullWakes). The products of apply_derivT are
+checked against those of apply_deriv with <J v, w> == <v, J^T w>. The AEP gradient of floris_assembly_opt_AEP needs
+OpenMDAO to run the assembly.
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Circle_components import floris_windframe, floris_wcent_wdiam, floris_overlap, floris_power, calcWakeParameters
+from Parameters import FLORISParameters
+
+
+def testParameters(corrected):
+    """default wake parameters, or parameters that enable the yaw corrections and the ke corrections"""
+
+    parameters = FLORISParameters()
+    parameters.keCorrArray = 0.1
+    if corrected:
+        parameters.keCorrCT = 0.2
+        parameters.CTcorrected = False
+        parameters.CPcorrected = False
+        parameters.adjustInitialWakeDiamToYaw = True
+        parameters.axialIndProvided = True
+
+    return parameters
+
+
+def connected(value, target):
+    """value of an output for the input target it is connected to, reshaped where the sizes match"""
+
+    value = np.array(value, dtype=float)
+    if value.size == np.size(target):
+        return value.reshape(np.shape(target))
+    return value
+
+
+class WakeChain(object):
+    """floris_windframe, floris_wcent_wdiam, floris_overlap and floris_power of a single direction, connected as in
+    floris_assembly_opt_AEP with the rotor coefficients held fixed"""
+
+    def __init__(self, rng, nTurbines, parameters, cullWakes=False, windDirection=20.):
+
+        self.cullWakes = cullWakes
+        self.windframe = floris_windframe(nTurbines=nTurbines)
+        self.wcent = floris_wcent_wdiam(nTurbines=nTurbines, cullWakes=cullWakes)
+        self.overlap = floris_overlap(nTurbines=nTurbines, cullWakes=cullWakes)
+        self.power = floris_power(nTurbines=nTurbines, cullWakes=cullWakes)
+
+        rotorDiameter = rng.uniform(120., 130., nTurbines)
+        Ct = rng.uniform(0.6, 0.85, nTurbines)
+        for comp in (self.windframe, self.wcent, self.power):
+            comp.parameters = parameters
+        self.windframe.wind_direction = windDirection
+        self.windframe.wind_speed = 8.
+        for comp in (self.wcent, self.overlap, self.power):
+            comp.rotorDiameter = rotorDiameter
+        self.overlap.rotorArea = np.pi*rotorDiameter**2/4.
+        self.wcent.hubHeight = np.ones(nTurbines)*90.
+        self.wcent.Ct = Ct
+        self.power.Ct = Ct
+        self.power.Cp = rng.uniform(0.4, 0.48, nTurbines)
+        self.power.axialInduction = rng.uniform(0.2, 0.3, nTurbines)
+        self.power.generator_efficiency = np.ones(nTurbines)*0.944
+        self.power.wind_speed = 8.
+        self.power.air_density = 1.1716
+
+    def run(self, turbineX, turbineY, yaw):
+        """turbine powers of the layout"""
+
+        windframe, wcent, overlap, power = self.windframe, self.wcent, self.overlap, self.power
+
+        windframe.turbineX = np.array(turbineX)
+        windframe.turbineY = np.array(turbineY)
+        windframe.execute()
+
+        wcent.turbineXw = np.array(windframe.turbineXw)
+        wcent.turbineYw = np.array(windframe.turbineYw)
+        wcent.yaw = np.array(yaw)
+        wcent.execute()
+
+        overlap.turbineXw = np.array(windframe.turbineXw)
+        overlap.turbineYw = np.array(windframe.turbineYw)
+        overlap.wakeCentersYT = connected(wcent.wakeCentersYT, overlap.wakeCentersYT)
+        overlap.wakeDiametersT = connected(wcent.wakeDiametersT, overlap.wakeDiametersT)
+        if self.cullWakes:
+            overlap.wakePairs = np.array(wcent.wakePairs)
+        overlap.execute()
+
+        power.turbineXw = np.array(windframe.turbineXw)
+        power.yaw = np.array(yaw)
+        power.wakeOverlapTRel = connected(overlap.wakeOverlapTRel, power.wakeOverlapTRel)
+        if self.cullWakes:
+            power.wakePairs = np.array(wcent.wakePairs)
+        power.execute()
+
+        return np.array(power.wt_power)
+
+    def apply_deriv(self, dX, dY, dyaw):
+        """perturbation of the turbine powers for perturbations of turbineX, turbineY and yaw"""
+
+        windframe, wcent, overlap, power = self.windframe, self.wcent, self.overlap, self.power
+
+        frame = zeroResult(windframe, ('turbineXw', 'turbineYw'))
+        windframe.apply_deriv({'turbineX': dX, 'turbineY': dY}, frame)
+
+        wakes = zeroResult(wcent, ('wakeCentersYT', 'wakeDiametersT'))
+        wcent.apply_deriv({'turbineXw': frame['turbineXw'], 'turbineYw': frame['turbineYw'], 'yaw': dyaw}, wakes)
+
+        overlaps = zeroResult(overlap, ('wakeOverlapTRel',))
+        overlap.apply_deriv({'turbineYw': frame['turbineYw'],
+                             'wakeCentersYT': connected(wakes['wakeCentersYT'], overlap.wakeCentersYT),
+                             'wakeDiametersT': connected(wakes['wakeDiametersT'], overlap.wakeDiametersT)}, overlaps)
+
+        powers = zeroResult(power, ('wt_power',))
+        power.apply_deriv({'turbineXw': frame['turbineXw'], 'yaw': dyaw,
+                           'wakeOverlapTRel': connected(overlaps['wakeOverlapTRel'], power.wakeOverlapTRel)}, powers)
+
+        return powers['wt_power']
+
+    def apply_derivT(self, sPower):
+        """seeds of turbineX, turbineY and yaw for the seeds sPower of the turbine powers"""
+
+        windframe, wcent, overlap, power = self.windframe, self.wcent, self.overlap, self.power
+
+        powers = zeroResult(power, ('turbineXw', 'yaw', 'wakeOverlapTRel'))
+        power.apply_derivT({'wt_power': sPower}, powers)
+
+        overlaps = zeroResult(overlap, ('turbineYw', 'wakeCentersYT', 'wakeDiametersT'))
+        overlap.apply_derivT({'wakeOverlapTRel': connected(powers['wakeOverlapTRel'], overlap.wakeOverlapTRel)},
+                             overlaps)
+
+        wakes = zeroResult(wcent, ('turbineXw', 'turbineYw', 'yaw'))
+        wcent.apply_derivT({'wakeCentersYT': connected(overlaps['wakeCentersYT'], wcent.wakeCentersYT),
+                            'wakeDiametersT': connected(overlaps['wakeDiametersT'], wcent.wakeDiametersT)}, wakes)
+
+        frame = zeroResult(windframe, ('turbineX', 'turbineY'))
+        windframe.apply_derivT({'turbineXw': powers['turbineXw']+wakes['turbineXw'],
+                                'turbineYw': overlaps['turbineYw']+wakes['turbineYw']}, frame)
+
+        return frame['turbineX'], frame['turbineY'], powers['yaw']+wakes['yaw']
+
+
+def zeroResult(comp, names):
+    """result dictionary for apply_deriv or apply_derivT of comp, shaped as its current values"""
+
+    return dict((name, np.zeros(np.shape(getattr(comp, name)))) for name in names)
+
+
+def randomLayout(rng, nTurbines, windDirection=20.):
+    """staggered rows along the wind direction, so that most wakes partially overlap the downstream rotors"""
+
+    turbineXw = np.cumsum(rng.uniform(500., 800., nTurbines))
+    turbineYw = rng.uniform(-80., 80., nTurbines)
+    angle = windDirection*np.pi/180.
+    turbineX = np.cos(angle)*turbineXw - np.sin(angle)*turbineYw
+    turbineY = np.sin(angle)*turbineXw + np.cos(angle)*turbineYw
+
+    return turbineX, turbineY, rng.uniform(-20., 20., nTurbines)
+
+
+class DerivativeTest(unittest.TestCase):
+
+    nTurbines = 6
+
+    def setUp(self):
+        self.rng = np.random.RandomState(7)
+
+    def chains(self):
+        """all combinations of pair layout and parameters, evaluated at a random layout"""
+
+        for cullWakes in (False, True):
+            for corrected in (False, True):
+                chain = WakeChain(self.rng, self.nTurbines, testParameters(corrected), cullWakes)
+                layout = randomLayout(self.rng, self.nTurbines)
+                chain.run(*layout)
+                msg = 'cullWakes=%s, corrected parameters=%s' % (cullWakes, corrected)
+
+                # the layout has to exercise the wake interactions
+                self.assertTrue(np.any(np.array(chain.overlap.wakeOverlapTRel) > 0), msg)
+                yield chain, layout, msg
+
+    def checkComponent(self, comp, msg):
+        """Jacobian of apply_deriv against central differences of execute, and apply_derivT against apply_deriv"""
+
+        inputs, outputs = comp.list_deriv_vars()
+        comp.execute()
+        base = dict((name, np.array(getattr(comp, name), dtype=float)) for name in inputs)
+
+        for name in inputs:
+            value = base[name]
+            step = 1e-6*np.maximum(np.abs(value), 1.)
+            for i in range(value.size):
+                derivFD = []
+                for sign in (1., -1.):
+                    perturbed = value.copy()
+                    perturbed.flat[i] += sign*step.flat[i]
+                    setattr(comp, name, perturbed)
+                    comp.execute()
+                    derivFD.append(dict((out, np.ravel(getattr(comp, out)).astype(float)) for out in outputs))
+                setattr(comp, name, value.copy())
+                comp.execute()
+
+                seed = np.zeros(value.shape)
+                seed.flat[i] = 1.
+                result = zeroResult(comp, outputs)
+                comp.apply_deriv({name: seed}, result)
+
+                for out in outputs:
+                    expected = (derivFD[0][out]-derivFD[1][out])/(2*step.flat[i])
+                    np.testing.assert_allclose(np.ravel(result[out]), expected, rtol=1e-5,
+                                               atol=1e-6*max(np.max(np.abs(expected)), 1e-3),
+                                               err_msg='d%s/d%s[%d], %s' % (out, name, i, msg))
+
+        self.assertAdjoint(comp, inputs, outputs, msg)
+
+    def assertAdjoint(self, comp, inputs, outputs, msg):
+        """<J v, w> == <v, J^T w> for random v and w"""
+
+        for repeat in range(0, 3):
+            v = dict((name, self.rng.normal(size=np.shape(getattr(comp, name)))) for name in inputs)
+            w = dict((name, self.rng.normal(size=np.shape(getattr(comp, name)))) for name in outputs)
+
+            Jv = zeroResult(comp, outputs)
+            comp.apply_deriv(v, Jv)
+            JTw = zeroResult(comp, inputs)
+            comp.apply_derivT(w, JTw)
+
+            forward = sum(np.sum(Jv[name]*w[name]) for name in outputs)
+            adjoint = sum(np.sum(v[name]*JTw[name]) for name in inputs)
+            self.assertAlmostEqual(forward/adjoint, 1., places=10, msg=msg)
+
+    def test_wcent_wdiam(self):
+
+        for chain, layout, msg in self.chains():
+            self.checkComponent(chain.wcent, msg)
+
+    def test_wake_parameters_yaw(self):
+        # with CTcorrected False the thrust coefficient is corrected with the yaw in radians, once
+        yaw = self.rng.uniform(-0.4, 0.4, self.nTurbines)
+        Ct = self.rng.uniform(0.6, 0.85, self.nTurbines)
+        rotorDiameter = self.rng.uniform(120., 130., self.nTurbines)
+        corrected = testParameters(True)
+        provided = testParameters(True)
+        provided.CTcorrected = True
+
+        for actual, expected in zip(calcWakeParameters(yaw, Ct, rotorDiameter, corrected),
+                                    calcWakeParameters(yaw, Ct*np.cos(yaw)**2, rotorDiameter, provided)):
+            np.testing.assert_allclose(actual, expected, rtol=1e-14)
+
+    def test_overlap(self):
+
+        for chain, layout, msg in self.chains():
+            self.checkComponent(chain.overlap, msg)
+
+    def test_power(self):
+
+        for chain, layout, msg in self.chains():
+            self.checkComponent(chain.power, msg)
+
+    def test_chain(self):
+
+        nTurbines = self.nTurbines
+        for chain, layout, msg in self.chains():
+            names = ('turbineX', 'turbineY', 'yaw')
+            steps = (1e-4, 1e-4, 1e-5)
+
+            for k, (name, step) in enumerate(zip(names, steps)):
+                for i in range(0, nTurbines):
+                    perturbations = [np.zeros(nTurbines) for value in layout]
+                    perturbations[k][i] = step
+                    powerPlus = chain.run(*[value+dvalue for value, dvalue in zip(layout, perturbations)])
+                    powerMinus = chain.run(*[value-dvalue for value, dvalue in zip(layout, perturbations)])
+                    expected = (powerPlus-powerMinus)/(2*step)
+
+                    chain.run(*layout)
+                    perturbations[k][i] = 1.
+                    np.testing.assert_allclose(chain.apply_deriv(*perturbations), expected, rtol=1e-5,
+                                               atol=1e-6*max(np.max(np.abs(expected)), 1e-3),
+                                               err_msg='dwt_power/d%s[%d], %s' % (name, i, msg))
+
+            for repeat in range(0, 3):
+                v = [self.rng.normal(size=nTurbines) for name in names]
+                w = self.rng.normal(size=nTurbines)
+                forward = np.sum(chain.apply_deriv(*v)*w)
+                adjoint = sum(np.sum(vi*JTwi) for vi, JTwi in zip(v, chain.apply_derivT(w)))
+                self.assertAlmostEqual(forward/adjoint, 1., places=10, msg=msg)
+
+
+class AEPDerivativeTest(unittest.TestCase):
+    """total derivative of the AEP of floris_assembly_opt_AEP, with constant rotor coefficients so that the fixed
+    point of the rotor and wake models does not move with the layout"""
+
+    def assembly(self, solver, cullWakes):
+
+        from Circle_assembly import floris_assembly_opt_AEP
+
+        nTurbines = 4
+        asm = floris_assembly_opt_AEP(nTurbines=nTurbines, nDirections=2, datasize=3, solver=solver,
+                                      cullWakes=cullWakes)
+        if not hasattr(asm, 'driver'):
+            self.skipTest('the assembly needs OpenMDAO')
+
+        asm.parameters = testParameters(False)
+        asm.curve_wind_speed = np.array([0., 12., 25.])
+        asm.curve_CP = np.ones(3)*0.45
+        asm.curve_CT = np.ones(3)*0.75
+        asm.rotorDiameter = np.ones(nTurbines)*126.4
+        asm.hubHeight = np.ones(nTurbines)*90.
+        asm.axialInduction = np.ones(nTurbines)/3.
+        asm.generator_efficiency = np.ones(nTurbines)*0.944
+        asm.air_density = 1.1716
+        asm.windrose_directions = np.array([0., 10.])
+        asm.windrose_frequencies = np.array([0.6, 0.4])
+        asm.windrose_speeds = np.array([8., 9.])
+        asm.turbineX = np.array([0., 630., 1260., 1900.])
+        asm.turbineY = np.array([0., 70., -40., 150.])
+        asm.yaw = np.array([10., -5., 15., 0.])
+
+        return asm
+
+    def checkAEP(self, solver, cullWakes=False, rtol=1e-4):
+
+        asm = self.assembly(solver, cullWakes)
+        names = ('turbineX', 'turbineY', 'yaw')
+        steps = (1e-2, 1e-2, 1e-3)
+
+        expected = []
+        for name, step in zip(names, steps):
+            value = np.array(getattr(asm, name))
+            for i in range(0, value.size):
+                AEP = []
+                for sign in (1., -1.):
+                    perturbed = value.copy()
+                    perturbed[i] += sign*step
+                    setattr(asm, name, perturbed)
+                    asm.run()
+                    AEP.append(asm.AEP)
+                expected.append((AEP[0]-AEP[1])/(2*step))
+            setattr(asm, name, value)
+        expected = np.array(expected)
+
+        asm.run()
+        for mode in ('forward', 'adjoint'):
+            J = asm.driver.calc_gradient(inputs=list(names), outputs=['floris_AEP.AEP'], mode=mode)
+            np.testing.assert_allclose(np.ravel(J), expected, rtol=rtol, atol=1e-6*np.max(np.abs(expected)),
+                                       err_msg='solver=%s, cullWakes=%s, mode=%s' % (solver, cullWakes, mode))
+
+    def test_fixed_point(self):
+        self.checkAEP('fixed_point')
+
+    def test_fixed_point_cull_wakes(self):
+        self.checkAEP('fixed_point', cullWakes=True)
+
+    def test_batch(self):
+        # floris_directions differentiates the sweep by finite differences itself
+        self.checkAEP('batch', rtol=1e-3)
+
+    def test_sweep(self):
+        # floris_sweep differentiates the sweep by finite differences itself
+        self.checkAEP('sweep', rtol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
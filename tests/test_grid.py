@@ -0,0 +1,87 @@
+"""wind speed on a structured grid (floris_grid) against the same points sampled as a flat sample set, placed with
+calcGridPositions and sampled with floris_windframe and floris_samples
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Circle_components import floris_windframe, floris_samples, floris_grid, calcGridPositions, calcWindFrame
+from Parameters import FLORISParameters
+from test_kernel_backends import randomFarm
+
+
+class GridTest(unittest.TestCase):
+
+    nTurbines = 8
+    windDirection = 30.
+
+    def setUp(self):
+        self.rng = np.random.RandomState(29)
+        self.parameters = FLORISParameters()
+        self.farm = randomFarm(self.rng, self.nTurbines, 0, self.parameters)
+
+    def turbineState(self, comp):
+
+        farm = self.farm
+        comp.parameters = self.parameters
+        comp.wind_speed = 8.
+        for name in ('turbineXw', 'turbineYw', 'hubHeight', 'rotorDiameter', 'Ct', 'axialInd', 'keArray'):
+            setattr(comp, name, farm[name])
+        comp.yaw = farm['yaw']*180./np.pi
+
+        return comp
+
+    def sampleGrid(self, gridShape, gridOrigin, gridSpacing, gridHeight):
+        """wind speed at the grid points sampled as flat sample set, reshaped to the grid"""
+
+        gridX, gridY, gridZ = calcGridPositions(gridOrigin, gridSpacing, gridShape, gridHeight, self.windDirection)
+        nSamples = gridX.size
+
+        windframe = floris_windframe(nTurbines=self.nTurbines, nSamples=nSamples)
+        windframe.turbineX = np.zeros(self.nTurbines)
+        windframe.turbineY = np.zeros(self.nTurbines)
+        windframe.wind_direction = self.windDirection
+        windframe.ws_positionX = gridX.ravel()
+        windframe.ws_positionY = gridY.ravel()
+        windframe.ws_positionZ = gridZ.ravel()
+        windframe.execute()
+
+        samples = self.turbineState(floris_samples(nTurbines=self.nTurbines, nSamples=nSamples))
+        samples.wsw_position = windframe.wsw_position
+        samples.execute()
+
+        return np.reshape(samples.ws_array, gridShape)
+
+    def test_grid(self):
+
+        # first grid point upstream and to the right of all turbines
+        gridOrigin = np.ravel(calcWindFrame(-300., -750., -self.windDirection))
+        gridSpacing = np.array([95., 45., 25.])
+        gridHeight = 40.
+
+        for gridShape in ((36, 33), (36, 33, 4)):
+            grid = self.turbineState(floris_grid(nTurbines=self.nTurbines, gridShape=gridShape))
+            grid.gridOrigin = gridOrigin
+            grid.gridSpacing = gridSpacing
+            grid.gridHeight = gridHeight
+            grid.wind_direction = self.windDirection
+            grid.execute()
+
+            expected = self.sampleGrid(gridShape, gridOrigin, gridSpacing, gridHeight)
+            self.assertEqual(grid.ws_grid.shape, gridShape)
+            np.testing.assert_allclose(grid.ws_grid, expected, rtol=1e-10, err_msg='gridShape %s' % (gridShape,))
+
+            # the grid covers the wakes
+            self.assertTrue(np.min(expected) < 0.9*8.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+"""equivalence of the numpy and numba kernel backends of Circle_components
+
+Without numba the uncompiled loops of numba_kernels are compared instead, so the kernels are checked either way.
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Circle_components
+import numba_kernels
+from Parameters import FLORISParameters
+
+
+def randomFarm(rng, nTurbines, nSamples, parameters, sampleDtype=float):
+    """random layout in the wind direction reference frame with its wake parameters and sample positions"""
+
+    farm = dict()
+    farm['turbineXw'] = rng.uniform(0., 3000., nTurbines)
+    farm['turbineYw'] = rng.uniform(-600., 600., nTurbines)
+    farm['hubHeight'] = rng.uniform(80., 100., nTurbines)
+    farm['rotorDiameter'] = rng.uniform(100., 130., nTurbines)
+    farm['yaw'] = rng.uniform(-25., 25., nTurbines)*np.pi/180.
+    farm['Ct'] = rng.uniform(0.5, 0.9, nTurbines)
+    farm['axialInd'] = rng.uniform(0.15, 0.3, nTurbines)
+    farm['keArray'] = rng.uniform(0.04, 0.08, nTurbines)
+    farm['mU'] = parameters.MU/np.cos(parameters.aU*np.pi/180+parameters.bU*farm['yaw'][:, np.newaxis])
+    farm['wakeAngleInit'], farm['wakeDiameter0'], farm['zoneExpansion'] = \
+        Circle_components.calcWakeParameters(farm['yaw'], farm['Ct'], farm['rotorDiameter'], parameters)
+
+    farm['velX'] = rng.uniform(-500., 3500., nSamples).astype(sampleDtype)
+    farm['velY'] = rng.uniform(-800., 800., nSamples).astype(sampleDtype)
+    farm['velZ'] = rng.uniform(10., 170., nSamples).astype(sampleDtype)
+
+    return farm
+
+
+class KernelBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Circle_components.kernelBackend
+        Circle_components.setKernelBackend('numpy')
+        self.rng = np.random.RandomState(42)
+        self.parameters = FLORISParameters()
+
+    def tearDown(self):
+        Circle_components.kernelBackend = self.backend
+
+    def compiled(self, name, *args):
+        """result of kernel name with setKernelBackend('numba'), or of the uncompiled loops without numba"""
+
+        if not numba_kernels.available:
+            return getattr(numba_kernels, name)(*args)
+
+        Circle_components.setKernelBackend('numba')
+        try:
+            return getattr(Circle_components, name)(*args)
+        finally:
+            Circle_components.setKernelBackend('numpy')
+
+    def sampleVelocities(self, farm, Vinf=8.):
+        """numpy backend wind speed at the samples of farm, and the wake geometry at the samples"""
+
+        wakeCentersY, wakeCentersZ, wakeDiameters = \
+            Circle_components.calcWakeGeometrySamples(farm['velX'], farm['turbineXw'], farm['turbineYw'],
+                                                      farm['hubHeight'], farm['rotorDiameter'], farm['wakeAngleInit'],
+                                                      farm['wakeDiameter0'], farm['zoneExpansion'], self.parameters)
+        geometry = (farm['velX'], farm['velY'], farm['velZ'], farm['turbineXw'], wakeCentersY, wakeCentersZ,
+                    wakeDiameters, farm['rotorDiameter'], farm['axialInd'], farm['keArray'], farm['mU'], Vinf,
+                    self.parameters.shearCoefficientAlpha, self.parameters.shearZh)
+
+        return Circle_components.calcSampleVelocities(*geometry), geometry
+
+    def test_zone_overlap(self):
+
+        nPoints = 500
+        OVr = self.rng.uniform(40., 70., (nPoints, 1))
+        OVR = np.sort(self.rng.uniform(0., 200., (nPoints, 3)), axis=1)
+        OVdYd = self.rng.uniform(0., 300., (nPoints, 1))
+        # concentric, touching and fully covered rotors
+        OVdYd[:10] = 0.
+        OVdYd[10:20] = OVr[10:20]+OVR[10:20, 2:]
+        OVR[20:30] = OVr[20:30]+300.
+
+        expected = Circle_components.calcZoneOverlap(OVdYd, OVr, OVR)
+        np.testing.assert_allclose(self.compiled('calcZoneOverlap', OVdYd, OVr, OVR), expected,
+                                   rtol=1e-10, atol=1e-8)
+
+    def test_sample_velocities(self):
+
+        farm = randomFarm(self.rng, 12, 2000, self.parameters)
+        expected, geometry = self.sampleVelocities(farm)
+
+        np.testing.assert_allclose(self.compiled('calcSampleVelocities', *geometry), expected, rtol=1e-12)
+
+    def test_sample_velocities_float32(self):
+
+        farm = randomFarm(self.rng, 12, 2000, self.parameters, np.float32)
+        expected, geometry = self.sampleVelocities(farm)
+
+        ws_array = self.compiled('calcSampleVelocities', *geometry)
+        self.assertEqual(ws_array.dtype, np.float32)
+        np.testing.assert_allclose(ws_array, expected, rtol=1e-5)
+
+    def test_sample_velocities_empty(self):
+
+        farm = randomFarm(self.rng, 12, 0, self.parameters)
+        expected, geometry = self.sampleVelocities(farm)
+
+        self.assertEqual(expected.shape, (0,))
+        self.assertEqual(self.compiled('calcSampleVelocities', *geometry).shape, (0,))
+
+    def sampleVelocitiesWakes(self, farm, Vinf=8.):
+        """wind speed at the samples of farm from the compiled kernel that evaluates the wakes per sample"""
+
+        return numba_kernels.calcSampleVelocitiesWakes(farm['velX'], farm['velY'], farm['velZ'], farm['turbineXw'],
+                                                       farm['turbineYw'], farm['hubHeight'], farm['rotorDiameter'],
+                                                       farm['wakeAngleInit'], farm['wakeDiameter0'],
+                                                       farm['zoneExpansion'], farm['axialInd'], farm['keArray'],
+                                                       farm['mU'], Vinf, self.parameters)
+
+    def test_sample_velocities_wakes(self):
+
+        for useWakeAngle in (True, False):
+            self.parameters.useWakeAngle = useWakeAngle
+            farm = randomFarm(self.rng, 12, 2000, self.parameters)
+            expected = self.sampleVelocities(farm)[0]
+
+            np.testing.assert_allclose(self.sampleVelocitiesWakes(farm), expected, rtol=1e-12)
+
+    def test_sample_velocities_wakes_float32(self):
+
+        farm = randomFarm(self.rng, 12, 2000, self.parameters, np.float32)
+        ws_array = self.sampleVelocitiesWakes(farm)
+        self.assertEqual(ws_array.dtype, np.float32)
+
+        # the kernel evaluates the wakes of the single precision samples in double precision
+        for name in ('velX', 'velY', 'velZ'):
+            farm[name] = farm[name].astype(float)
+        expected = self.sampleVelocities(farm)[0]
+
+        np.testing.assert_allclose(ws_array, expected, rtol=1e-6)
+
+    def test_sample_velocities_wakes_empty(self):
+
+        farm = randomFarm(self.rng, 12, 0, self.parameters)
+
+        self.assertEqual(self.sampleVelocitiesWakes(farm).shape, (0,))
+
+    def turbineVelocities(self, farm, wakePairs, wakeOverlapTRel, Vinf=8.):
+
+        args = (farm['turbineXw'], wakePairs, wakeOverlapTRel, farm['rotorDiameter'], farm['axialInd'],
+                farm['keArray'], farm['mU'], Vinf)
+        expected = Circle_components.calcTurbineVelocities(*args)
+
+        np.testing.assert_allclose(self.compiled('calcTurbineVelocities', *args), expected, rtol=1e-12)
+
+    def test_turbine_velocities(self):
+
+        nTurbines = 20
+        farm = randomFarm(self.rng, nTurbines, 0, self.parameters)
+
+        # all pairs with the downstream turbine first
+        turbI, turb = np.nonzero(farm['turbineXw'][:, np.newaxis] > farm['turbineXw'])
+        wakeOverlapTRel = self.rng.uniform(0., 0.4, (turbI.size, 3))
+
+        self.turbineVelocities(farm, np.array([turbI, turb]), wakeOverlapTRel)
+
+    def test_turbine_velocities_culled_pairs(self):
+
+        nTurbines = 40
+        farm = randomFarm(self.rng, nTurbines, 0, self.parameters)
+
+        # interacting pairs and their overlap as in floris_wcent_wdiam and floris_overlap with cullWakes
+        wakePairs, wakeCentersYT, wakeDiametersT = \
+            Circle_components.calcWakePairs(farm['turbineXw'], farm['turbineYw'], farm['rotorDiameter'],
+                                            farm['wakeAngleInit'], farm['wakeDiameter0'], farm['zoneExpansion'],
+                                            self.parameters)
+        self.assertTrue(wakePairs.shape[1] > 0)
+
+        # zone overlaps of the pairs, as in calcOverlapAreasPairs
+        OVdYd = np.abs(wakeCentersYT-farm['turbineYw'][wakePairs[0]])[:, np.newaxis]
+        OVr = (farm['rotorDiameter']/2)[wakePairs[0]][:, np.newaxis]
+        OVR = wakeDiametersT/2
+        wakeOverlapT = Circle_components.calcZoneOverlap(OVdYd, OVr, OVR)
+        np.testing.assert_allclose(self.compiled('calcZoneOverlap', OVdYd, OVr, OVR), wakeOverlapT, rtol=1e-10,
+                                   atol=1e-8)
+
+        rotorArea = np.pi*farm['rotorDiameter']**2/4.
+        wakeOverlapTRel = wakeOverlapT/rotorArea[wakePairs[0]][:, np.newaxis]
+
+        self.turbineVelocities(farm, wakePairs, wakeOverlapTRel)
+
+    def test_turbine_velocities_no_pairs(self):
+
+        farm = randomFarm(self.rng, 5, 0, self.parameters)
+
+        self.turbineVelocities(farm, np.zeros((2, 0), dtype=int), np.zeros((0, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
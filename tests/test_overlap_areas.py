@@ -0,0 +1,126 @@
+"""vectorized overlap areas of Circle_components against the loop over turbines, turbines and zones they replace
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Circle_components import calcOverlapAreas, floris_overlap
+
+
+def calcOverlapAreasLoop(turbineX,turbineY,rotorDiameter,wakeDiameters,wakeCenters):
+    """former calcOverlapAreas, kept as reference"""
+
+    nTurbines = turbineY.size
+
+    wakeOverlap = np.zeros((nTurbines,nTurbines,3))
+
+    for turb in range(0,nTurbines):
+        for turbI in range(0,nTurbines):
+            if turbineX[turbI] > turbineX[turb]:
+                OVdYd = wakeCenters[turbI,turb]-turbineY[turbI]
+                OVr = rotorDiameter[turbI]/2
+                for zone in range(0,3):
+                    OVR = wakeDiameters[turbI,turb,zone]/2
+                    OVdYd = abs(OVdYd)
+                    if OVdYd != 0:
+                        OVL = (-np.power(OVr,2.0)+np.power(OVR,2.0)+np.power(OVdYd,2.0))/(2.0*OVdYd)
+                    else:
+                        OVL = 0
+
+                    OVz = np.power(OVR,2.0)-np.power(OVL,2.0)
+
+                    if OVz > 0:
+                        OVz = np.sqrt(OVz)
+                    else:
+                        OVz = 0
+
+                    if OVdYd < (OVr+OVR):
+                        if OVL < OVR and (OVdYd-OVL) < OVr:
+                            wakeOverlap[turbI,turb,zone] = np.power(OVR,2.0)*np.arccos(OVL/OVR) + np.power(OVr,2.0)*np.arccos((OVdYd-OVL)/OVr) - OVdYd*OVz
+                        elif OVR > OVr:
+                            wakeOverlap[turbI,turb,zone] = np.pi*np.power(OVr,2.0)
+                        else:
+                            wakeOverlap[turbI,turb,zone] = np.pi*np.power(OVR,2.0)
+                    else:
+                        wakeOverlap[turbI,turb,zone] = 0
+
+    for turb in range(0,nTurbines):
+        for turbI in range(0,nTurbines):
+            wakeOverlap[turbI,turb,2] = wakeOverlap[turbI,turb,2]-wakeOverlap[turbI,turb,1]
+            wakeOverlap[turbI,turb,1] = wakeOverlap[turbI,turb,1]-wakeOverlap[turbI,turb,0]
+
+    return wakeOverlap
+
+
+def randomWakes(rng, nTurbines):
+    """random layout with wake centers and sorted zone diameters at each rotor, including wakes centered on the rotor,
+    wakes touching the rotor and rotors fully inside a wake zone or fully covering it"""
+
+    turbineX = rng.uniform(0., 3000., nTurbines)
+    turbineY = rng.uniform(-300., 300., nTurbines)
+    rotorDiameter = rng.uniform(100., 130., nTurbines)
+    wakeCenters = turbineY[:, np.newaxis] + rng.uniform(-250., 250., (nTurbines, nTurbines))
+    wakeDiameters = np.sort(rng.uniform(20., 400., (nTurbines, nTurbines, 3)), axis=2)
+
+    # coincident centers
+    wakeCenters[0] = turbineY[0]
+    # rotor and outer zone touch
+    wakeCenters[1] = turbineY[1] + (rotorDiameter[1]+wakeDiameters[1, :, 2])/2
+    # rotor inside all zones, and all zones inside the rotor
+    wakeCenters[2] = turbineY[2] + 5.
+    wakeDiameters[2] = np.array([300., 400., 500.])
+    wakeDiameters[3] = np.array([10., 20., 40.])
+    wakeCenters[3] = turbineY[3] - 10.
+    # turbines in line, neither is downstream of the other
+    turbineX[4] = turbineX[5]
+
+    return turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters
+
+
+class OverlapAreasTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(3)
+
+    def test_overlap_areas(self):
+
+        for repeat in range(0, 20):
+            turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters = randomWakes(self.rng, 12)
+
+            expected = calcOverlapAreasLoop(turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters)
+            np.testing.assert_allclose(calcOverlapAreas(turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters),
+                                       expected, rtol=1e-12, atol=1e-8)
+
+    def test_floris_overlap(self):
+
+        nTurbines = 12
+        turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters = randomWakes(self.rng, nTurbines)
+
+        comp = floris_overlap(nTurbines=nTurbines)
+        comp.turbineXw = turbineX
+        comp.turbineYw = turbineY
+        comp.rotorDiameter = rotorDiameter
+        # vector format, ordered by TURBI, then ZONEI, then TURB
+        comp.wakeCentersYT = wakeCenters.flatten()
+        comp.wakeDiametersT = wakeDiameters.transpose(0, 2, 1).flatten()
+        comp.execute()
+
+        wakeOverlapTRel = calcOverlapAreasLoop(turbineX, turbineY, rotorDiameter, wakeDiameters, wakeCenters)
+        wakeOverlapTRel /= (np.pi*rotorDiameter**2/4.)[:, np.newaxis, np.newaxis]
+        expected = np.zeros(3*nTurbines**2)
+        for i in range(0, nTurbines):
+            for zone in range(0, 3):
+                expected[3*nTurbines*i+zone*nTurbines:3*nTurbines*i+(zone+1)*nTurbines] = wakeOverlapTRel[i, :, zone]
+
+        np.testing.assert_allclose(comp.wakeOverlapTRel, expected, rtol=1e-12, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""results of the process and thread pools of Circle_components against the serial evaluation
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import Circle_components
+from Parameters import FLORISParameters
+from test_derivatives import randomLayout, testParameters
+from test_kernel_backends import randomFarm
+from test_solvers import testCurve
+
+
+class ProcessPoolTest(unittest.TestCase):
+
+    nTurbines = 5
+    nDirections = 7
+
+    def setUp(self):
+        self.rng = np.random.RandomState(17)
+
+    def tearDown(self):
+        Circle_components.closeProcessPools()
+
+    def sweepArguments(self, Vinf):
+        """turbines of a wake interacting layout seen from several wind directions"""
+
+        turbineX, turbineY = randomLayout(self.rng, self.nTurbines, 10.)[:2]
+        turbineXw, turbineYw = Circle_components.calcWindFrame(turbineX, turbineY,
+                                                               np.linspace(0., 20., self.nDirections))
+        yaw = self.rng.uniform(-20., 20., (self.nDirections, self.nTurbines))
+        rotorDiameter = self.rng.uniform(120., 130., self.nTurbines)
+        axialInduction = self.rng.uniform(0.2, 0.3, self.nTurbines)
+
+        return (turbineXw, turbineYw, yaw, rotorDiameter, axialInduction, Vinf, 1.88) + testCurve() + \
+            (testParameters(True),)
+
+    def test_sweep_velocities(self):
+
+        for Vinf in (8., self.rng.uniform(6., 10., self.nDirections),
+                     self.rng.uniform(6., 10., (self.nDirections, 3))):
+            args = self.sweepArguments(Vinf)
+            expected = Circle_components.calcSweepVelocities(*args)
+
+            for nProcesses in (2, 3):
+                results = Circle_components.calcSweepVelocitiesParallel(*(args+(nProcesses,)))
+                for name, result, value in zip(('velocitiesTurbines', 'CP', 'CT', 'axialInd', 'keArray'), results,
+                                               expected):
+                    np.testing.assert_array_equal(result, value, err_msg='%s, nProcesses=%d, Vinf %s' %
+                                                                         (name, nProcesses, np.shape(Vinf)))
+
+    def test_close(self):
+
+        args = self.sweepArguments(8.)
+        expected = Circle_components.calcSweepVelocitiesParallel(*(args+(2,)))
+        self.assertTrue(2 in Circle_components.processPools)
+
+        Circle_components.closeProcessPools()
+        self.assertEqual(Circle_components.processPools, {})
+
+        # a new pool is created on the next use
+        np.testing.assert_array_equal(Circle_components.calcSweepVelocitiesParallel(*(args+(2,)))[0], expected[0])
+
+
+class ThreadPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(19)
+
+    def tearDown(self):
+        Circle_components.closeThreadPools()
+
+    def test_samples(self):
+
+        parameters = FLORISParameters()
+        for sampleDtype in (float, np.float32):
+            farm = randomFarm(self.rng, 12, 4000, parameters, sampleDtype)
+            args = (farm['velX'], farm['velY'], farm['velZ'], farm['turbineXw'], farm['turbineYw'], farm['hubHeight'],
+                    farm['rotorDiameter'], farm['yaw'], farm['Ct'], farm['axialInd'], farm['keArray'], farm['mU'], 8.,
+                    parameters, 300)
+
+            for cullSamples in (False, True):
+                expected = Circle_components.calcSampleVelocitiesChunked(*(args+(1, cullSamples)))
+                for nThreads in (2, 4):
+                    np.testing.assert_array_equal(
+                        Circle_components.calcSampleVelocitiesChunked(*(args+(nThreads, cullSamples))), expected,
+                        err_msg='nThreads=%d, cullSamples=%s, %s' % (nThreads, cullSamples, sampleDtype))
+        self.assertTrue(4 in Circle_components.threadPools)
+
+        Circle_components.closeThreadPools()
+        self.assertEqual(Circle_components.threadPools, {})
+
+    def test_assembly_sample_memory(self):
+
+        from Circle_assembly import floris_assembly_opt_AEP
+
+        # tiles for the threads unless the memory is given
+        for nThreads, sampleMemory, expected in ((1, None, 0), (4, None, Circle_components.threadSampleMemory),
+                                                 (4, 0, 0), (4, 2**20, 2**20)):
+            asm = floris_assembly_opt_AEP(nTurbines=3, nDirections=1, nSamples=10, nThreads=nThreads,
+                                          sampleMemory=sampleMemory)
+            self.assertEqual(asm.sampleMemory, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
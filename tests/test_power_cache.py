@@ -0,0 +1,122 @@
+"""cache of converged turbine states (PowerCache, calcStateKey) used by the sweep solvers of Circle_components
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import Circle_components
+from Circle_components import PowerCache, calcStateKey, calcSweepPower
+from test_derivatives import randomLayout, testParameters
+from test_solvers import testCurve
+
+
+class PowerCacheTest(unittest.TestCase):
+
+    nTurbines = 5
+
+    def setUp(self):
+        self.rng = np.random.RandomState(23)
+
+        # count the sweeps that are actually solved
+        self.nSolved = 0
+        solve = Circle_components.calcSweepVelocitiesParallel
+
+        def countingSolve(*args):
+            self.nSolved += 1
+            return solve(*args)
+
+        Circle_components.calcSweepVelocitiesParallel = countingSolve
+        self.addCleanup(setattr, Circle_components, 'calcSweepVelocitiesParallel', solve)
+
+    def sweepArguments(self):
+
+        turbineXw, turbineYw, yaw = randomLayout(self.rng, self.nTurbines, 0.)
+        return [turbineXw, turbineYw, yaw, self.rng.uniform(120., 130., self.nTurbines),
+                self.rng.uniform(0.2, 0.3, self.nTurbines), np.ones(self.nTurbines)*0.944, 8., 1.1716, 1.88] + \
+            list(testCurve()) + [testParameters(True)]
+
+    def test_least_recently_used(self):
+
+        cache = PowerCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # b is the least recently used state
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        # storing a held key again makes it the most recently used
+        cache.put('a', 4)
+        cache.put('d', 5)
+        self.assertEqual(list(cache.states.keys()), ['a', 'd'])
+        self.assertEqual(cache.get('a'), 4)
+
+        disabled = PowerCache(0)
+        disabled.put('a', 1)
+        self.assertEqual(disabled.get('a'), None)
+
+    def test_state_key(self):
+
+        args = self.sweepArguments()
+        parameters = args[-1]
+        key = calcStateKey(parameters, *args[:-1])
+        self.assertEqual(calcStateKey(testParameters(True), *[np.copy(value) for value in args[:-1]]), key)
+
+        # any parameter or input changes the key
+        changed = testParameters(True)
+        changed.ke += 1e-9
+        self.assertNotEqual(calcStateKey(changed, *args[:-1]), key)
+        for k in range(0, len(args)-1):
+            changedArgs = list(args[:-1])
+            changedArgs[k] = np.asarray(changedArgs[k])+1e-9
+            self.assertNotEqual(calcStateKey(parameters, *changedArgs), key, msg='argument %d' % k)
+
+        # and so do the shape and type of an input
+        self.assertNotEqual(calcStateKey(parameters, np.zeros(4)), calcStateKey(parameters, np.zeros((2, 2))))
+        self.assertNotEqual(calcStateKey(parameters, np.zeros(4)), calcStateKey(parameters, np.zeros(4, dtype=int)))
+
+    def test_sweep_power(self):
+
+        args = self.sweepArguments()
+        cache = PowerCache(2)
+        expected = calcSweepPower(*args)
+        self.assertEqual(self.nSolved, 1)
+
+        # the first evaluation is solved, the second one is a hit
+        for nSolved in (2, 2):
+            result = calcSweepPower(*args, cache=cache)
+            self.assertEqual(self.nSolved, nSolved)
+            for value, expectedValue in zip(result, expected):
+                np.testing.assert_array_equal(value, expectedValue)
+
+            # the held state is not changed through the returned arrays
+            result[3][:] = 0.
+
+        # a changed parameter is solved again
+        changed = testParameters(True)
+        changed.keCorrArray = 0.2
+        result = calcSweepPower(*(args[:-1]+[changed]), cache=cache)
+        self.assertEqual(self.nSolved, 3)
+        self.assertFalse(np.allclose(result[3], expected[3]))
+        np.testing.assert_array_equal(result[3], calcSweepPower(*(args[:-1]+[changed]))[3])
+        self.assertEqual(self.nSolved, 4)
+
+        # a third state drops the least recently used one, the unchanged parameters
+        calcSweepPower(*(args[:6]+[9.]+args[7:]), cache=cache)
+        calcSweepPower(*args, cache=cache)
+        self.assertEqual(self.nSolved, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+"""floris_sweep against the fixed point iteration of the rotor model and the wake chain it replaces
+
+The fixed point iteration of floris_assembly_opt_AEP (rotor_CPCT -> floris_windframe -> floris_wcent_wdiam ->
+floris_overlap -> floris_power, until wind_speed_hub equals velocitiesTurbines) is repeated here without OpenMDAO.
+The finite difference derivatives of floris_sweep are checked against central differences of execute, and the
+wind directions solved at once by floris_directions against floris_sweep runs of each direction. The AEP of
+floris_windrose is checked against the sum of frequency x power x hours over floris_sweep runs of each bin, and the
+yaw cases of calcYawSweepPower against floris_sweep runs of each case.
+
+run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Circle_components import floris_windframe, floris_sweep, floris_directions, floris_windrose, calcYawSweepPower
+from rotor_components import CPCTCurve
+from test_derivatives import WakeChain, randomLayout, testParameters, zeroResult
+
+
+def testCurve():
+    """CP/CT curve with coefficients that change over the wind speeds in the wakes"""
+
+    wind_speed = np.linspace(0., 25., 26)
+    CP = 0.3 + 0.15*np.exp(-((wind_speed-8.)/5.)**2)
+    CT = np.clip(0.85 - 0.03*np.maximum(wind_speed-5., 0.), 0.2, 0.85)
+
+    return wind_speed, CP, CT
+
+
+def solveFixedPoint(chain, curve, layout, pP, maxIterations=100):
+    """velocitiesTurbines and wt_power of the wake chain at the fixed point with the rotor model"""
+
+    turbineX, turbineY, yaw = layout
+    velocitiesTurbines = np.ones(turbineX.size)*chain.power.wind_speed
+    for iteration in range(0, maxIterations):
+        CP, CT = curve.evaluate(velocitiesTurbines, yaw, pP)[:2]
+        chain.wcent.Ct = CT
+        chain.power.Ct = CT
+        chain.power.Cp = CP
+        wt_power = chain.run(turbineX, turbineY, yaw)
+
+        previous, velocitiesTurbines = velocitiesTurbines, np.array(chain.power.velocitiesTurbines)
+        if np.max(np.abs(velocitiesTurbines-previous)) < 1e-13:
+            return velocitiesTurbines, wt_power
+
+    raise RuntimeError('fixed point iteration did not converge')
+
+
+def sweepComponent(chain, curve, yaw, pP, **kwargs):
+    """floris_sweep with the turbines, flow and layout of the wake chain"""
+
+    nTurbines = np.size(yaw)
+    comp = floris_sweep(nTurbines=nTurbines, datasize=curve.wind_speed.size, **kwargs)
+    comp.parameters = chain.power.parameters
+    comp.windSpeedToCPCT.wind_speed = curve.wind_speed
+    comp.windSpeedToCPCT.CP = curve.CP
+    comp.windSpeedToCPCT.CT = curve.CT
+    comp.turbineXw = np.array(chain.windframe.turbineXw)
+    comp.turbineYw = np.array(chain.windframe.turbineYw)
+    comp.yaw = np.array(yaw)
+    comp.rotorDiameter = np.array(chain.power.rotorDiameter)
+    comp.axialInduction = np.array(chain.power.axialInduction)
+    comp.generator_efficiency = np.array(chain.power.generator_efficiency)
+    comp.wind_speed = chain.power.wind_speed
+    comp.air_density = chain.power.air_density
+    comp.pP = pP
+
+    return comp
+
+
+class SweepSolverTest(unittest.TestCase):
+
+    nTurbines = 6
+    pP = 1.88
+
+    def setUp(self):
+        self.rng = np.random.RandomState(5)
+        self.curve = CPCTCurve(*testCurve())
+
+    def cases(self):
+        """wake chains at the fixed point of a wake interacting layout, for all pair layouts and parameters"""
+
+        for cullWakes in (False, True):
+            for corrected in (False, True):
+                chain = WakeChain(self.rng, self.nTurbines, testParameters(corrected), cullWakes)
+                layout = randomLayout(self.rng, self.nTurbines)
+                velocitiesTurbines, wt_power = solveFixedPoint(chain, self.curve, layout, self.pP)
+                msg = 'cullWakes=%s, corrected parameters=%s' % (cullWakes, corrected)
+
+                # the layout has to slow down the downstream turbines
+                self.assertTrue(np.min(velocitiesTurbines) < 0.95*chain.power.wind_speed, msg)
+                yield chain, layout, velocitiesTurbines, wt_power, msg
+
+    def test_fixed_point(self):
+
+        for chain, layout, velocitiesTurbines, wt_power, msg in self.cases():
+            comp = sweepComponent(chain, self.curve, layout[2], self.pP)
+            comp.execute()
+
+            np.testing.assert_allclose(comp.velocitiesTurbines, velocitiesTurbines, rtol=1e-10, err_msg=msg)
+            np.testing.assert_allclose(comp.wt_power, wt_power, rtol=1e-10, err_msg=msg)
+            np.testing.assert_allclose(comp.power, np.sum(wt_power), rtol=1e-10, err_msg=msg)
+
+    def test_derivatives(self):
+
+        for chain, layout, velocitiesTurbines, wt_power, msg in self.cases():
+            comp = sweepComponent(chain, self.curve, layout[2], self.pP, fdForm='central')
+            inputs, outputs = comp.list_deriv_vars()
+            comp.execute()
+
+            for name in inputs:
+                value = np.array(getattr(comp, name), dtype=float)
+                step = 1e-4
+                for i in range(0, value.size):
+                    powers = []
+                    for sign in (1., -1.):
+                        perturbed = value.copy()
+                        perturbed[i] += sign*step
+                        setattr(comp, name, perturbed)
+                        comp.execute()
+                        powers.append(np.array(comp.wt_power))
+                    setattr(comp, name, value)
+                    comp.execute()
+                    expected = (powers[0]-powers[1])/(2*step)
+
+                    seed = np.zeros(value.size)
+                    seed[i] = 1.
+                    result = zeroResult(comp, outputs)
+                    comp.apply_deriv({name: seed}, result)
+                    np.testing.assert_allclose(result['wt_power'], expected, rtol=1e-4,
+                                               atol=1e-5*max(np.max(np.abs(expected)), 1e-3),
+                                               err_msg='dwt_power/d%s[%d], %s' % (name, i, msg))
+                    np.testing.assert_allclose(result['power'], np.sum(expected), rtol=1e-4,
+                                               atol=1e-5*max(np.max(np.abs(expected)), 1e-3),
+                                               err_msg='dpower/d%s[%d], %s' % (name, i, msg))
+
+            for repeat in range(0, 3):
+                v = dict((name, self.rng.normal(size=self.nTurbines)) for name in inputs)
+                w = {'wt_power': self.rng.normal(size=self.nTurbines), 'power': self.rng.normal()}
+
+                Jv = zeroResult(comp, outputs)
+                comp.apply_deriv(v, Jv)
+                JTw = zeroResult(comp, inputs)
+                comp.apply_derivT(w, JTw)
+
+                forward = sum(np.sum(Jv[name]*w[name]) for name in outputs)
+                adjoint = sum(np.sum(v[name]*JTw[name]) for name in inputs)
+                self.assertAlmostEqual(forward/adjoint, 1., places=10, msg=msg)
+
+
+def directionsComponent(comp, nTurbines, nDirections, curve, rng):
+    """comp with random turbines and flow, and a random wake interacting layout shared by all directions"""
+
+    comp.parameters = testParameters(True)
+    comp.windSpeedToCPCT.wind_speed = curve.wind_speed
+    comp.windSpeedToCPCT.CP = curve.CP
+    comp.windSpeedToCPCT.CT = curve.CT
+    comp.turbineX, comp.turbineY = randomLayout(rng, nTurbines, 10.)[:2]
+    comp.wind_directions = np.linspace(4., 16., nDirections)
+    comp.yaw = rng.uniform(-20., 20., (nDirections, nTurbines))
+    comp.rotorDiameter = rng.uniform(120., 130., nTurbines)
+    comp.axialInduction = rng.uniform(0.2, 0.3, nTurbines)
+    comp.generator_efficiency = np.ones(nTurbines)*0.944
+    comp.air_density = 1.1716
+    comp.pP = 1.88
+
+    return comp
+
+
+def sweepDirection(comp, direction, wind_speed):
+    """floris_windframe and floris_sweep of one direction of comp, executed"""
+
+    nTurbines = comp.turbineX.size
+    windframe = floris_windframe(nTurbines=nTurbines)
+    windframe.turbineX = np.array(comp.turbineX)
+    windframe.turbineY = np.array(comp.turbineY)
+    windframe.wind_direction = comp.wind_directions[direction]
+    windframe.execute()
+
+    sweep = floris_sweep(nTurbines=nTurbines, datasize=comp.windSpeedToCPCT.wind_speed.size)
+    for name in ('parameters', 'rotorDiameter', 'axialInduction', 'generator_efficiency', 'air_density', 'pP'):
+        setattr(sweep, name, getattr(comp, name))
+    for name in ('wind_speed', 'CP', 'CT'):
+        setattr(sweep.windSpeedToCPCT, name, getattr(comp.windSpeedToCPCT, name))
+    sweep.turbineXw = np.array(windframe.turbineXw)
+    sweep.turbineYw = np.array(windframe.turbineYw)
+    sweep.yaw = np.array(comp.yaw[direction])
+    sweep.wind_speed = wind_speed
+    sweep.execute()
+
+    return sweep
+
+
+class DirectionsSolverTest(unittest.TestCase):
+
+    nTurbines = 5
+    nDirections = 4
+
+    def setUp(self):
+        self.rng = np.random.RandomState(9)
+        self.curve = CPCTCurve(*testCurve())
+
+    def test_directions(self):
+
+        comp = directionsComponent(floris_directions(nTurbines=self.nTurbines, nDirections=self.nDirections,
+                                                     datasize=self.curve.wind_speed.size),
+                                   self.nTurbines, self.nDirections, self.curve, self.rng)
+        comp.wind_speeds = self.rng.uniform(6., 10., self.nDirections)
+        comp.execute()
+
+        for direction in range(0, self.nDirections):
+            sweep = sweepDirection(comp, direction, comp.wind_speeds[direction])
+            msg = 'direction %d' % direction
+            for name in ('velocitiesTurbines', 'CP', 'CT', 'wt_power', 'axialInd', 'keArray'):
+                np.testing.assert_allclose(getattr(comp, name)[direction], getattr(sweep, name), rtol=1e-12,
+                                           err_msg='%s, %s' % (name, msg))
+            np.testing.assert_allclose(comp.power[direction], sweep.power, rtol=1e-12, err_msg=msg)
+
+        # the layout has wakes in each direction
+        self.assertTrue(np.all(np.min(comp.velocitiesTurbines, axis=1) < 0.95*comp.wind_speeds))
+
+    def test_windrose(self):
+
+        nSpeeds = 3
+        comp = directionsComponent(floris_windrose(nTurbines=self.nTurbines, nDirections=self.nDirections,
+                                                   nSpeeds=nSpeeds, datasize=self.curve.wind_speed.size),
+                                   self.nTurbines, self.nDirections, self.curve, self.rng)
+        comp.wind_speeds = np.array([5., 8., 11.])
+        frequencies = self.rng.uniform(0., 1., (self.nDirections, nSpeeds))
+        # a direction that never occurs
+        frequencies[1] = 0.
+        comp.windrose_frequencies = frequencies/np.sum(frequencies)
+        comp.execute()
+
+        AEP = 0.
+        for direction in range(0, self.nDirections):
+            for speed in range(0, nSpeeds):
+                sweep = sweepDirection(comp, direction, comp.wind_speeds[speed])
+                msg = 'direction %d, speed %d' % (direction, speed)
+                np.testing.assert_allclose(comp.wt_power[direction, speed], sweep.wt_power, rtol=1e-12, err_msg=msg)
+                np.testing.assert_allclose(comp.power[direction, speed], sweep.power, rtol=1e-12, err_msg=msg)
+                AEP += comp.windrose_frequencies[direction, speed]*sweep.power*8760.
+
+        np.testing.assert_allclose(comp.AEP, AEP, rtol=1e-12)
+        np.testing.assert_allclose(np.sum(comp.frequencies_directions*comp.power_directions)*8760., AEP, rtol=1e-12)
+        self.assertEqual(comp.power_directions[1], 0.)
+
+    def test_yaw_sweep(self):
+
+        # the directions of comp all have the same wind direction and only hold the yaw cases
+        comp = directionsComponent(floris_directions(nTurbines=self.nTurbines, nDirections=self.nDirections,
+                                                     datasize=self.curve.wind_speed.size),
+                                   self.nTurbines, self.nDirections, self.curve, self.rng)
+        comp.wind_directions = np.ones(self.nDirections)*10.
+
+        velocitiesTurbines, wt_power = calcYawSweepPower(comp.turbineX, comp.turbineY, 10., comp.yaw,
+                                                         comp.rotorDiameter, comp.axialInduction,
+                                                         comp.generator_efficiency, 8., comp.air_density, comp.pP,
+                                                         self.curve.wind_speed, self.curve.CP, self.curve.CT,
+                                                         comp.parameters)
+
+        for case in range(0, self.nDirections):
+            sweep = sweepDirection(comp, case, 8.)
+            np.testing.assert_allclose(velocitiesTurbines[case], sweep.velocitiesTurbines, rtol=1e-12,
+                                       err_msg='case %d' % case)
+            np.testing.assert_allclose(wt_power[case], sweep.wt_power, rtol=1e-12, err_msg='case %d' % case)
+
+
+if __name__ == '__main__':
+    unittest.main()